@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class AppAutobusesConfig(AppConfig):
     name = 'app_autobuses'
+
+    def ready(self):
+        from . import signals  # noqa: F401
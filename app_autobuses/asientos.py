@@ -0,0 +1,399 @@
+"""Asignación de asientos sin condiciones de carrera.
+
+Cada ``Viaje`` guarda en ``ocupacion`` un mapa de bits con un bit por
+asiento (el asiento ``n`` es el bit ``n - 1``). Toda reserva, liberación o
+cambio de asiento se hace dentro de una transacción que bloquea la fila del
+viaje, actualiza el mapa y ``asientos_disponibles`` y guarda el boleto. La
+restricción única ``(viaje, asiento_numero)`` sobre boletos no cancelados
+es la última defensa a nivel de base de datos.
+"""
+import base64
+import hashlib
+import json
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from . import busqueda, dashboard, estadisticas, resumenes, versiones
+from .codigos import generar_codigos
+from .enrutador import en_primaria
+from .models import Boleto, Pasajero, Viaje
+
+ASIENTOS_POR_FILA = 4
+MAPA_CACHE_TIMEOUT = 300
+
+
+class AsientoNoDisponible(Exception):
+    """El asiento pedido está ocupado o no existe en el autobús."""
+
+    def __init__(self, mensaje, asientos=()):
+        super().__init__(mensaje)
+        self.asientos = list(asientos)
+
+
+class MapaAsientos:
+    """Mapa de bits de ocupación de un viaje, dimensionado por la capacidad del autobús."""
+
+    def __init__(self, capacidad, datos=b''):
+        self.capacidad = capacidad
+        tamano = (capacidad + 7) // 8
+        self.bits = bytearray(bytes(datos or b'')[:tamano].ljust(tamano, b'\0'))
+
+    @classmethod
+    def de_viaje(cls, viaje):
+        return cls(viaje.autobus.capacidad, viaje.ocupacion)
+
+    def a_bytes(self):
+        return bytes(self.bits)
+
+    def valido(self, asiento):
+        return 1 <= asiento <= self.capacidad
+
+    def ocupado(self, asiento):
+        i = asiento - 1
+        return bool(self.bits[i >> 3] & (1 << (i & 7)))
+
+    def ocupar(self, asiento):
+        i = asiento - 1
+        self.bits[i >> 3] |= 1 << (i & 7)
+
+    def liberar(self, asiento):
+        i = asiento - 1
+        self.bits[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+
+    def ocupados(self):
+        return [n for n in range(1, self.capacidad + 1) if self.ocupado(n)]
+
+    def total_ocupados(self):
+        return sum(bin(byte).count('1') for byte in self.bits)
+
+    def bloque_libre(self, cantidad):
+        """Primer bloque de ``cantidad`` asientos contiguos libres, o ``None``.
+
+        Entre los bloques posibles se prefiere el que ocupa menos filas del
+        autobús; en empate, el de número más bajo. Recorre el mapa dos veces,
+        así que el costo es O(capacidad) sin importar cuántos boletos haya.
+        """
+        if cantidad < 1 or cantidad > self.capacidad:
+            return None
+        # libres_desde[i] = asientos libres consecutivos a partir del asiento i + 1
+        libres_desde = [0] * (self.capacidad + 1)
+        for i in range(self.capacidad - 1, -1, -1):
+            libres_desde[i] = 0 if self.ocupado(i + 1) else libres_desde[i + 1] + 1
+
+        mejor = None
+        for i in range(self.capacidad - cantidad + 1):
+            if libres_desde[i] < cantidad:
+                continue
+            filas = (i + cantidad - 1) // ASIENTOS_POR_FILA - i // ASIENTOS_POR_FILA
+            if mejor is None or filas < mejor[0]:
+                mejor = (filas, i)
+                if filas == 0:
+                    break
+        if mejor is None:
+            return None
+        return list(range(mejor[1] + 1, mejor[1] + 1 + cantidad))
+
+
+def _bloquear_viajes(ids):
+    """Bloquea las filas de los viajes en orden de id para evitar interbloqueos."""
+    viajes = (Viaje.objects.select_for_update(of=('self',))
+              .select_related('autobus')
+              .filter(pk__in=sorted(set(ids)))
+              .order_by('pk'))
+    return {viaje.pk: viaje for viaje in viajes}
+
+
+def _guardar_ocupacion(viaje, mapa):
+    viaje.ocupacion = mapa.a_bytes()
+    viaje.save(update_fields=['ocupacion', 'asientos_disponibles', 'fecha_actualizacion'])
+
+
+def ultimo_ocupado(ocupacion):
+    """Número del asiento ocupado más alto del mapa, o 0 si no hay ninguno."""
+    datos = bytes(ocupacion or b'')
+    ocupados = MapaAsientos(len(datos) * 8, datos).ocupados()
+    return ocupados[-1] if ocupados else 0
+
+
+def ajustar_a_autobus(viaje, bloqueado=False):
+    """Ajusta el mapa a la capacidad del autobús del viaje y recalcula ``asientos_disponibles``.
+
+    Se llama dentro de la transacción que guarda el viaje. Si el viaje ya
+    existe, el mapa se relee bloqueando la fila para no pisar una venta
+    hecha mientras se editaba (salvo que ya venga ``bloqueado``); si esa
+    venta dejó un asiento fuera del autobús nuevo se lanza
+    ``AsientoNoDisponible``.
+    """
+    ocupacion = viaje.ocupacion
+    if viaje.pk and not bloqueado:
+        ocupacion = Viaje.objects.select_for_update().values_list('ocupacion', flat=True).get(pk=viaje.pk)
+    capacidad = viaje.autobus.capacidad
+    ultimo = ultimo_ocupado(ocupacion)
+    if ultimo > capacidad:
+        raise AsientoNoDisponible(
+            f'El autobús tiene {capacidad} asientos y el viaje ya tiene vendido el asiento {ultimo}', [ultimo])
+    mapa = MapaAsientos(capacidad, ocupacion)
+    viaje.ocupacion = mapa.a_bytes()
+    viaje.asientos_disponibles = mapa.capacidad - mapa.total_ocupados()
+
+
+def ajustar_viajes_de_autobus(autobus):
+    """Ajusta los mapas de todos los viajes de ``autobus`` a su capacidad actual.
+
+    Se llama al cambiar la capacidad, dentro de la transacción que guarda el
+    autobús. Los viajes se bloquean con una consulta y se guardan con un
+    solo ``bulk_update``; si alguno tiene vendido un asiento que ya no cabe
+    se lanza ``AsientoNoDisponible`` y no se cambia ninguno.
+    """
+    with transaction.atomic():
+        viajes = list(_bloquear_viajes(Viaje.objects.filter(autobus_id=autobus.pk).values_list('pk', flat=True))
+                      .values())
+        ahora = timezone.now()
+        for viaje in viajes:
+            viaje.autobus = autobus
+            ajustar_a_autobus(viaje, bloqueado=True)
+            viaje.fecha_actualizacion = ahora
+        Viaje.objects.bulk_update(viajes, ['ocupacion', 'asientos_disponibles', 'fecha_actualizacion'],
+                                  batch_size=500)
+
+        # bulk_update no envía señales: se aplican a mano los mismos efectos
+        for viaje in viajes:
+            invalidar_mapa(viaje.pk)
+        for ruta_id in {viaje.ruta_id for viaje in viajes}:
+            busqueda.invalidar_ruta(ruta_id)
+        if viajes:
+            versiones.modelo_cambiado(Viaje)
+    return len(viajes)
+
+
+def mejores_asientos(viaje, cantidad):
+    """Sugiere ``cantidad`` asientos contiguos libres sin consultar los boletos."""
+    asientos = MapaAsientos.de_viaje(viaje).bloque_libre(cantidad)
+    if asientos is None:
+        raise AsientoNoDisponible(f'No hay {cantidad} asientos contiguos libres en este viaje')
+    return asientos
+
+
+def guardar_boleto(boleto):
+    """Crea o actualiza un boleto manteniendo el mapa de asientos del viaje.
+
+    Los boletos cancelados no ocupan asiento, así que cancelar un boleto lo
+    libera y reactivarlo vuelve a reservarlo.
+    """
+    with transaction.atomic():
+        anterior = None
+        if boleto.pk:
+            anterior = (Boleto.objects.select_for_update()
+                        .filter(pk=boleto.pk)
+                        .values('viaje_id', 'asiento_numero', 'estado')
+                        .first())
+
+        liberar = None
+        if anterior and anterior['estado'] != 'cancelado':
+            liberar = (anterior['viaje_id'], anterior['asiento_numero'])
+        ocupar = None
+        if boleto.estado != 'cancelado':
+            ocupar = (boleto.viaje_id, int(boleto.asiento_numero))
+
+        if liberar != ocupar:
+            viajes = _bloquear_viajes(v for v, _ in filter(None, (liberar, ocupar)))
+            mapas = {pk: MapaAsientos.de_viaje(viaje) for pk, viaje in viajes.items()}
+
+            if liberar and liberar[0] in viajes:
+                viaje_id, asiento = liberar
+                if mapas[viaje_id].valido(asiento) and mapas[viaje_id].ocupado(asiento):
+                    mapas[viaje_id].liberar(asiento)
+                    viajes[viaje_id].asientos_disponibles += 1
+
+            if ocupar:
+                viaje_id, asiento = ocupar
+                mapa = mapas[viaje_id]
+                if not mapa.valido(asiento):
+                    raise AsientoNoDisponible(
+                        f'El autobús solo tiene capacidad para {mapa.capacidad} asientos', [asiento])
+                if mapa.ocupado(asiento):
+                    raise AsientoNoDisponible(f'El asiento {asiento} ya está ocupado', [asiento])
+                mapa.ocupar(asiento)
+                viajes[viaje_id].asientos_disponibles -= 1
+
+            for pk, viaje in viajes.items():
+                _guardar_ocupacion(viaje, mapas[pk])
+
+        boleto.save()
+    return boleto
+
+
+def liberar_asiento(boleto):
+    """Libera el asiento de un boleto eliminado (se llama desde ``post_delete``)."""
+    if boleto.estado == 'cancelado':
+        return
+    with transaction.atomic():
+        viaje = _bloquear_viajes([boleto.viaje_id]).get(boleto.viaje_id)
+        if viaje is None:
+            return
+        mapa = MapaAsientos.de_viaje(viaje)
+        if mapa.valido(boleto.asiento_numero) and mapa.ocupado(boleto.asiento_numero):
+            mapa.liberar(boleto.asiento_numero)
+            viaje.asientos_disponibles += 1
+            _guardar_ocupacion(viaje, mapa)
+
+
+# ========== VENTA MÚLTIPLE ==========
+def _limpiar_entradas(entradas):
+    """Convierte las entradas a ``(pasajero_id, asiento o None, precio)``."""
+    if not entradas:
+        raise ValidationError('No se indicó ningún boleto.')
+    limpias = []
+    for i, entrada in enumerate(entradas, start=1):
+        try:
+            pasajero = int(entrada['pasajero'])
+            asiento = entrada.get('asiento')
+            asiento = int(asiento) if asiento not in (None, '') else None
+            precio = Decimal(str(entrada['precio']))
+        except (KeyError, TypeError, ValueError, InvalidOperation):
+            raise ValidationError(f'La entrada {i} debe tener pasajero, asiento y precio válidos.')
+        if precio < 0:
+            raise ValidationError(f'La entrada {i} tiene un precio negativo.')
+        limpias.append((pasajero, asiento, precio))
+    return limpias
+
+
+def vender_boletos(viaje_id, entradas, estado='pagado'):
+    """Vende varios boletos de un mismo viaje en una sola transacción.
+
+    ``entradas`` es una lista de diccionarios con ``pasajero``, ``asiento``
+    y ``precio``; si una entrada no trae asiento se le asigna uno del mejor
+    bloque contiguo libre. Todos los asientos se validan contra el mapa del
+    viaje (una consulta), los códigos se generan antes de insertar y los
+    boletos se crean con un solo ``bulk_create``. Si algún asiento choca no
+    se vende ninguno y ``AsientoNoDisponible.asientos`` lista los conflictos.
+    """
+    if estado not in dict(Boleto.ESTADOS) or estado == 'cancelado':
+        raise ValidationError(f'Estado no válido para una venta: {estado}')
+    entradas = _limpiar_entradas(entradas)
+
+    pasajeros = {pasajero for pasajero, _, _ in entradas}
+    existentes = set(Pasajero.objects.filter(pk__in=pasajeros).values_list('pk', flat=True))
+    faltantes = sorted(pasajeros - existentes)
+    if faltantes:
+        raise ValidationError(f'No existen los pasajeros: {", ".join(map(str, faltantes))}')
+
+    with transaction.atomic():
+        viaje = _bloquear_viajes([viaje_id]).get(viaje_id)
+        if viaje is None:
+            raise Viaje.DoesNotExist(f'El viaje {viaje_id} no existe')
+        mapa = MapaAsientos.de_viaje(viaje)
+
+        pedidos = Counter(asiento for _, asiento, _ in entradas if asiento is not None)
+        conflictos = sorted(
+            asiento for asiento, veces in pedidos.items()
+            if veces > 1 or not mapa.valido(asiento) or mapa.ocupado(asiento)
+        )
+        if conflictos:
+            raise AsientoNoDisponible(
+                f'Asientos no disponibles: {", ".join(map(str, conflictos))}', conflictos)
+
+        # Asientos automáticos para las entradas que no eligieron uno
+        for asiento in pedidos:
+            mapa.ocupar(asiento)
+        sin_asiento = sum(1 for _, asiento, _ in entradas if asiento is None)
+        automaticos = []
+        if sin_asiento:
+            automaticos = mapa.bloque_libre(sin_asiento)
+            if automaticos is None:
+                raise AsientoNoDisponible(f'No hay {sin_asiento} asientos contiguos libres en este viaje')
+            for asiento in automaticos:
+                mapa.ocupar(asiento)
+        automaticos = iter(automaticos)
+
+        codigos = generar_codigos(len(entradas))
+
+        boletos = [
+            Boleto(viaje_id=viaje.pk, pasajero_id=pasajero,
+                   asiento_numero=asiento if asiento is not None else next(automaticos),
+                   precio=precio, estado=estado, codigo_boleto=codigo)
+            for (pasajero, asiento, precio), codigo in zip(entradas, codigos)
+        ]
+        Boleto.objects.bulk_create(boletos)
+
+        viaje.asientos_disponibles -= len(boletos)
+        _guardar_ocupacion(viaje, mapa)
+
+        # bulk_create no envía señales: se aplican a mano los mismos efectos
+        estadisticas.registrar_creados(boletos)
+        resumenes.registrar_boletos_creados(viaje, boletos)
+        dashboard.modelo_cambiado(Boleto, creado=True)
+        versiones.modelo_cambiado(Boleto)
+    return boletos
+
+
+# ========== MAPA DE ASIENTOS (caché) ==========
+def _clave_mapa(viaje_id):
+    return f'mapa_asientos:{viaje_id}'
+
+
+def _consulta_mapa(viaje_id):
+    viaje = Viaje.objects.select_related('autobus').only(
+        'asientos_disponibles', 'ocupacion', 'autobus', 'autobus__capacidad').filter(pk=viaje_id)
+    por_estado = Boleto.objects.filter(viaje_id=viaje_id).order_by().values('estado').annotate(n=Count('id'))
+    return viaje, por_estado
+
+
+def _armar_mapa(viaje, filas_por_estado):
+    por_estado = {estado: 0 for estado, _ in Boleto.ESTADOS}
+    for fila in filas_por_estado:
+        por_estado[fila['estado']] = fila['n']
+    mapa = MapaAsientos.de_viaje(viaje)
+
+    datos = {
+        'viaje': viaje.pk,
+        'capacidad': mapa.capacidad,
+        'asientos_disponibles': viaje.asientos_disponibles,
+        'ocupados': mapa.ocupados(),
+        'mapa': base64.b64encode(mapa.a_bytes()).decode(),
+        'por_estado': por_estado,
+    }
+    etag = hashlib.md5(json.dumps(datos, sort_keys=True).encode()).hexdigest()
+    return datos, etag
+
+
+def obtener_mapa(viaje_id):
+    """Devuelve ``(datos, etag)`` del mapa de asientos de un viaje.
+
+    El resultado se guarda en caché hasta que cambie algún boleto del viaje,
+    así que las pantallas de venta pueden consultarlo a menudo sin tocar la
+    base de datos. Lanza ``Viaje.DoesNotExist`` si el viaje no existe.
+    """
+    guardado = cache.get(_clave_mapa(viaje_id))
+    if guardado is not None:
+        return guardado
+
+    # Lo que entra en la caché se lee de la principal, no de una réplica atrasada
+    with en_primaria():
+        viajes, por_estado = _consulta_mapa(viaje_id)
+        resultado = _armar_mapa(viajes.get(), list(por_estado))
+    cache.set(_clave_mapa(viaje_id), resultado, MAPA_CACHE_TIMEOUT)
+    return resultado
+
+
+async def aobtener_mapa(viaje_id):
+    """Versión async de ``obtener_mapa`` para las vistas ASGI."""
+    guardado = await cache.aget(_clave_mapa(viaje_id))
+    if guardado is not None:
+        return guardado
+
+    with en_primaria():
+        viajes, por_estado = _consulta_mapa(viaje_id)
+        resultado = _armar_mapa(await viajes.aget(), [fila async for fila in por_estado])
+    await cache.aset(_clave_mapa(viaje_id), resultado, MAPA_CACHE_TIMEOUT)
+    return resultado
+
+
+def invalidar_mapa(viaje_id):
+    transaction.on_commit(lambda: cache.delete(_clave_mapa(viaje_id)))
@@ -0,0 +1,104 @@
+"""Medición de vistas con el cliente de pruebas de Django.
+
+``medir`` repite una petición GET y devuelve percentiles de latencia, número
+de consultas SQL y memoria pico (con ``tracemalloc``, en una pasada aparte
+para que el rastreo no infle los tiempos). ``comparar`` contrasta un
+resultado con una línea base guardada en JSON y lista las regresiones.
+"""
+import statistics
+import time
+import tracemalloc
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+# Crecimiento de memoria que se tolera siempre, sin importar el umbral
+MEMORIA_MINIMA_KB = 64
+
+
+def _consumir(respuesta):
+    """Lee todo el cuerpo, también de las respuestas en streaming."""
+    if respuesta.streaming:
+        for _ in respuesta.streaming_content:
+            pass
+    else:
+        respuesta.content
+    respuesta.close()
+
+
+def percentiles(valores):
+    ordenados = sorted(valores)
+    if len(ordenados) == 1:
+        p50 = p95 = p99 = ordenados[0]
+    else:
+        cortes = statistics.quantiles(ordenados, n=100, method='inclusive')
+        p50, p95, p99 = cortes[49], cortes[94], cortes[98]
+    return {
+        'p50_ms': round(p50, 3),
+        'p95_ms': round(p95, 3),
+        'p99_ms': round(p99, 3),
+        'media_ms': round(statistics.fmean(ordenados), 3),
+    }
+
+
+def medir(url, repeticiones=20, calentamiento=2, cliente=None):
+    """Mide ``url`` y devuelve un diccionario con estado, latencias, consultas y memoria."""
+    cliente = cliente or Client()
+    for _ in range(calentamiento):
+        _consumir(cliente.get(url))
+
+    latencias = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        respuesta = cliente.get(url)
+        _consumir(respuesta)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+
+    with CaptureQueriesContext(connection) as consultas:
+        _consumir(cliente.get(url))
+    # captured_queries se lee del registro de la conexión, que la siguiente petición vacía
+    total_consultas = len(consultas.captured_queries)
+
+    ya_rastreaba = tracemalloc.is_tracing()
+    if not ya_rastreaba:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    _consumir(cliente.get(url))
+    memoria_pico = tracemalloc.get_traced_memory()[1]
+    if not ya_rastreaba:
+        tracemalloc.stop()
+
+    return {
+        'url': url,
+        'estado': respuesta.status_code,
+        'repeticiones': repeticiones,
+        **percentiles(latencias),
+        'consultas': total_consultas,
+        'memoria_pico_kb': round(memoria_pico / 1024, 1),
+    }
+
+
+def comparar(base, actual, umbral=0.25, minimo_ms=2.0, consultas_extra=0):
+    """Lista las vistas de ``actual`` que empeoraron respecto de ``base``.
+
+    Una vista regresa si su p95 crece más de ``umbral`` (fracción) y más de
+    ``minimo_ms``, para no reaccionar al ruido en vistas muy rápidas; si su
+    memoria pico crece más de ``umbral`` y más de ``MEMORIA_MINIMA_KB``; o si
+    hace más de ``consultas_extra`` consultas adicionales.
+    """
+    regresiones = []
+    for nombre, medida in actual.items():
+        anterior = base.get(nombre)
+        if anterior is None:
+            continue
+        if (medida['p95_ms'] > anterior['p95_ms'] * (1 + umbral)
+                and medida['p95_ms'] - anterior['p95_ms'] > minimo_ms):
+            regresiones.append(f'{nombre}: p95 {anterior["p95_ms"]} ms -> {medida["p95_ms"]} ms')
+        if medida['consultas'] > anterior['consultas'] + consultas_extra:
+            regresiones.append(f'{nombre}: {anterior["consultas"]} -> {medida["consultas"]} consultas')
+        if (medida['memoria_pico_kb'] > anterior['memoria_pico_kb'] * (1 + umbral)
+                and medida['memoria_pico_kb'] - anterior['memoria_pico_kb'] > MEMORIA_MINIMA_KB):
+            regresiones.append(
+                f'{nombre}: memoria pico {anterior["memoria_pico_kb"]} KB -> {medida["memoria_pico_kb"]} KB')
+    return regresiones
@@ -0,0 +1,114 @@
+"""Búsqueda de viajes por origen, destino y día, solo con asientos libres.
+
+El origen y el destino se comparan normalizados (``normalizar_lugar``)
+contra ``Ruta.origen_normalizado``/``destino_normalizado``, que tienen
+índice; con las rutas encontradas, los viajes del día salen del índice
+parcial ``viaje_ruta_salida_idx`` (ruta, fecha de salida, sin cancelados),
+así que el costo depende de los viajes de ese día y no del total.
+
+La lista del día se guarda en caché por (origen, destino, día). La clave
+incluye una versión por ruta que cambia cada vez que se guarda o borra una
+ruta o uno de sus viajes; como vender o cancelar un boleto guarda el viaje
+(asientos disponibles y ocupación), los boletos también la invalidan.
+"""
+import hashlib
+import time as reloj
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .enrutador import en_primaria
+from .models import Ruta, Viaje, normalizar_lugar
+
+PREFIJO = 'busqueda_viajes'
+RESULTADOS_POR_PAGINA = 20
+
+
+def _timeout():
+    return getattr(settings, 'BUSQUEDA_CACHE_TIMEOUT', 600)
+
+
+# ========== VERSIONES POR RUTA ==========
+def _clave_version(ruta_id):
+    return f'{PREFIJO}:ruta:{ruta_id}'
+
+
+def _versiones(ruta_ids):
+    claves = {ruta_id: _clave_version(ruta_id) for ruta_id in sorted(ruta_ids)}
+    guardadas = cache.get_many(claves.values())
+    versiones = []
+    for ruta_id, clave in claves.items():
+        version = guardadas.get(clave)
+        if version is None:
+            # Sin timeout: si la versión se perdiera, las entradas viejas quedarían válidas
+            cache.add(clave, reloj.time_ns(), None)
+            version = cache.get(clave)
+        versiones.append(f'{ruta_id}.{version}')
+    return versiones
+
+
+def invalidar_ruta(ruta_id):
+    """Descarta las búsquedas en caché que incluyen la ruta, al confirmar la transacción."""
+    if ruta_id is None:
+        return
+    transaction.on_commit(lambda: cache.set(_clave_version(ruta_id), reloj.time_ns(), None))
+
+
+# ========== BÚSQUEDA ==========
+def rutas_entre(origen, destino):
+    return list(Ruta.objects.filter(
+        origen_normalizado=normalizar_lugar(origen),
+        destino_normalizado=normalizar_lugar(destino),
+        activa=True,
+    ).values_list('pk', flat=True))
+
+
+def _limites_del_dia(dia):
+    inicio = timezone.make_aware(datetime.combine(dia, time.min))
+    fin = timezone.make_aware(datetime.combine(dia + timedelta(days=1), time.min))
+    return inicio, fin
+
+
+def _viajes_del_dia(ruta_ids, dia):
+    inicio, fin = _limites_del_dia(dia)
+    return list(
+        Viaje.objects.filter(ruta_id__in=ruta_ids, fecha_salida__gte=inicio, fecha_salida__lt=fin,
+                             asientos_disponibles__gt=0)
+        .exclude(estado='cancelado')
+        .order_by('fecha_salida', 'id')
+        .values('id', 'fecha_salida', 'fecha_llegada_estimada', 'asientos_disponibles',
+                'ruta__origen', 'ruta__destino', 'ruta__precio_base')
+    )
+
+
+def viajes_disponibles(origen, destino, dia):
+    """Viajes del día entre ``origen`` y ``destino`` con asientos libres, por hora de salida."""
+    ruta_ids = rutas_entre(origen, destino)
+    if not ruta_ids:
+        return []
+    texto = '|'.join([normalizar_lugar(origen), normalizar_lugar(destino), dia.isoformat(), *_versiones(ruta_ids)])
+    clave = f'{PREFIJO}:{hashlib.md5(texto.encode()).hexdigest()}'
+    viajes = cache.get(clave)
+    if viajes is None:
+        # Lo que entra en la caché se lee de la principal, no de una réplica atrasada
+        with en_primaria():
+            viajes = _viajes_del_dia(ruta_ids, dia)
+        cache.set(clave, viajes, _timeout())
+    # La caché guarda el día completo; los viajes que ya salieron se quitan al leer
+    ahora = timezone.now()
+    return [viaje for viaje in viajes if viaje['fecha_salida'] > ahora]
+
+
+def buscar_viajes(origen, destino, dia, pagina=1, tamano=RESULTADOS_POR_PAGINA):
+    """Una página de ``viajes_disponibles``: ``{'viajes', 'pagina', 'mas', 'total'}``."""
+    viajes = viajes_disponibles(origen, destino, dia)
+    inicio = (pagina - 1) * tamano
+    return {
+        'viajes': viajes[inicio:inicio + tamano],
+        'pagina': pagina,
+        'mas': len(viajes) > inicio + tamano,
+        'total': len(viajes),
+    }
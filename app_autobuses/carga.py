@@ -0,0 +1,263 @@
+"""Datos sintéticos en volumen para pruebas de carga (``manage.py seed_load``).
+
+Todo se inserta con ``bulk_create`` en lotes. Los boletos se generan por
+viaje, con asientos distintos y sin pasar la capacidad del autobús, y en la
+misma transacción se escribe el mapa de ocupación del viaje, se ajustan las
+estadísticas por estado y se toman los códigos de ``codigos.py``. Así el
+resultado es el mismo que si los boletos se hubieran vendido uno por uno.
+"""
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import dashboard, estadisticas, resumenes, versiones
+from .asientos import MapaAsientos
+from .codigos import generar_codigos
+from .models import Autobus, Boleto, Empleado, EstadisticaBoleto, Pasajero, Ruta, Viaje
+
+VOLUMENES = {
+    'autobuses': 500,
+    'rutas': 5000,
+    'empleados': 2000,
+    'pasajeros': 100000,
+    'viajes': 1000000,
+    'boletos': 10000000,
+}
+LOTE = 5000
+# Viajes por transacción: sus boletos se insertan juntos
+VIAJES_POR_TRANSACCION = 2000
+DIAS_ATRAS = 365
+DIAS_ADELANTE = 90
+
+CIUDADES = [
+    'Tijuana', 'Ensenada', 'Mexicali', 'Tecate', 'Rosarito', 'San Felipe', 'Hermosillo',
+    'Guaymas', 'Obregón', 'Navojoa', 'Los Mochis', 'Culiacán', 'Mazatlán', 'Tepic',
+    'Guadalajara', 'Colima', 'Morelia', 'León', 'Querétaro', 'Aguascalientes',
+    'Zacatecas', 'Durango', 'Chihuahua', 'Juárez', 'Torreón', 'Saltillo', 'Monterrey',
+    'San Luis Potosí', 'Pachuca', 'Toluca', 'Ciudad de México', 'Puebla', 'Tlaxcala',
+    'Cuernavaca', 'Acapulco', 'Oaxaca', 'Veracruz', 'Xalapa', 'Villahermosa', 'Mérida',
+]
+MARCAS = {
+    'Volvo': ['9700', '9800', '7900'],
+    'Mercedes-Benz': ['Irizar i6', 'Tourismo', 'Sprinter'],
+    'Scania': ['Irizar i8', 'Touring', 'Marcopolo'],
+    'Dina': ['Linner', 'Runner', 'Picker'],
+    'International': ['3300', 'CE'],
+}
+NOMBRES = [
+    'Ana', 'Luis', 'María', 'José', 'Carmen', 'Juan', 'Laura', 'Carlos', 'Sofía', 'Miguel',
+    'Lucía', 'Jorge', 'Valeria', 'Pedro', 'Fernanda', 'Ricardo', 'Daniela', 'Alejandro',
+    'Paola', 'Diego', 'Andrea', 'Fernando', 'Gabriela', 'Raúl', 'Mariana', 'Héctor',
+]
+APELLIDOS = [
+    'García', 'Hernández', 'López', 'Martínez', 'González', 'Pérez', 'Rodríguez',
+    'Sánchez', 'Ramírez', 'Cruz', 'Flores', 'Gómez', 'Morales', 'Vázquez', 'Reyes',
+    'Jiménez', 'Torres', 'Díaz', 'Gutiérrez', 'Ruiz', 'Mendoza', 'Aguilar', 'Ortiz',
+    'Castillo', 'Romero', 'Álvarez', 'Chávez', 'Rivera', 'Juárez', 'Domínguez',
+]
+PUESTOS = ['conductor'] * 6 + ['auxiliar'] * 2 + ['administrativo', 'gerente']
+
+
+def volumenes(escala=1.0, **cambios):
+    """Volúmenes por defecto multiplicados por ``escala``; ``cambios`` los fija."""
+    resultado = {nombre: max(1, int(valor * escala)) for nombre, valor in VOLUMENES.items()}
+    resultado.update({nombre: valor for nombre, valor in cambios.items() if valor is not None})
+    return resultado
+
+
+def _crear(modelo, objetos, lote):
+    """``bulk_create`` que garantiza las llaves primarias de los objetos."""
+    creados = modelo.objects.bulk_create(objetos, batch_size=lote)
+    if objetos and objetos[-1].pk is None:
+        # Backends sin RETURNING: se leen los últimos ids insertados
+        ids = modelo.objects.order_by('-pk').values_list('pk', flat=True)[:len(objetos)]
+        for objeto, pk in zip(objetos, reversed(list(ids))):
+            objeto.pk = pk
+    return creados
+
+
+def _nombre(rng):
+    return rng.choice(NOMBRES), rng.choice(APELLIDOS)
+
+
+def _telefono(rng):
+    return f'{rng.choice((55, 33, 81, 664, 686, 646))}{rng.randrange(10 ** 7):07d}'
+
+
+class Generador:
+    """Genera un conjunto completo; ``avisar(mensaje)`` reporta el avance."""
+
+    def __init__(self, semilla=None, lote=LOTE, avisar=None):
+        self.rng = random.Random(semilla)
+        self.lote = lote
+        self.avisar = avisar or (lambda mensaje: None)
+        self.ahora = timezone.now()
+        self.creados = {}
+
+    def generar(self, cantidades):
+        autobuses = self.autobuses(cantidades['autobuses'])
+        rutas = self.rutas(cantidades['rutas'])
+        conductores = self.empleados(cantidades['empleados'])
+        pasajeros = self.pasajeros(cantidades['pasajeros'])
+        self.viajes_y_boletos(cantidades['viajes'], cantidades['boletos'], autobuses, rutas, conductores, pasajeros)
+        # Las altas con bulk_create no pasan por las señales del tablero
+        dashboard.invalidar_todo()
+        for modelo in (Autobus, Ruta, Empleado, Pasajero, Viaje, Boleto, EstadisticaBoleto):
+            versiones.modelo_cambiado(modelo)
+        # Ni por las de los resúmenes: se recalculan con dos consultas agrupadas
+        resumenes.reconstruir()
+        return self.creados
+
+    def _registrar(self, nombre, cantidad):
+        self.creados[nombre] = self.creados.get(nombre, 0) + cantidad
+
+    # ========== CATÁLOGOS ==========
+    def autobuses(self, cantidad):
+        inicio = Autobus.objects.count()
+        objetos = []
+        for i in range(cantidad):
+            marca = self.rng.choice(list(MARCAS))
+            objetos.append(Autobus(
+                marca=marca, modelo=self.rng.choice(MARCAS[marca]),
+                placa=f'SL{inicio + i:07d}', año=self.rng.randint(2005, 2024),
+                capacidad=self.rng.choice((30, 36, 40, 44, 48, 50)),
+                estado=self.rng.choices(('activo', 'mantenimiento', 'inactivo'), (90, 7, 3))[0],
+            ))
+        with transaction.atomic():
+            _crear(Autobus, objetos, self.lote)
+        self._registrar('autobuses', cantidad)
+        self.avisar(f'{cantidad} autobuses')
+        activos = [autobus for autobus in objetos if autobus.estado == 'activo'] or objetos
+        return [(autobus.pk, autobus.capacidad) for autobus in activos]
+
+    def rutas(self, cantidad):
+        objetos = []
+        for _ in range(cantidad):
+            origen, destino = self.rng.sample(CIUDADES, 2)
+            distancia = self.rng.randint(40, 1800)
+            minutos = int(distancia / 75 * 60) + self.rng.randint(0, 60)
+            objetos.append(Ruta(
+                origen=origen, destino=destino, distancia_km=distancia,
+                duracion_estimada=timedelta(minutes=minutos),
+                precio_base=Decimal(round(distancia * self.rng.uniform(1.2, 2.0) + 80)),
+                activa=self.rng.random() < 0.95,
+            ))
+            # bulk_create no llama a save()
+            objetos[-1].normalizar()
+        with transaction.atomic():
+            _crear(Ruta, objetos, self.lote)
+        self._registrar('rutas', cantidad)
+        self.avisar(f'{cantidad} rutas')
+        return [(ruta.pk, ruta.precio_base, ruta.duracion_estimada) for ruta in objetos]
+
+    def empleados(self, cantidad):
+        objetos = []
+        for i in range(cantidad):
+            nombre, apellido = _nombre(self.rng)
+            objetos.append(Empleado(
+                nombre=nombre, apellido=apellido,
+                # Al menos un conductor para poder crear viajes
+                puesto='conductor' if i == 0 else self.rng.choice(PUESTOS),
+                telefono=_telefono(self.rng), email=f'empleado{i}@ejemplo.com',
+                fecha_contratacion=date(2010, 1, 1) + timedelta(days=self.rng.randrange(5000)),
+                salario=Decimal(self.rng.randrange(9000, 40000)),
+                activo=self.rng.random() < 0.93,
+            ))
+        with transaction.atomic():
+            _crear(Empleado, objetos, self.lote)
+        self._registrar('empleados', cantidad)
+        self.avisar(f'{cantidad} empleados')
+        return [empleado.pk for empleado in objetos if empleado.puesto == 'conductor']
+
+    def pasajeros(self, cantidad):
+        ids = []
+        for inicio in range(0, cantidad, self.lote):
+            objetos = []
+            for i in range(inicio, min(inicio + self.lote, cantidad)):
+                nombre, apellido = _nombre(self.rng)
+                objetos.append(Pasajero(
+                    nombre=nombre, apellido=apellido, telefono=_telefono(self.rng),
+                    email=f'{nombre.lower()}.{apellido.lower()}{i}@ejemplo.com',
+                    fecha_nacimiento=date(1950, 1, 1) + timedelta(days=self.rng.randrange(20000)),
+                    direccion=f'Calle {self.rng.randint(1, 300)} #{self.rng.randint(1, 9999)}',
+                ))
+            with transaction.atomic():
+                _crear(Pasajero, objetos, self.lote)
+            ids.extend(pasajero.pk for pasajero in objetos)
+        self._registrar('pasajeros', cantidad)
+        self.avisar(f'{cantidad} pasajeros')
+        return ids
+
+    # ========== VIAJES Y BOLETOS ==========
+    def _estado_boleto(self, ya_salio):
+        if ya_salio:
+            return self.rng.choices(('usado', 'pagado', 'cancelado'), (80, 15, 5))[0]
+        return self.rng.choices(('pagado', 'reservado', 'cancelado'), (75, 20, 5))[0]
+
+    def viajes_y_boletos(self, cantidad, total_boletos, autobuses, rutas, conductores, pasajeros):
+        restantes = total_boletos
+        hechos = 0
+        for inicio in range(0, cantidad, VIAJES_POR_TRANSACCION):
+            tramo = min(VIAJES_POR_TRANSACCION, cantidad - inicio)
+            viajes, asientos_por_viaje = [], []
+            for i in range(tramo):
+                autobus_id, capacidad = self.rng.choice(autobuses)
+                ruta_id, precio, duracion = self.rng.choice(rutas)
+                salida = self.ahora + timedelta(days=self.rng.uniform(-DIAS_ATRAS, DIAS_ADELANTE))
+                salida = salida.replace(second=0, microsecond=0)
+                ya_salio = salida < self.ahora
+                cancelado = self.rng.random() < 0.03
+                if cancelado:
+                    estado = 'cancelado'
+                elif ya_salio:
+                    estado = 'completado'
+                else:
+                    estado = 'programado'
+
+                # Reparte los boletos restantes entre los viajes que faltan
+                media = restantes / max(cantidad - inicio - i, 1)
+                vendidos = 0 if cancelado else min(capacidad, restantes, round(self.rng.uniform(0, 2 * media)))
+                restantes -= vendidos
+                asientos = self.rng.sample(range(1, capacidad + 1), vendidos)
+                boletos = [(asiento, self._estado_boleto(ya_salio)) for asiento in asientos]
+
+                mapa = MapaAsientos(capacidad)
+                for asiento, estado_boleto in boletos:
+                    if estado_boleto != 'cancelado':
+                        mapa.ocupar(asiento)
+                viajes.append(Viaje(
+                    autobus_id=autobus_id, ruta_id=ruta_id, conductor_id=self.rng.choice(conductores),
+                    fecha_salida=salida, fecha_llegada_estimada=salida + duracion,
+                    estado=estado, asientos_disponibles=capacidad - mapa.total_ocupados(),
+                    ocupacion=mapa.a_bytes(),
+                ))
+                asientos_por_viaje.append((salida, precio, boletos))
+
+            with transaction.atomic():
+                _crear(Viaje, viajes, self.lote)
+                total = sum(len(boletos) for _, _, boletos in asientos_por_viaje)
+                codigos = iter(generar_codigos(total))
+                nuevos, compras = [], []
+                for viaje, (salida, precio, boletos) in zip(viajes, asientos_por_viaje):
+                    for asiento, estado_boleto in boletos:
+                        compras.append(min(salida - timedelta(hours=self.rng.uniform(1, 24 * 30)), self.ahora))
+                        nuevos.append(Boleto(
+                            viaje_id=viaje.pk, pasajero_id=self.rng.choice(pasajeros),
+                            asiento_numero=asiento, precio=precio, estado=estado_boleto,
+                            codigo_boleto=next(codigos),
+                        ))
+                _crear(Boleto, nuevos, self.lote)
+                # fecha_compra es auto_now_add y el INSERT la pone en "ahora": las fechas
+                # repartidas se escriben después, con el mismo lote
+                for boleto, compra in zip(nuevos, compras):
+                    boleto.fecha_compra = compra
+                Boleto.objects.bulk_update(nuevos, ['fecha_compra'], batch_size=self.lote)
+                estadisticas.registrar_creados(nuevos)
+
+            hechos += len(nuevos)
+            self._registrar('viajes', tramo)
+            self._registrar('boletos', len(nuevos))
+            self.avisar(f'{inicio + tramo}/{cantidad} viajes, {hechos} boletos')
@@ -0,0 +1,171 @@
+"""Códigos de boleto únicos, difíciles de adivinar y con dígito de control.
+
+Cada código sale de un número de secuencia distinto:
+
+1. La secuencia vive en ``SecuenciaCodigo`` y se reserva en bloques
+   (``CODIGOS_TAMANO_BLOQUE``) con un solo ``UPDATE``; el resto del bloque
+   se guarda en memoria y se reparte sin tocar la base de datos.
+2. El número pasa por una permutación de Feistel de 40 bits con clave, así
+   que códigos consecutivos no se parecen y no hay colisiones: es una
+   biyección, no hace falta reintentar.
+3. El resultado se escribe con 8 caracteres Crockford base 32 (sin I, L, O
+   ni U) más un carácter de control Luhn mod 32, y un prefijo de origen.
+
+La permutación depende de ``CODIGOS_CLAVE`` (o de ``SECRET_KEY`` si no está
+definida). Cambiarla con boletos ya emitidos puede repetir códigos; la
+restricción única de ``codigo_boleto`` lo detectaría, pero conviene fijarla.
+"""
+import hashlib
+import re
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils.crypto import salted_hmac
+
+from .models import SecuenciaCodigo
+
+SECUENCIA = 'boletos'
+PREFIJO_VENTA = 'B'
+PREFIJO_MANUAL = 'M'
+PREFIJOS = (PREFIJO_VENTA, PREFIJO_MANUAL)
+
+ALFABETO = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+VALORES = {caracter: valor for valor, caracter in enumerate(ALFABETO)}
+# Lecturas equivocadas habituales al teclear el código
+EQUIVALENCIAS = str.maketrans({'I': '1', 'L': '1', 'O': '0'})
+
+BITS = 40
+MITAD = BITS // 2
+MASCARA_MITAD = (1 << MITAD) - 1
+RONDAS = 4
+LONGITUD = 1 + BITS // 5 + 1  # prefijo + 8 caracteres + control
+
+# Códigos emitidos antes de este módulo (B + 8 hex y MAN- + 8 hex)
+PATRON_ANTERIOR = re.compile(r'^(B|MAN-)[0-9A-F]{8}$')
+
+
+def _tamano_bloque():
+    return getattr(settings, 'CODIGOS_TAMANO_BLOQUE', 100)
+
+
+@lru_cache(maxsize=1)
+def _clave():
+    secreto = getattr(settings, 'CODIGOS_CLAVE', None) or settings.SECRET_KEY
+    return salted_hmac('app_autobuses.codigos', 'permutacion', secret=secreto, algorithm='sha256').digest()
+
+
+# ========== PERMUTACIÓN ==========
+def _ronda(numero_ronda, mitad):
+    datos = bytes([numero_ronda]) + mitad.to_bytes(3, 'big')
+    resumen = hashlib.blake2b(datos, key=_clave(), digest_size=4).digest()
+    return int.from_bytes(resumen, 'big') & MASCARA_MITAD
+
+
+def permutar(numero):
+    """Biyección con clave sobre ``[0, 2**40)``."""
+    izquierda, derecha = numero >> MITAD, numero & MASCARA_MITAD
+    for numero_ronda in range(RONDAS):
+        izquierda, derecha = derecha, izquierda ^ _ronda(numero_ronda, derecha)
+    return (izquierda << MITAD) | derecha
+
+
+# ========== FORMATO ==========
+def _control(valores):
+    """Carácter de control Luhn mod 32: detecta un carácter mal escrito y casi
+    todas las transposiciones de caracteres vecinos."""
+    suma = 0
+    factor = 2
+    for valor in reversed(valores):
+        sumando = factor * valor
+        suma += sumando // 32 + sumando % 32
+        factor = 3 - factor
+    return (32 - suma % 32) % 32
+
+
+def formatear(numero, prefijo=PREFIJO_VENTA):
+    valores = [(numero >> (5 * posicion)) & 31 for posicion in reversed(range(BITS // 5))]
+    valores.append(_control(valores))
+    return prefijo + ''.join(ALFABETO[valor] for valor in valores)
+
+
+def normalizar_codigo(texto):
+    """Mayúsculas, sin espacios ni guiones y con I/L/O corregidas."""
+    texto = re.sub(r'\s', '', (texto or '').upper())
+    if PATRON_ANTERIOR.match(texto):
+        return texto
+    texto = texto.replace('-', '')
+    return texto[:1] + texto[1:].translate(EQUIVALENCIAS)
+
+
+def codigo_valido(codigo):
+    """Comprueba formato y dígito de control sin consultar la base de datos."""
+    if len(codigo) != LONGITUD or codigo[0] not in PREFIJOS:
+        return False
+    try:
+        valores = [VALORES[caracter] for caracter in codigo[1:]]
+    except KeyError:
+        return False
+    return _control(valores[:-1]) == valores[-1]
+
+
+def es_codigo_anterior(codigo):
+    return bool(PATRON_ANTERIOR.match(codigo))
+
+
+# ========== SECUENCIA ==========
+_bloques = []  # rangos (inicio, fin) ya reservados y sin repartir
+_candado = threading.Lock()
+
+
+def _reservar(cantidad):
+    """Aumenta la secuencia en ``cantidad`` y devuelve el primer número reservado."""
+    with transaction.atomic():
+        if not SecuenciaCodigo.objects.filter(nombre=SECUENCIA).update(siguiente=F('siguiente') + cantidad):
+            SecuenciaCodigo.objects.get_or_create(nombre=SECUENCIA)
+            SecuenciaCodigo.objects.filter(nombre=SECUENCIA).update(siguiente=F('siguiente') + cantidad)
+        fin = SecuenciaCodigo.objects.filter(nombre=SECUENCIA).values_list('siguiente', flat=True).get()
+    if fin > 1 << BITS:
+        raise RuntimeError('Se agotaron los códigos de boleto')
+    return fin - cantidad
+
+
+def _devolver(inicio, fin):
+    with _candado:
+        _bloques.append((inicio, fin))
+
+
+def numeros(cantidad):
+    """Reparte ``cantidad`` números de secuencia sin repetir."""
+    tomados = []
+    with _candado:
+        while _bloques and len(tomados) < cantidad:
+            inicio, fin = _bloques.pop()
+            usados = min(fin - inicio, cantidad - len(tomados))
+            tomados.extend(range(inicio, inicio + usados))
+            if inicio + usados < fin:
+                _bloques.append((inicio + usados, fin))
+
+    faltan = cantidad - len(tomados)
+    if faltan:
+        bloque = max(faltan, _tamano_bloque())
+        inicio = _reservar(bloque)
+        tomados.extend(range(inicio, inicio + faltan))
+        if bloque > faltan:
+            # El sobrante solo se reparte si la reserva llega a confirmarse;
+            # si la transacción externa se revierte, otro proceso puede
+            # reservar esos mismos números.
+            sobrante = (inicio + faltan, inicio + bloque)
+            transaction.on_commit(lambda: _devolver(*sobrante))
+    return tomados
+
+
+def generar_codigos(cantidad, prefijo=PREFIJO_VENTA):
+    """Devuelve ``cantidad`` códigos nuevos, con una sola consulta como máximo."""
+    return [formatear(permutar(numero), prefijo) for numero in numeros(cantidad)]
+
+
+def generar_codigo(prefijo=PREFIJO_VENTA):
+    return generar_codigos(1, prefijo)[0]
@@ -0,0 +1,187 @@
+"""Contadores del tablero principal guardados en la caché de Django.
+
+Las señales de los seis modelos ajustan o invalidan cada contador (ver
+``signals.py``). Con ``DASHBOARD_STALE_WHILE_REVALIDATE`` activo, un
+contador invalidado se marca como obsoleto en lugar de borrarse: la primera
+petición que lo encuentra toma un candado y lo recalcula, y las demás siguen
+sirviendo el valor anterior mientras tanto.
+
+``aobtener_contadores`` es la versión async para el índice bajo ASGI: lee la
+caché con ``aget_many`` y recalcula los contadores que faltan a la vez con
+``asyncio.gather``.
+"""
+import asyncio
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Sum
+
+from .enrutador import en_primaria
+from .models import Autobus, Boleto, Empleado, EstadisticaBoleto, Pasajero, Ruta, Viaje
+
+PREFIJO = 'dashboard'
+
+# Consulta de cada contador; el valor es su COUNT salvo los de SUMAS
+CONTADORES = {
+    'total_autobuses': lambda: Autobus.objects.all(),
+    'total_rutas': lambda: Ruta.objects.filter(activa=True),
+    'total_empleados': lambda: Empleado.objects.filter(activo=True),
+    'total_pasajeros': lambda: Pasajero.objects.all(),
+    'viajes_programados': lambda: Viaje.objects.filter(estado='programado'),
+    # Sale de la tabla acumulada de estadisticas.py, no de contar boletos
+    'boletos_vendidos': lambda: EstadisticaBoleto.objects.filter(estado='pagado'),
+}
+SUMAS = {'boletos_vendidos': 'cantidad'}
+
+# Contadores afectados por cada modelo. Los que cuentan la tabla completa
+# se pueden ajustar en el sitio con incr/decr; el resto se invalida.
+CONTADORES_POR_MODELO = {
+    Autobus: 'total_autobuses',
+    Ruta: 'total_rutas',
+    Empleado: 'total_empleados',
+    Pasajero: 'total_pasajeros',
+    Viaje: 'viajes_programados',
+    Boleto: 'boletos_vendidos',
+}
+AJUSTABLES = {'total_autobuses', 'total_pasajeros'}
+
+
+def _cache():
+    return caches[getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300)
+
+
+def _stale_while_revalidate():
+    return getattr(settings, 'DASHBOARD_STALE_WHILE_REVALIDATE', True)
+
+
+def _clave(nombre):
+    return f'{PREFIJO}:{nombre}'
+
+
+def _clave_obsoleto(nombre):
+    return f'{PREFIJO}:{nombre}:obsoleto'
+
+
+def _clave_candado(nombre):
+    return f'{PREFIJO}:{nombre}:candado'
+
+
+def _claves():
+    return [_clave(nombre) for nombre in CONTADORES] + [_clave_obsoleto(nombre) for nombre in CONTADORES]
+
+
+def _calcular(nombre):
+    consulta = CONTADORES[nombre]()
+    if nombre in SUMAS:
+        return consulta.aggregate(valor=Sum(SUMAS[nombre]))['valor'] or 0
+    return consulta.count()
+
+
+async def _acalcular(nombre):
+    consulta = CONTADORES[nombre]()
+    if nombre in SUMAS:
+        return (await consulta.aaggregate(valor=Sum(SUMAS[nombre])))['valor'] or 0
+    return await consulta.acount()
+
+
+def _recalcular(cache, nombre):
+    with en_primaria():
+        valor = _calcular(nombre)
+    cache.set(_clave(nombre), valor, _timeout())
+    cache.delete(_clave_obsoleto(nombre))
+    return valor
+
+
+async def _arecalcular(cache, nombre, candado=False):
+    try:
+        with en_primaria():
+            valor = await _acalcular(nombre)
+        await cache.aset(_clave(nombre), valor, _timeout())
+        await cache.adelete(_clave_obsoleto(nombre))
+        return valor
+    finally:
+        if candado:
+            await cache.adelete(_clave_candado(nombre))
+
+
+def obtener_contadores():
+    """Devuelve el diccionario de contadores que usa la plantilla del índice."""
+    cache = _cache()
+    guardados = cache.get_many(_claves())
+
+    contadores = {}
+    for nombre in CONTADORES:
+        valor = guardados.get(_clave(nombre))
+        if valor is None:
+            contadores[nombre] = _recalcular(cache, nombre)
+        elif _clave_obsoleto(nombre) in guardados and cache.add(_clave_candado(nombre), 1, 30):
+            # Solo quien obtiene el candado recalcula; el resto usa el valor anterior
+            try:
+                contadores[nombre] = _recalcular(cache, nombre)
+            finally:
+                cache.delete(_clave_candado(nombre))
+        else:
+            contadores[nombre] = valor
+    return contadores
+
+
+async def aobtener_contadores():
+    """Como ``obtener_contadores``, con los recálculos pendientes en paralelo."""
+    cache = _cache()
+    guardados = await cache.aget_many(_claves())
+
+    contadores, pendientes = {}, {}
+    for nombre in CONTADORES:
+        valor = guardados.get(_clave(nombre))
+        if valor is None:
+            pendientes[nombre] = False
+        elif _clave_obsoleto(nombre) in guardados and await cache.aadd(_clave_candado(nombre), 1, 30):
+            pendientes[nombre] = True
+        else:
+            contadores[nombre] = valor
+    valores = await asyncio.gather(*(_arecalcular(cache, nombre, candado) for nombre, candado in pendientes.items()))
+    contadores.update(zip(pendientes, valores))
+    return contadores
+
+
+def invalidar(nombre):
+    cache = _cache()
+    if _stale_while_revalidate():
+        cache.set(_clave_obsoleto(nombre), 1, _timeout())
+    else:
+        cache.delete(_clave(nombre))
+
+
+def ajustar(nombre, delta):
+    cache = _cache()
+    try:
+        cache.incr(_clave(nombre), delta)
+    except ValueError:
+        # El contador no estaba en caché; se calculará en la próxima lectura
+        pass
+
+
+def modelo_cambiado(modelo, creado=False, eliminado=False, cantidad=1):
+    """Se llama desde las señales; aplica el cambio al confirmarse la transacción.
+
+    ``cantidad`` permite registrar de una vez las altas hechas con ``bulk_create``.
+    """
+    nombre = CONTADORES_POR_MODELO.get(modelo)
+    if nombre is None:
+        return
+    if nombre in AJUSTABLES and (creado or eliminado):
+        transaction.on_commit(lambda: ajustar(nombre, cantidad if creado else -cantidad))
+    elif nombre in AJUSTABLES:
+        return
+    else:
+        transaction.on_commit(lambda: invalidar(nombre))
+
+
+def invalidar_todo():
+    for nombre in CONTADORES:
+        transaction.on_commit(lambda nombre=nombre: invalidar(nombre))
@@ -0,0 +1,41 @@
+"""Lectura y formato de duraciones escritas a mano ("2h 30m", "2:30", "1.5 h", "45 min")."""
+import re
+from datetime import timedelta
+
+_HORAS_MINUTOS = re.compile(
+    r'^(?:(?P<horas>\d+(?:[.,]\d+)?)\s*(?:h|hr|hrs|hora|horas))?\s*'
+    r'(?:(?P<minutos>\d+)\s*(?:m|min|mins|minuto|minutos))?$')
+_RELOJ = re.compile(r'^(?P<horas>\d+):(?P<minutos>[0-5]\d)$')
+
+
+def minutos(texto):
+    """Minutos de la duración o ``None`` si el texto no se entiende.
+
+    Un número solo se toma como minutos.
+    """
+    texto = (texto or '').strip().lower()
+    if not texto:
+        return None
+    if texto.isdigit():
+        return int(texto)
+    reloj = _RELOJ.match(texto)
+    if reloj:
+        return int(reloj['horas']) * 60 + int(reloj['minutos'])
+    partes = _HORAS_MINUTOS.match(texto)
+    if not partes or not (partes['horas'] or partes['minutos']):
+        return None
+    horas = float(partes['horas'].replace(',', '.')) if partes['horas'] else 0
+    return round(horas * 60) + int(partes['minutos'] or 0)
+
+
+def a_timedelta(texto):
+    cantidad = minutos(texto)
+    return None if cantidad is None else timedelta(minutes=cantidad)
+
+
+def formatear(duracion):
+    """``timedelta`` como "2h 30m", "2h" o "45m"."""
+    horas, resto = divmod(round(duracion.total_seconds() / 60), 60)
+    if horas and resto:
+        return f'{horas}h {resto}m'
+    return f'{horas}h' if horas else f'{resto}m'
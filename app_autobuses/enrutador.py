@@ -0,0 +1,125 @@
+"""Lecturas en réplicas y escrituras en la base principal.
+
+``EnrutadorReplicas`` manda a una réplica (``REPLICAS``) las lecturas de los
+modelos de la aplicación, pero solo dentro de una petición GET o HEAD que
+``ReplicaMiddleware`` haya marcado; todo lo demás (escrituras, peticiones
+POST, comandos, tareas en segundo plano) usa ``default``.
+
+Después de un POST, PUT, PATCH o DELETE la sesión queda "fijada" a la
+principal durante ``REPLICA_FIJAR_SEGUNDOS``, para que quien acaba de
+guardar algo lo vea aunque la réplica vaya atrasada.
+
+Lo que se guarda en una caché compartida (mapa de asientos, contadores del
+tablero) se lee con ``en_primaria()``: un valor atrasado de la réplica
+quedaría en caché para todos hasta que caducara. Por lo mismo, las páginas
+que se leen de una réplica (``lee_de_replica()``) no llevan los ETag de
+``versiones.py`` ni usan la caché de tablas de ``fragmentos.py``.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+METODOS_SEGUROS = ('GET', 'HEAD')
+CLAVE_SESION = 'replica_fijada_hasta'
+MODELOS = {'autobus', 'ruta', 'empleado', 'pasajero', 'viaje', 'boleto'}
+
+_leer_de_replica = ContextVar('leer_de_replica', default=False)
+
+
+def _replicas():
+    return [alias for alias in getattr(settings, 'REPLICAS', []) if alias in settings.DATABASES]
+
+
+def _segundos_fijada():
+    return getattr(settings, 'REPLICA_FIJAR_SEGUNDOS', 5)
+
+
+@contextmanager
+def en_primaria():
+    """Las lecturas dentro del bloque van a ``default``."""
+    token = _leer_de_replica.set(False)
+    try:
+        yield
+    finally:
+        _leer_de_replica.reset(token)
+
+
+def lee_de_replica():
+    """Si las lecturas de los modelos van ahora a una réplica."""
+    # Dentro de una transacción se lee lo que ella misma escribió
+    return (_leer_de_replica.get() and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+            and bool(_replicas()))
+
+
+# ========== ENRUTADOR ==========
+class EnrutadorReplicas:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'app_autobuses' or model._meta.model_name not in MODELOS:
+            return None
+        if not lee_de_replica():
+            return DEFAULT_DB_ALIAS
+        return random.choice(_replicas())
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Todas las bases tienen los mismos datos
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Las réplicas se copian de la principal; no se migran por separado
+        return db not in _replicas()
+
+
+# ========== MIDDLEWARE ==========
+class ReplicaMiddleware:
+    """Decide si la petición puede leer de una réplica y fija la sesión tras escribir.
+
+    Va después de ``SessionMiddleware``. Funciona con WSGI y con ASGI; bajo
+    ASGI la sesión se lee con ``aget`` y así queda cargada para el resto de
+    la petición (los mensajes, por ejemplo) sin consultas síncronas.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.method not in METODOS_SEGUROS:
+            response = self.get_response(request)
+            if response.status_code < 400:
+                request.session[CLAVE_SESION] = time.time() + _segundos_fijada()
+            return response
+
+        fijada = request.session.get(CLAVE_SESION, 0) > time.time()
+        token = _leer_de_replica.set(not fijada and bool(_replicas()))
+        try:
+            return self.get_response(request)
+        finally:
+            _leer_de_replica.reset(token)
+
+    async def __acall__(self, request):
+        if request.method not in METODOS_SEGUROS:
+            response = await self.get_response(request)
+            if response.status_code < 400:
+                await request.session.aset(CLAVE_SESION, time.time() + _segundos_fijada())
+            return response
+
+        fijada = await request.session.aget(CLAVE_SESION, 0) > time.time()
+        # sync_to_async copia el contexto, así que el ORM ve este valor en su hilo
+        token = _leer_de_replica.set(not fijada and bool(_replicas()))
+        try:
+            return await self.get_response(request)
+        finally:
+            _leer_de_replica.reset(token)
@@ -0,0 +1,79 @@
+"""Estadísticas de boletos mantenidas de forma incremental.
+
+Cada alta, cambio o baja de un ``Boleto`` ajusta la fila de
+``EstadisticaBoleto`` correspondiente a su estado con una actualización
+``F()``, así que las vistas leen como máximo cuatro filas en lugar de
+agregar toda la tabla de boletos.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, F, Sum
+
+from .models import Boleto, EstadisticaBoleto
+
+
+def ajustar(estado, cantidad, total):
+    """Suma ``cantidad`` y ``total`` a la fila del estado (pueden ser negativos)."""
+    if not cantidad and not total:
+        return
+    actualizadas = EstadisticaBoleto.objects.filter(estado=estado).update(
+        cantidad=F('cantidad') + cantidad,
+        total=F('total') + total,
+    )
+    if not actualizadas:
+        EstadisticaBoleto.objects.get_or_create(estado=estado)
+        EstadisticaBoleto.objects.filter(estado=estado).update(
+            cantidad=F('cantidad') + cantidad,
+            total=F('total') + total,
+        )
+
+
+def registrar_cambio(anterior, actual):
+    """Aplica la diferencia entre dos estados de un boleto.
+
+    ``anterior`` y ``actual`` son diccionarios con ``estado`` y ``precio``,
+    o ``None`` si el boleto no existía (alta) o dejó de existir (baja).
+    """
+    if anterior and actual and anterior['estado'] == actual['estado']:
+        ajustar(actual['estado'], 0, Decimal(actual['precio']) - Decimal(anterior['precio']))
+        return
+    if anterior:
+        ajustar(anterior['estado'], -1, -Decimal(anterior['precio']))
+    if actual:
+        ajustar(actual['estado'], 1, Decimal(actual['precio']))
+
+
+def registrar_creados(boletos):
+    """Versión por lotes para inserciones hechas con ``bulk_create``."""
+    acumulado = {}
+    for boleto in boletos:
+        cantidad, total = acumulado.get(boleto.estado, (0, Decimal('0')))
+        acumulado[boleto.estado] = (cantidad + 1, total + Decimal(boleto.precio))
+    for estado, (cantidad, total) in acumulado.items():
+        ajustar(estado, cantidad, total)
+
+
+def _por_estado(filas):
+    resultado = {estado: {'cantidad': 0, 'total': Decimal('0')} for estado, _ in Boleto.ESTADOS}
+    for fila in filas:
+        resultado[fila['estado']] = {'cantidad': fila['cantidad'], 'total': fila['total']}
+    return resultado
+
+
+def obtener_estadisticas():
+    """Devuelve ``{estado: {'cantidad': n, 'total': Decimal}}`` para todos los estados."""
+    return _por_estado(EstadisticaBoleto.objects.values('estado', 'cantidad', 'total'))
+
+
+async def aobtener_estadisticas():
+    filas = EstadisticaBoleto.objects.values('estado', 'cantidad', 'total')
+    return _por_estado([fila async for fila in filas])
+
+
+def calcular_desde_boletos():
+    """Recalcula las estadísticas con una sola consulta agrupada."""
+    resultado = {estado: {'cantidad': 0, 'total': Decimal('0')} for estado, _ in Boleto.ESTADOS}
+    filas = Boleto.objects.order_by().values('estado').annotate(cantidad=Count('id'), total=Sum('precio'))
+    for fila in filas:
+        resultado[fila['estado']] = {'cantidad': fila['cantidad'], 'total': fila['total'] or Decimal('0')}
+    return resultado
@@ -0,0 +1,161 @@
+"""Exportación en streaming de boletos, viajes y pasajeros a CSV o JSONL.
+
+Las filas se leen con ``values_list(...).iterator(chunk_size=...)`` y se
+escriben a medida que llegan, opcionalmente comprimidas con gzip, así que
+ni la consulta ni la respuesta completa se guardan en memoria.
+"""
+import csv
+import json
+import zlib
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from .models import Boleto, Pasajero, Viaje
+
+FORMATOS = ('csv', 'jsonl')
+TAMANO_BLOQUE = 2000
+# Bytes de salida acumulados antes de entregar un trozo de la respuesta
+TAMANO_TROZO = 64 * 1024
+
+EXPORTACIONES = {
+    'boletos': {
+        'modelo': Boleto,
+        'campo_fecha': 'fecha_compra',
+        'columnas': [
+            ('codigo', 'codigo_boleto'),
+            ('estado', 'estado'),
+            ('precio', 'precio'),
+            ('asiento', 'asiento_numero'),
+            ('fecha_compra', 'fecha_compra'),
+            ('pasajero_id', 'pasajero_id'),
+            ('pasajero_nombre', 'pasajero__nombre'),
+            ('pasajero_apellido', 'pasajero__apellido'),
+            ('pasajero_email', 'pasajero__email'),
+            ('viaje_id', 'viaje_id'),
+            ('viaje_salida', 'viaje__fecha_salida'),
+            ('origen', 'viaje__ruta__origen'),
+            ('destino', 'viaje__ruta__destino'),
+        ],
+    },
+    'viajes': {
+        'modelo': Viaje,
+        'campo_fecha': 'fecha_salida',
+        'columnas': [
+            ('id', 'id'),
+            ('estado', 'estado'),
+            ('fecha_salida', 'fecha_salida'),
+            ('fecha_llegada_estimada', 'fecha_llegada_estimada'),
+            ('asientos_disponibles', 'asientos_disponibles'),
+            ('ruta_id', 'ruta_id'),
+            ('origen', 'ruta__origen'),
+            ('destino', 'ruta__destino'),
+            ('autobus_placa', 'autobus__placa'),
+            ('conductor_id', 'conductor_id'),
+        ],
+    },
+    'pasajeros': {
+        'modelo': Pasajero,
+        'campo_fecha': None,
+        'columnas': [
+            ('id', 'id'),
+            ('nombre', 'nombre'),
+            ('apellido', 'apellido'),
+            ('telefono', 'telefono'),
+            ('email', 'email'),
+            ('fecha_nacimiento', 'fecha_nacimiento'),
+            ('direccion', 'direccion'),
+        ],
+    },
+}
+
+
+def inicio_del_dia(dia, dias_despues=0):
+    return timezone.make_aware(datetime.combine(dia + timedelta(days=dias_despues), time.min))
+
+
+def estados(recurso):
+    """Estados por los que se puede filtrar el recurso; ninguno si no tiene estado."""
+    return [valor for valor, _ in getattr(EXPORTACIONES[recurso]['modelo'], 'ESTADOS', ())]
+
+
+def validar_estado(recurso, estado):
+    if estado and estado not in estados(recurso):
+        validos = ', '.join(estados(recurso)) or 'ninguno'
+        raise ValueError(f'Estado no válido para {recurso}: {estado} (válidos: {validos})')
+
+
+def filas(recurso, desde=None, hasta=None, estado=None):
+    """Iterador de tuplas con las columnas del recurso, en orden de id.
+
+    ``desde`` y ``hasta`` son fechas (inclusive) sobre el campo de fecha del
+    recurso; ``estado`` solo aplica a boletos y viajes y debe ser uno de sus
+    ``ESTADOS`` (``ValueError`` si no).
+    """
+    validar_estado(recurso, estado)
+    config = EXPORTACIONES[recurso]
+    modelo = config['modelo']
+    consulta = modelo.objects.all()
+    campo_fecha = config['campo_fecha']
+    if campo_fecha and desde:
+        consulta = consulta.filter(**{f'{campo_fecha}__gte': inicio_del_dia(desde)})
+    if campo_fecha and hasta:
+        consulta = consulta.filter(**{f'{campo_fecha}__lt': inicio_del_dia(hasta, 1)})
+    if estado:
+        consulta = consulta.filter(estado=estado)
+    campos = [campo for _, campo in config['columnas']]
+    return consulta.order_by('pk').values_list(*campos).iterator(chunk_size=TAMANO_BLOQUE)
+
+
+class _Buffer:
+    """Pseudo-archivo para ``csv.writer``: devuelve la línea en lugar de guardarla."""
+
+    def write(self, valor):
+        return valor
+
+
+def _valor_json(valor):
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()
+    return str(valor)
+
+
+def lineas(recurso, formato, **filtros):
+    """Genera el contenido como texto, una línea por fila (más el encabezado en CSV)."""
+    titulos = [titulo for titulo, _ in EXPORTACIONES[recurso]['columnas']]
+    if formato == 'csv':
+        escritor = csv.writer(_Buffer())
+        yield escritor.writerow(titulos)
+        for fila in filas(recurso, **filtros):
+            yield escritor.writerow([v.isoformat() if hasattr(v, 'isoformat') else v for v in fila])
+    elif formato == 'jsonl':
+        for fila in filas(recurso, **filtros):
+            yield json.dumps(dict(zip(titulos, fila)), default=_valor_json, ensure_ascii=False) + '\n'
+    else:
+        raise ValueError(f'Formato no soportado: {formato}')
+
+
+def generar(recurso, formato='csv', comprimir=False, **filtros):
+    """Genera la exportación en trozos de bytes, comprimidos con gzip si se pide."""
+    compresor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if comprimir else None
+    trozo = []
+    tamano = 0
+    for linea in lineas(recurso, formato, **filtros):
+        datos = linea.encode('utf-8')
+        trozo.append(datos)
+        tamano += len(datos)
+        if tamano >= TAMANO_TROZO:
+            salida = b''.join(trozo)
+            trozo, tamano = [], 0
+            salida = compresor.compress(salida) if compresor else salida
+            if salida:
+                yield salida
+    salida = b''.join(trozo)
+    if compresor:
+        salida = compresor.compress(salida) + compresor.flush()
+    if salida:
+        yield salida
+
+
+def nombre_archivo(recurso, formato, comprimir=False):
+    return f'{recurso}.{formato}' + ('.gz' if comprimir else '')
@@ -1,7 +1,16 @@
+from datetime import timedelta
+
 from django import forms
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Max
 from django.forms import ModelForm
-from .models import Autobus, Ruta, Empleado, Pasajero, Viaje, Boleto
-import uuid
+from .models import Autobus, Ruta, Empleado, Pasajero, Viaje, Boleto, PlantillaHorario, leer_horas
+from . import horarios
+from .asientos import MapaAsientos, ajustar_a_autobus, guardar_boleto, ultimo_ocupado
+from .codigos import generar_codigo
+from .duraciones import a_timedelta, formatear
+from django.urls import reverse
 from django.utils import timezone
 
 class AutobusForm(ModelForm):
@@ -18,15 +27,53 @@ class AutobusForm(ModelForm):
             'imagen': forms.FileInput(attrs={'class': 'form-control'}),
         }
 
+    def clean_capacidad(self):
+        """La capacidad no puede dejar fuera un asiento vendido en alguno de sus viajes."""
+        capacidad = self.cleaned_data['capacidad']
+        if self.instance.pk and capacidad is not None:
+            ultimo = (Boleto.objects.filter(viaje__autobus_id=self.instance.pk).exclude(estado='cancelado')
+                      .aggregate(ultimo=Max('asiento_numero'))['ultimo'])
+            if ultimo and capacidad < ultimo:
+                raise ValidationError(f'Uno de los viajes de este autobús ya tiene vendido el asiento {ultimo}.')
+        return capacidad
+
+    def save(self, commit=True):
+        # Con la capacidad cambian los mapas de sus viajes (signals.py): todo o nada
+        if not commit:
+            return super().save(commit=False)
+        with transaction.atomic():
+            return super().save()
+
+class DuracionField(forms.Field):
+    """Duración escrita como "2h 30m", "2:30", "1.5 h" o en minutos ("150")."""
+    widget = forms.TextInput
+    default_error_messages = {
+        'invalid': 'Escribe la duración como 2h 30m, 2:30 o en minutos.',
+    }
+    
+    def prepare_value(self, value):
+        return formatear(value) if isinstance(value, timedelta) else value
+    
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        if isinstance(value, timedelta):
+            return value
+        duracion = a_timedelta(str(value))
+        if duracion is None or duracion <= timedelta(0):
+            raise ValidationError(self.error_messages['invalid'], code='invalid')
+        return duracion
+
 class RutaForm(ModelForm):
     class Meta:
         model = Ruta
         fields = '__all__'
+        field_classes = {'duracion_estimada': DuracionField}
         widgets = {
             'origen': forms.TextInput(attrs={'class': 'form-control'}),
             'destino': forms.TextInput(attrs={'class': 'form-control'}),
             'distancia_km': forms.NumberInput(attrs={'class': 'form-control'}),
-            'duracion_estimada': forms.TextInput(attrs={'class': 'form-control'}),
+            'duracion_estimada': forms.TextInput(attrs={'class': 'form-control', 'placeholder': '2h 30m'}),
             'precio_base': forms.NumberInput(attrs={'class': 'form-control'}),
             'activa': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
         }
@@ -60,33 +107,187 @@ class PasajeroForm(ModelForm):
             'direccion': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
         }
 
+class SelectorRuta(forms.Select):
+    """Cada opción lleva la duración de la ruta en minutos (``data-minutos``)
+    para que el formulario de viajes proponga la hora de llegada."""
+    def create_option(self, name, value, label, selected, index, subindex=None, attrs=None):
+        opcion = super().create_option(name, value, label, selected, index, subindex, attrs)
+        ruta = getattr(value, 'instance', None)
+        if ruta is not None and ruta.duracion_estimada is not None:
+            opcion['attrs']['data-minutos'] = round(ruta.duracion_estimada.total_seconds() / 60)
+        return opcion
+
 class ViajeForm(ModelForm):
     class Meta:
         model = Viaje
-        fields = '__all__'
+        # Los asientos disponibles salen del mapa de ocupación (asientos.py), no se editan
+        exclude = ['asientos_disponibles']
         widgets = {
             'autobus': forms.Select(attrs={'class': 'form-control'}),
-            'ruta': forms.Select(attrs={'class': 'form-control'}),
+            'ruta': SelectorRuta(attrs={'class': 'form-control'}),
             'conductor': forms.Select(attrs={'class': 'form-control'}),
             'fecha_salida': forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'}),
             'fecha_llegada_estimada': forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'}),
             'estado': forms.Select(attrs={'class': 'form-control'}),
-            'asientos_disponibles': forms.NumberInput(attrs={'class': 'form-control'}),
         }
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields['autobus'].queryset = Autobus.objects.all()
         self.fields['ruta'].queryset = Ruta.objects.all()
-        self.fields['conductor'].queryset = Empleado.objects.all()
+        # Respeta el limit_choices_to del modelo: solo conductores
+        self.fields['conductor'].queryset = Empleado.objects.filter(puesto='conductor')
+        # Si se deja vacía se calcula con la duración de la ruta
+        self.fields['fecha_llegada_estimada'].required = False
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        ruta = cleaned_data.get('ruta')
+        salida = cleaned_data.get('fecha_salida')
+        if not cleaned_data.get('fecha_llegada_estimada') and 'fecha_llegada_estimada' not in self.errors:
+            if ruta and salida and ruta.duracion_estimada is not None:
+                cleaned_data['fecha_llegada_estimada'] = salida + ruta.duracion_estimada
+            elif ruta and salida:
+                self.add_error('fecha_llegada_estimada', 'La ruta no tiene duración estimada; indica la hora de llegada.')
+            else:
+                self.add_error('fecha_llegada_estimada', self.fields['fecha_llegada_estimada'].error_messages['required'])
+        self.validar_horario(cleaned_data)
+        self.validar_capacidad(cleaned_data)
+        return cleaned_data
+
+    def validar_capacidad(self, cleaned_data):
+        """Un autobús nuevo tiene que tener lugar para los asientos ya vendidos."""
+        autobus = cleaned_data.get('autobus')
+        if not autobus or not self.instance.pk or autobus.pk == self.instance.autobus_id:
+            return
+        ultimo = ultimo_ocupado(self.instance.ocupacion)
+        if autobus.capacidad < ultimo:
+            self.add_error('autobus', f'El autobús tiene {autobus.capacidad} asientos y el viaje '
+                                      f'ya tiene vendido el asiento {ultimo}.')
+
+    def save(self, commit=True):
+        viaje = super().save(commit=False)
+        if commit:
+            with transaction.atomic():
+                ajustar_a_autobus(viaje)
+                viaje.save()
+                self._save_m2m()
+        return viaje
+
+    def validar_horario(self, cleaned_data):
+        """El autobús y el conductor no pueden estar en otro viaje a la misma hora."""
+        salida = cleaned_data.get('fecha_salida')
+        llegada = cleaned_data.get('fecha_llegada_estimada')
+        if not salida or not llegada or cleaned_data.get('estado') == 'cancelado':
+            return
+        if llegada <= salida:
+            self.add_error('fecha_llegada_estimada', 'La llegada debe ser posterior a la salida.')
+            return
+        if llegada - salida > horarios.duracion_maxima():
+            self.add_error('fecha_llegada_estimada',
+                           f'Un viaje no puede durar más de {formatear(horarios.duracion_maxima())}.')
+            return
+
+        autobus, conductor = cleaned_data.get('autobus'), cleaned_data.get('conductor')
+        choques = horarios.conflictos(salida, llegada,
+                                      autobus_id=autobus.pk if autobus else None,
+                                      conductor_id=conductor.pk if conductor else None,
+                                      excluir=self.instance.pk)
+        for campo, sujeto in (('autobus', 'El autobús'), ('conductor', 'El conductor')):
+            for viaje in choques[campo]:
+                self.add_error(campo, f'{sujeto} ya tiene el viaje {etiqueta_horario(viaje)} en ese horario.')
+
+class PlantillaHorarioForm(ModelForm):
+    dias_semana = forms.MultipleChoiceField(
+        choices=PlantillaHorario.DIAS_SEMANA, label='Días de la semana',
+        widget=forms.CheckboxSelectMultiple(attrs={'class': 'form-check-input'}))
+    
+    class Meta:
+        model = PlantillaHorario
+        fields = '__all__'
+        widgets = {
+            'nombre': forms.TextInput(attrs={'class': 'form-control'}),
+            'ruta': forms.Select(attrs={'class': 'form-control'}),
+            'autobus': forms.Select(attrs={'class': 'form-control'}),
+            'conductor': forms.Select(attrs={'class': 'form-control'}),
+            'horas_salida': forms.TextInput(attrs={'class': 'form-control', 'placeholder': '06:00, 14:30'}),
+            'fecha_inicio': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}, format='%Y-%m-%d'),
+            'fecha_fin': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}, format='%Y-%m-%d'),
+            'activa': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+        }
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # En el modelo los días son un texto de dígitos ("01234")
+        self.initial['dias_semana'] = list(self.initial.get('dias_semana') or '')
+    
+    def clean_dias_semana(self):
+        return ''.join(sorted(self.cleaned_data['dias_semana']))
+    
+    def clean_horas_salida(self):
+        # Se guardan normalizadas: "6:00,14:30, 06:00" -> "06:00, 14:30"
+        try:
+            horas = leer_horas(self.cleaned_data['horas_salida'])
+        except ValueError:
+            return self.cleaned_data['horas_salida']  # el modelo reporta el error
+        return ', '.join(hora.strftime('%H:%M') for hora in horas)
+
+def etiqueta_viaje(viaje):
+    return f"{viaje.ruta} - {timezone.localtime(viaje.fecha_salida).strftime('%d/%m/%Y %H:%M')} ({viaje.get_estado_display()})"
+
+def etiqueta_horario(viaje):
+    """Texto de un viaje de ``horarios.conflictos`` (un diccionario, no el modelo)."""
+    salida, llegada = timezone.localtime(viaje['fecha_salida']), timezone.localtime(viaje['fecha_llegada_estimada'])
+    formato_llegada = '%H:%M' if llegada.date() == salida.date() else '%d/%m/%Y %H:%M'
+    salida, llegada = salida.strftime('%d/%m/%Y %H:%M'), llegada.strftime(formato_llegada)
+    return f"{viaje['id']} ({viaje['ruta__origen']} → {viaje['ruta__destino']}, {salida}–{llegada})"
+
+def etiqueta_choque(choque):
+    """Texto de un choque de ``plantillas.generar``."""
+    # Sin id: choca con otra salida de la misma plantilla creada en esa pasada
+    partes = []
+    for recurso, sujeto in (('autobus', 'el autobús'), ('conductor', 'el conductor')):
+        if recurso in choque:
+            otro = f'el viaje {choque[recurso]}' if choque[recurso] else 'otra salida de la plantilla'
+            partes.append(f'{sujeto} ya tiene {otro}')
+    return f"{timezone.localtime(choque['salida']).strftime('%d/%m/%Y %H:%M')}: {' y '.join(partes)}"
+
+def etiqueta_pasajero(pasajero):
+    return f"{pasajero.nombre} {pasajero.apellido}"
+
+class SelectorBusqueda(forms.Select):
+    """Select que solo renderiza la opción elegida.
+
+    Las demás opciones se cargan desde ``url_busqueda`` con el buscador de
+    ``includes/buscador.html``, así que no se recorre la tabla completa al
+    mostrar el formulario.
+    """
+    def __init__(self, url_busqueda, attrs=None):
+        super().__init__(attrs)
+        self.url_busqueda = url_busqueda
+    
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs']['data-url-busqueda'] = reverse(self.url_busqueda)
+        return context
+    
+    def optgroups(self, name, value, attrs=None):
+        field = self.choices.field
+        seleccionados = [v for v in value if v not in ('', None)]
+        opciones = [('', field.empty_label or '')]
+        if seleccionados:
+            opciones += [(obj.pk, field.label_from_instance(obj))
+                         for obj in field.queryset.filter(pk__in=seleccionados)]
+        self.choices = opciones
+        return super().optgroups(name, value, attrs)
 
 class BoletoForm(ModelForm):
     class Meta:
         model = Boleto
         fields = ['viaje', 'pasajero', 'asiento_numero', 'precio', 'estado']
         widgets = {
-            'viaje': forms.Select(attrs={'class': 'form-control'}),
-            'pasajero': forms.Select(attrs={'class': 'form-control'}),
+            'viaje': SelectorBusqueda('api_buscar_viajes', attrs={'class': 'form-control'}),
+            'pasajero': SelectorBusqueda('api_buscar_pasajeros', attrs={'class': 'form-control'}),
             'asiento_numero': forms.NumberInput(attrs={'class': 'form-control'}),
             'precio': forms.NumberInput(attrs={'class': 'form-control'}),
             'estado': forms.Select(attrs={'class': 'form-control'}),
@@ -95,21 +296,13 @@ class BoletoForm(ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         
-        # VIAJES: Mostrar todos con formato amigable
-        viajes_opciones = []
-        for viaje in Viaje.objects.all():
-            texto = f"{viaje.ruta} - {viaje.fecha_salida.strftime('%d/%m/%Y %H:%M')} ({viaje.get_estado_display()})"
-            viajes_opciones.append((viaje.id, texto))
-        
-        self.fields['viaje'].choices = [('', 'Selecciona un viaje...')] + viajes_opciones
-        
-        # PASAJEROS: Mostrar todos
-        pasajeros_opciones = []
-        for pasajero in Pasajero.objects.all():
-            texto = f"{pasajero.nombre} {pasajero.apellido}"
-            pasajeros_opciones.append((pasajero.id, texto))
-        
-        self.fields['pasajero'].choices = [('', 'Selecciona un pasajero...')] + pasajeros_opciones
+        # Las opciones se buscan por AJAX; al validar, ModelChoiceField solo
+        # hace una consulta por clave primaria sobre estos querysets
+        self.fields['viaje'].queryset = Viaje.objects.select_related('ruta', 'autobus')
+        self.fields['viaje'].label_from_instance = etiqueta_viaje
+        self.fields['viaje'].empty_label = 'Selecciona un viaje...'
+        self.fields['pasajero'].label_from_instance = etiqueta_pasajero
+        self.fields['pasajero'].empty_label = 'Selecciona un pasajero...'
     
     def clean(self):
         cleaned_data = super().clean()
@@ -117,18 +310,21 @@ class BoletoForm(ModelForm):
         asiento_numero = cleaned_data.get('asiento_numero')
         
         if viaje and asiento_numero:
+            mapa = MapaAsientos.de_viaje(viaje)
             # Validar que el asiento esté en rango
-            if asiento_numero < 1 or asiento_numero > viaje.autobus.capacidad:
+            if not mapa.valido(asiento_numero):
                 self.add_error('asiento_numero', 
-                    f'El autobús solo tiene capacidad para {viaje.autobus.capacidad} asientos')
+                    f'El autobús solo tiene capacidad para {mapa.capacidad} asientos')
             
-            # Validar que el asiento no esté ocupado
-            if Boleto.objects.filter(viaje=viaje, asiento_numero=asiento_numero).exists():
-                # Excluir el boleto actual si estamos editando
-                if self.instance and self.instance.pk:
-                    if not Boleto.objects.filter(viaje=viaje, asiento_numero=asiento_numero).exclude(pk=self.instance.pk).exists():
-                        return cleaned_data
-                self.add_error('asiento_numero', f'El asiento {asiento_numero} ya está ocupado')
+            # Validar que el asiento no esté ocupado (con el mapa del viaje,
+            # sin consultar los boletos). Si estamos editando, el asiento
+            # actual del boleto no cuenta como ocupado.
+            elif mapa.ocupado(asiento_numero):
+                mismo = (self.instance.pk and self.instance.viaje_id == viaje.pk
+                         and self.instance.asiento_numero == asiento_numero
+                         and self.instance.estado != 'cancelado')
+                if not mismo:
+                    self.add_error('asiento_numero', f'El asiento {asiento_numero} ya está ocupado')
         
         return cleaned_data
     
@@ -137,7 +333,7 @@ class BoletoForm(ModelForm):
         
         # Generar código automático si no tiene
         if not instance.codigo_boleto:
-            instance.codigo_boleto = f"B{str(uuid.uuid4())[:8].upper()}"
+            instance.codigo_boleto = generar_codigo()
         
         # NOTA: No usamos fecha_pago porque no existe en el modelo
         # Si necesitas registrar cuando se paga, podrías:
@@ -145,5 +341,7 @@ class BoletoForm(ModelForm):
         # 2. O agregar un campo fecha_pago al modelo después
         
         if commit:
-            instance.save()
+            # Reserva el asiento y guarda el boleto en una sola transacción;
+            # puede lanzar AsientoNoDisponible si otro empleado lo vendió antes
+            guardar_boleto(instance)
         return instance
\ No newline at end of file
@@ -0,0 +1,123 @@
+"""Caché de fragmentos de los listados: filas por versión y tablas por generación.
+
+Cada fila se guarda con una clave que incluye el modelo, la llave primaria y
+la ``fecha_actualizacion`` del objeto y de los relacionados que muestra (el
+viaje y la ruta de un boleto, por ejemplo). Guardar un objeto cambia su
+fecha, así que su fila vieja ya no se vuelve a leer: al editar un boleto
+solo se renderiza esa fila. Las filas de una tabla se leen con un solo
+``get_many``.
+
+La tabla completa se guarda por URL junto con la generación de los modelos
+que muestra la vista: los sellos de ``versiones.py``, que las señales de
+guardado y borrado renuevan. Si la generación ya no coincide, la tabla se
+vuelve a armar con las filas en caché y la entrada se reemplaza, así que hay
+una sola por URL y no una por cada cambio. Una petición que lee de una
+réplica no usa esta caché: los sellos son de la principal y la tabla armada
+con datos atrasados quedaría guardada con una generación que no es la suya.
+Las filas sí, porque su clave sale de las fechas que se leyeron.
+
+Ninguna clave depende del proceso (las fechas vienen de la base y los sellos
+de la caché default), por eso la caché de fragmentos puede ser local a cada
+proceso aunque haya varios.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .enrutador import lee_de_replica
+
+PREFIJO = 'fragmento'
+
+
+def _cache():
+    return caches[getattr(settings, 'FRAGMENTOS_CACHE_ALIAS', 'fragmentos')]
+
+
+def _timeout():
+    return getattr(settings, 'FRAGMENTOS_TIMEOUT', 3600)
+
+
+def activos():
+    return getattr(settings, 'FRAGMENTOS_ACTIVOS', True)
+
+
+def _resumen(*partes):
+    texto = '|'.join([getattr(settings, 'VERSION_DESPLIEGUE', ''), *map(str, partes)])
+    return hashlib.md5(texto.encode()).hexdigest()
+
+
+# ========== FILAS ==========
+def _marca(fecha):
+    # Microsegundos: con miles de filas, formatear o hashear cada fecha se nota
+    return int(fecha.timestamp() * 10 ** 6) if fecha else 0
+
+
+def version(objeto, relaciones=()):
+    """Marcas de ``fecha_actualizacion`` del objeto y de cada relación (``'viaje.ruta'``) que muestra la fila."""
+    marcas = [_marca(objeto.fecha_actualizacion)]
+    for relacion in relaciones:
+        actual = objeto
+        for campo in relacion.split('.'):
+            actual = getattr(actual, campo)
+            if actual is None:
+                break
+        marcas.append(_marca(actual and actual.fecha_actualizacion))
+    return marcas
+
+
+def _prefijo_filas(plantilla):
+    return f'{PREFIJO}:fila:{_resumen(plantilla)}'
+
+
+def _clave_fila(prefijo, objeto, relaciones):
+    marcas = '-'.join(map(str, version(objeto, relaciones)))
+    return f'{prefijo}:{objeto._meta.label_lower}:{objeto.pk}:{marcas}'
+
+
+def clave_fila(plantilla, objeto, relaciones=()):
+    return _clave_fila(_prefijo_filas(plantilla), objeto, relaciones)
+
+
+def filas(objetos, render, plantilla, relaciones=()):
+    """HTML de la fila de cada objeto, en orden.
+
+    ``render(objeto)`` arma las filas que no están en caché; las nuevas se
+    guardan con un solo ``set_many``.
+    """
+    if not activos():
+        return [render(objeto) for objeto in objetos]
+    cache = _cache()
+    prefijo = _prefijo_filas(plantilla)
+    claves = [_clave_fila(prefijo, objeto, relaciones) for objeto in objetos]
+    guardadas = cache.get_many(claves)
+    nuevas, resultado = {}, []
+    for clave, objeto in zip(claves, objetos):
+        html = guardadas.get(clave)
+        if html is None:
+            html = nuevas[clave] = render(objeto)
+        resultado.append(html)
+    if nuevas:
+        cache.set_many(nuevas, _timeout())
+    return resultado
+
+
+# ========== TABLAS ==========
+def tabla(nombre, ruta, sellos, render):
+    """HTML de la tabla ``nombre`` en la URL ``ruta``.
+
+    ``sellos`` es la generación de los modelos que muestra la página;
+    ``render()`` arma la tabla cuando cambió alguno.
+    """
+    if not activos() or lee_de_replica():
+        return render()
+    cache = _cache()
+    clave = f'{PREFIJO}:tabla:{nombre}:{_resumen(ruta)}'
+    generacion = _resumen(*sellos)
+    guardada = cache.get(clave)
+    if guardada is not None and guardada[0] == generacion:
+        return guardada[1]
+    html = render()
+    # Con los sellos leídos antes de armarla: si algo cambia mientras tanto, la siguiente petición no coincide
+    cache.set(clave, (generacion, html), _timeout())
+    return html
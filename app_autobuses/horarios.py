@@ -0,0 +1,139 @@
+"""Choques de horario: un autobús o un conductor en dos viajes a la vez.
+
+Dos viajes chocan si comparten autobús (o conductor) y sus intervalos
+``[fecha_salida, fecha_llegada_estimada)`` se enciman; los cancelados no
+cuentan. Hay dos formas de buscarlos:
+
+* ``conflictos``: los viajes que chocan con uno solo (al crearlo o
+  editarlo). Usa los índices parciales (autobús, salida) y (conductor,
+  salida); para que el rango de salidas tenga límite inferior, ningún viaje
+  puede durar más de ``HORARIOS_DURACION_MAXIMA_HORAS``, así que basta mirar
+  las salidas entre ``salida - duración máxima`` y ``llegada``.
+* ``solapamientos``: todos los choques del horario con una línea de barrido.
+  Los viajes se leen una vez ordenados por salida (índice
+  ``viaje_salida_vigente_idx``) y por cada autobús y conductor se guarda un
+  montículo con las llegadas de los viajes todavía en curso: O(n log n) más
+  el número de choques encontrados.
+
+``Agenda`` aplica el mismo barrido a un solo autobús o conductor para
+revisar muchas salidas nuevas de una vez (``plantillas.py``).
+"""
+import heapq
+import itertools
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+
+from .models import Viaje
+
+Choque = namedtuple('Choque', 'recurso recurso_id viaje otro')
+Intervalo = namedtuple('Intervalo', 'viaje_id salida llegada')
+
+RECURSOS = ('autobus', 'conductor')
+CAMPOS = ('id', 'ruta__origen', 'ruta__destino', 'fecha_salida', 'fecha_llegada_estimada')
+
+
+def duracion_maxima():
+    return timedelta(hours=getattr(settings, 'HORARIOS_DURACION_MAXIMA_HORAS', 72))
+
+
+def _vigentes():
+    return Viaje.objects.exclude(estado='cancelado')
+
+
+# ========== UN VIAJE ==========
+def conflictos(salida, llegada, autobus_id=None, conductor_id=None, excluir=None, limite=5):
+    """Viajes que chocan con ``[salida, llegada)``: ``{'autobus': [...], 'conductor': [...]}``.
+
+    Cada viaje es un diccionario con ``CAMPOS``; ``excluir`` es el id del
+    viaje que se está editando.
+    """
+    en_rango = _vigentes().filter(
+        fecha_salida__gt=salida - duracion_maxima(),
+        fecha_salida__lt=llegada,
+        fecha_llegada_estimada__gt=salida,
+    )
+    if excluir is not None:
+        en_rango = en_rango.exclude(pk=excluir)
+
+    encontrados = {}
+    for recurso, recurso_id in (('autobus', autobus_id), ('conductor', conductor_id)):
+        if recurso_id is None:
+            encontrados[recurso] = []
+            continue
+        encontrados[recurso] = list(
+            en_rango.filter(**{f'{recurso}_id': recurso_id})
+            .order_by('fecha_salida')
+            .values(*CAMPOS)[:limite]
+        )
+    return encontrados
+
+
+# ========== VARIAS SALIDAS NUEVAS ==========
+class Agenda:
+    """Viajes de un autobús o conductor para revisar salidas nuevas en orden.
+
+    Las salidas se consultan de menor a mayor y con llegadas también
+    crecientes (por ejemplo, todas de la misma ruta); cada viaje se agrega y
+    se descarta una sola vez, así que revisar n salidas contra m viajes
+    cuesta O((n + m) log m).
+    """
+    def __init__(self, intervalos):
+        self._pendientes = iter(intervalos)  # Intervalo ordenados por salida
+        self._siguiente = next(self._pendientes, None)
+        self._en_curso = []
+        self._orden = itertools.count()  # desempate: las salidas nuevas aún no tienen id
+
+    @classmethod
+    def de(cls, recurso, recurso_id, desde, hasta):
+        """Viajes vigentes del recurso que siguen en curso en ``[desde, hasta)``."""
+        filas = (_vigentes()
+                 .filter(**{f'{recurso}_id': recurso_id},
+                         fecha_salida__gt=desde - duracion_maxima(), fecha_salida__lt=hasta,
+                         fecha_llegada_estimada__gt=desde)
+                 .order_by('fecha_salida')
+                 .values_list('id', 'fecha_salida', 'fecha_llegada_estimada'))
+        # Lista completa: quien la usa inserta viajes mientras la recorre
+        return cls([Intervalo(*fila) for fila in filas])
+
+    def choque(self, salida, llegada):
+        """Un viaje que se encima con ``[salida, llegada)`` o ``None``."""
+        while self._siguiente is not None and self._siguiente.salida < llegada:
+            self.agregar(self._siguiente)
+            self._siguiente = next(self._pendientes, None)
+        while self._en_curso and self._en_curso[0][0] <= salida:
+            heapq.heappop(self._en_curso)
+        return self._en_curso[0][2] if self._en_curso else None
+
+    def agregar(self, intervalo):
+        heapq.heappush(self._en_curso, (intervalo.llegada, next(self._orden), intervalo))
+
+
+# ========== TODO EL HORARIO ==========
+def solapamientos(desde=None, hasta=None):
+    """Genera un ``Choque`` por cada par de viajes que comparten autobús o conductor a la vez.
+
+    ``viaje`` es el que sale primero. Con ``desde``/``hasta`` solo se revisan
+    los viajes que salen en ese rango.
+    """
+    viajes = _vigentes().order_by('fecha_salida', 'id')
+    if desde is not None:
+        viajes = viajes.filter(fecha_salida__gte=desde)
+    if hasta is not None:
+        viajes = viajes.filter(fecha_salida__lt=hasta)
+
+    # (recurso, id) -> montículo de (llegada, Intervalo) de los viajes en curso
+    en_curso = defaultdict(list)
+    filas = viajes.values_list('id', 'fecha_salida', 'fecha_llegada_estimada', *(f'{r}_id' for r in RECURSOS))
+    for viaje_id, salida, llegada, *recursos in filas.iterator():
+        actual = Intervalo(viaje_id, salida, llegada)
+        for recurso, recurso_id in zip(RECURSOS, recursos):
+            activos = en_curso[recurso, recurso_id]
+            # Los que ya llegaron no pueden chocar con este ni con los siguientes
+            while activos and activos[0][0] <= salida:
+                heapq.heappop(activos)
+            for _, anterior in activos:
+                yield Choque(recurso, recurso_id, anterior, actual)
+            if llegada > salida:
+                heapq.heappush(activos, (llegada, actual))
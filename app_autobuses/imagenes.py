@@ -0,0 +1,161 @@
+"""Fotos de autobuses y empleados: nombres por contenido y miniaturas.
+
+El original se guarda como ``<carpeta>/<hh>/<sha256>.<ext>``, así que dos
+subidas idénticas terminan en el mismo archivo y se guarda solo una vez.
+Las miniaturas (JPEG y WebP) se generan fuera de la petición en un grupo de
+hilos, después de confirmarse la transacción, y se guardan junto con sus
+dimensiones en los campos ``miniatura*`` del modelo.
+"""
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.utils import timezone
+
+from . import versiones
+
+logger = logging.getLogger(__name__)
+
+CARPETA_MINIATURAS = 'miniaturas'
+PATRON_CONTENIDO = re.compile(r'^\w+/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$')
+
+
+def _tamano_miniatura():
+    return getattr(settings, 'IMAGENES_TAMANO_MINIATURA', 160)
+
+
+# ========== ALMACENAMIENTO ==========
+class AlmacenamientoPorContenido(FileSystemStorage):
+    """Si el nombre ya existe es el mismo contenido: no se vuelve a escribir."""
+
+    def save(self, name, content, max_length=None):
+        if name and PATRON_CONTENIDO.match(name.replace(os.sep, '/')) and self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+
+_almacenamiento = AlmacenamientoPorContenido()
+
+
+def almacenamiento():
+    """Se usa como ``storage=`` de los campos de imagen (callable para las migraciones)."""
+    return _almacenamiento
+
+
+def ruta_por_contenido(carpeta, archivo, nombre_original):
+    """Nombre ``<carpeta>/<hh>/<sha256>.<ext>`` a partir del contenido del archivo."""
+    sha = hashlib.sha256()
+    for trozo in archivo.chunks():
+        sha.update(trozo)
+    archivo.seek(0)
+    extension = os.path.splitext(nombre_original)[1].lower()
+    if not re.fullmatch(r'\.\w{1,5}', extension):
+        extension = '.jpg'
+    digest = sha.hexdigest()
+    return f'{carpeta}/{digest[:2]}/{digest}{extension}'
+
+
+def es_ruta_por_contenido(nombre):
+    return bool(nombre and PATRON_CONTENIDO.match(nombre))
+
+
+def nombres_miniatura(nombre):
+    """Nombres de las variantes JPEG y WebP de un original."""
+    base = os.path.splitext(nombre)[0]
+    tamano = _tamano_miniatura()
+    return (
+        f'{CARPETA_MINIATURAS}/{base}_{tamano}.jpg',
+        f'{CARPETA_MINIATURAS}/{base}_{tamano}.webp',
+    )
+
+
+def miniatura_al_dia(instancia):
+    return bool(instancia.imagen) and instancia.miniatura.name == nombres_miniatura(instancia.imagen.name)[0]
+
+
+# ========== PROCESAMIENTO ==========
+def procesar(modelo, pk, forzar=False):
+    """Genera las miniaturas de un registro y las guarda en sus campos.
+
+    Devuelve False si el registro ya no tiene imagen o no se pudo leer.
+    """
+    from PIL import Image, ImageOps
+
+    nombre = modelo.objects.filter(pk=pk).values_list('imagen', flat=True).first()
+    if not nombre:
+        return False
+
+    storage = almacenamiento()
+    jpg, webp = nombres_miniatura(nombre)
+    tamano = _tamano_miniatura()
+
+    if not forzar and storage.exists(jpg) and storage.exists(webp):
+        with storage.open(jpg) as archivo:
+            ancho, alto = Image.open(archivo).size
+    else:
+        try:
+            with storage.open(nombre) as archivo:
+                imagen = Image.open(archivo)
+                imagen = ImageOps.exif_transpose(imagen)
+                # Recorte centrado: la tabla muestra un cuadro de tamaño fijo
+                imagen = ImageOps.fit(imagen.convert('RGB'), (tamano, tamano), Image.Resampling.LANCZOS)
+        except (OSError, ValueError) as error:
+            logger.warning('No se pudo procesar %s (%s #%s): %s', nombre, modelo.__name__, pk, error)
+            return False
+
+        ancho, alto = imagen.size
+        for variante, formato, opciones in ((jpg, 'JPEG', {'quality': 85, 'optimize': True}),
+                                            (webp, 'WEBP', {'quality': 80, 'method': 6})):
+            salida = io.BytesIO()
+            imagen.save(salida, formato, **opciones)
+            if storage.exists(variante):
+                storage.delete(variante)
+            storage.save(variante, ContentFile(salida.getvalue()))
+
+    # El filtro por imagen evita pisar los campos si se subió otra foto mientras tanto
+    if modelo.objects.filter(pk=pk, imagen=nombre).update(
+        miniatura=jpg, miniatura_webp=webp, miniatura_ancho=ancho, miniatura_alto=alto,
+        fecha_actualizacion=timezone.now(),
+    ):
+        # update() no envía señales: el listado tiene que mostrar la miniatura nueva
+        versiones.modelo_cambiado(modelo)
+    return True
+
+
+_ejecutor = None
+_candado = threading.Lock()
+
+
+def ejecutor():
+    global _ejecutor
+    with _candado:
+        if _ejecutor is None:
+            _ejecutor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGENES_HILOS', 2),
+                thread_name_prefix='imagenes',
+            )
+    return _ejecutor
+
+
+def tarea(modelo, pk, forzar=False):
+    """Envoltura para los hilos: registra errores y cierra la conexión del hilo."""
+    try:
+        return procesar(modelo, pk, forzar=forzar)
+    except Exception:
+        logger.exception('Error al generar miniaturas de %s #%s', modelo.__name__, pk)
+        return False
+    finally:
+        connection.close()
+
+
+def encolar(modelo, pk):
+    """Programa la generación de miniaturas sin bloquear la petición."""
+    return ejecutor().submit(tarea, modelo, pk)
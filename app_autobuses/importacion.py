@@ -0,0 +1,153 @@
+"""Importación masiva de pasajeros, empleados y autobuses desde CSV o JSONL.
+
+El archivo se lee fila por fila y cada fila se valida con las reglas de
+campo de los formularios existentes. Las filas válidas se insertan con
+``bulk_create`` en lotes, así que la memoria usada depende del tamaño del
+lote y no del archivo. Las filas con error se reportan y se saltan, también
+las que el módulo ``csv`` no puede leer y las que choca la base al insertar
+(una placa que otro proceso dio de alta mientras tanto). Si el archivo no es
+UTF-8 válido se reporta la fila donde falló y se deja de leer.
+"""
+import csv
+import json
+
+from django.db import IntegrityError, transaction
+
+from . import dashboard, versiones
+from .forms import AutobusForm, EmpleadoForm, PasajeroForm
+from .models import Autobus, Empleado, Pasajero
+
+RECURSOS = {
+    'pasajeros': (Pasajero, PasajeroForm),
+    'empleados': (Empleado, EmpleadoForm),
+    'autobuses': (Autobus, AutobusForm),
+}
+FORMATOS = ('csv', 'jsonl')
+LOTE = 1000
+
+
+def _formulario_importacion(form_class):
+    """Formulario sin imagen y sin la validación de unicidad por fila.
+
+    La unicidad de ``placa`` se comprueba con un conjunto en memoria en
+    lugar de hacer una consulta por fila.
+    """
+    class Meta(form_class.Meta):
+        exclude = ['imagen']
+
+    def validate_unique(self):
+        pass
+
+    return type(f'Importar{form_class.__name__}', (form_class,), {
+        'Meta': Meta,
+        'validate_unique': validate_unique,
+    })
+
+
+def _filas_jsonl(archivo):
+    for linea in archivo:
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            fila = json.loads(linea)
+        except ValueError:
+            fila = None
+        yield fila if isinstance(fila, dict) else {}
+
+
+def leer_filas(archivo, formato):
+    """Iterador de diccionarios a partir de un archivo de texto abierto.
+
+    Para CSV se devuelve el ``DictReader`` mismo y no un generador: así un
+    ``csv.Error`` en una fila no termina la lectura de las siguientes.
+    """
+    if formato == 'csv':
+        return csv.DictReader(archivo)
+    if formato == 'jsonl':
+        return _filas_jsonl(archivo)
+    raise ValueError(f'Formato no soportado: {formato}')
+
+
+def formato_de_nombre(nombre):
+    return 'jsonl' if nombre.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def importar(recurso, archivo, formato='csv', lote=LOTE, al_error=None):
+    """Importa las filas de ``archivo`` y devuelve ``{'creados': n, 'errores': n}``.
+
+    ``al_error(numero_fila, mensajes)`` se llama por cada fila rechazada;
+    los errores no se acumulan en memoria.
+    """
+    modelo, form_class = RECURSOS[recurso]
+    formulario = _formulario_importacion(form_class)
+
+    placas = None
+    if modelo is Autobus:
+        placas = set(Autobus.objects.values_list('placa', flat=True).iterator())
+
+    resumen = {'creados': 0, 'errores': 0}
+    pendientes = []
+
+    def rechazar(numero, errores):
+        resumen['errores'] += 1
+        if al_error:
+            al_error(numero, errores)
+
+    def guardar():
+        try:
+            with transaction.atomic():
+                modelo.objects.bulk_create([instancia for _, instancia in pendientes], batch_size=lote)
+            resumen['creados'] += len(pendientes)
+        except IntegrityError:
+            # Se repite el lote fila por fila para reportar solo las que chocan
+            for numero, instancia in pendientes:
+                instancia.pk = None
+                try:
+                    with transaction.atomic():
+                        modelo.objects.bulk_create([instancia])
+                except IntegrityError as e:
+                    rechazar(numero, [f'base de datos: {e}'])
+                else:
+                    resumen['creados'] += 1
+        pendientes.clear()
+
+    filas = leer_filas(archivo, formato)
+    numero = 0
+    while True:
+        numero += 1
+        try:
+            fila = next(filas)
+        except StopIteration:
+            break
+        except csv.Error as e:
+            rechazar(numero, [f'csv: {e}'])
+            continue
+        except UnicodeDecodeError:
+            rechazar(numero, ['archivo: no es texto UTF-8 válido; no se leyó el resto'])
+            break
+
+        form = formulario(data=fila)
+        if not form.is_valid():
+            errores = [f'{campo}: {" ".join(mensajes)}' for campo, mensajes in form.errors.items()]
+        elif placas is not None and form.cleaned_data['placa'] in placas:
+            errores = [f'placa: ya existe un autobús con la placa {form.cleaned_data["placa"]}']
+        else:
+            errores = None
+
+        if errores:
+            rechazar(numero, errores)
+            continue
+
+        if placas is not None:
+            placas.add(form.cleaned_data['placa'])
+        pendientes.append((numero, form.instance))
+        if len(pendientes) >= lote:
+            guardar()
+
+    if pendientes:
+        guardar()
+    if resumen['creados']:
+        dashboard.modelo_cambiado(modelo, creado=True, cantidad=resumen['creados'])
+        versiones.modelo_cambiado(modelo)
+    return resumen
@@ -0,0 +1,293 @@
+"""Medición por petición: consultas SQL, tiempo de base de datos y de plantillas.
+
+``InstrumentacionMiddleware`` instala un ``execute_wrapper`` en cada
+conexión mientras dura la petición (no depende de ``DEBUG`` ni del registro
+de consultas de Django) y con él cuenta consultas, mide su tiempo y agrupa
+las que tienen la misma huella para detectar repeticiones tipo N+1. El
+tiempo de plantillas lo mide ``PlantillasDjango``, un backend de plantillas
+que envuelve ``render``.
+
+Cada respuesta lleva un encabezado ``Server-Timing``; las peticiones más
+lentas que ``INSTRUMENTACION_LENTA_MS`` se registran como una línea JSON, y
+cada vista acumula un histograma de latencias de los últimos
+``INSTRUMENTACION_VENTANA_MINUTOS`` que se consulta en ``interno/metricas/``.
+
+Bajo ASGI el ORM de una petición corre en un hilo propio (``sync_to_async``
+con ``thread_sensitive``), así que los envoltorios se instalan y se quitan
+en las conexiones de ese hilo y no en las del bucle de eventos.
+"""
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+# Límites superiores de las cubetas del histograma, en milisegundos
+CUBETAS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+
+_medicion_actual = ContextVar('medicion_actual', default=None)
+
+
+def _lenta_ms():
+    return getattr(settings, 'INSTRUMENTACION_LENTA_MS', 500)
+
+
+def _minimo_repetidas():
+    return getattr(settings, 'INSTRUMENTACION_REPETIDAS', 3)
+
+
+def _ventana_minutos():
+    return getattr(settings, 'INSTRUMENTACION_VENTANA_MINUTOS', 15)
+
+
+# ========== HUELLAS DE CONSULTAS ==========
+_LISTA_IN = re.compile(r'\bIN \((?:%s|\?)(?:, (?:%s|\?))*\)', re.IGNORECASE)
+_NUMEROS = re.compile(r'\b\d+\b')
+_CADENAS = re.compile(r"'(?:[^']|'')*'")
+_ESPACIOS = re.compile(r'\s+')
+
+
+def huella(sql):
+    """SQL sin valores: las consultas que solo cambian de parámetros coinciden."""
+    sql = _CADENAS.sub('?', sql)
+    sql = _LISTA_IN.sub('IN (...)', sql)
+    sql = _NUMEROS.sub('?', sql)
+    return _ESPACIOS.sub(' ', sql).strip()
+
+
+class Medicion:
+    """Datos acumulados durante una petición."""
+
+    def __init__(self):
+        self.consultas = 0
+        self.tiempo_db = 0.0
+        self.tiempo_plantillas = 0.0
+        self.huellas = Counter()
+        self.exactas = Counter()
+
+    def envoltura(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tiempo_db += time.perf_counter() - inicio
+            self.consultas += 1
+            self.huellas[huella(sql)] += 1
+            self.exactas[(sql, repr(params))] += 1
+
+    def repetidas(self):
+        """Huellas ejecutadas al menos ``INSTRUMENTACION_REPETIDAS`` veces."""
+        minimo = _minimo_repetidas()
+        return [(sql, veces) for sql, veces in self.huellas.most_common() if veces >= minimo]
+
+    def duplicadas(self):
+        """Consultas idénticas, con los mismos parámetros, ejecutadas más de una vez."""
+        return sum(veces - 1 for veces in self.exactas.values() if veces > 1)
+
+
+# ========== PLANTILLAS ==========
+class PlantillaMedida(Template):
+    def render(self, context=None, request=None):
+        medicion = _medicion_actual.get()
+        inicio = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            if medicion is not None:
+                medicion.tiempo_plantillas += time.perf_counter() - inicio
+
+
+class PlantillasDjango(DjangoTemplates):
+    """El backend de Django, con el tiempo de ``render`` sumado a la medición en curso.
+
+    Solo se mide la plantilla que pide la vista; las que se incluyen o se
+    extienden se renderizan dentro de ella.
+    """
+
+    def from_string(self, template_code):
+        return PlantillaMedida(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return PlantillaMedida(super().get_template(template_name).template, self)
+
+
+# ========== HISTOGRAMA ==========
+class Histograma:
+    """Cubetas de latencia por minuto; solo se conservan los últimos minutos."""
+
+    def __init__(self):
+        self._candado = threading.Lock()
+        self._minutos = deque()  # (minuto, conteos, suma_ms, consultas)
+
+    def _recortar(self, ahora):
+        limite = ahora - _ventana_minutos()
+        while self._minutos and self._minutos[0][0] <= limite:
+            self._minutos.popleft()
+
+    def registrar(self, total_ms, consultas, minuto=None):
+        minuto = int(time.time() // 60) if minuto is None else minuto
+        with self._candado:
+            if not self._minutos or self._minutos[-1][0] != minuto:
+                self._minutos.append((minuto, [0] * len(CUBETAS_MS), [0.0], [0]))
+            _, conteos, suma, total_consultas = self._minutos[-1]
+            for i, limite in enumerate(CUBETAS_MS):
+                if total_ms <= limite:
+                    conteos[i] += 1
+                    break
+            suma[0] += total_ms
+            total_consultas[0] += consultas
+            self._recortar(minuto)
+
+    def resumen(self, minuto=None):
+        minuto = int(time.time() // 60) if minuto is None else minuto
+        with self._candado:
+            self._recortar(minuto)
+            conteos = [0] * len(CUBETAS_MS)
+            suma = consultas = 0
+            for _, conteos_minuto, suma_minuto, consultas_minuto in self._minutos:
+                for i, conteo in enumerate(conteos_minuto):
+                    conteos[i] += conteo
+                suma += suma_minuto[0]
+                consultas += consultas_minuto[0]
+        total = sum(conteos)
+        if not total:
+            return None
+
+        def percentil(fraccion):
+            # Límite superior de la cubeta donde cae el percentil
+            objetivo = fraccion * total
+            acumulado = 0
+            for limite, conteo in zip(CUBETAS_MS, conteos):
+                acumulado += conteo
+                if acumulado >= objetivo:
+                    return limite if limite != float('inf') else None
+
+        return {
+            'peticiones': total,
+            'media_ms': round(suma / total, 2),
+            'consultas_promedio': round(consultas / total, 2),
+            'p50_ms': percentil(0.50),
+            'p95_ms': percentil(0.95),
+            'p99_ms': percentil(0.99),
+            'cubetas': {('+inf' if limite == float('inf') else str(limite)): conteo
+                        for limite, conteo in zip(CUBETAS_MS, conteos)},
+        }
+
+
+_histogramas = {}
+_candado_histogramas = threading.Lock()
+
+
+def registrar(vista, total_ms, consultas):
+    with _candado_histogramas:
+        histograma = _histogramas.get(vista)
+        if histograma is None:
+            histograma = _histogramas[vista] = Histograma()
+    histograma.registrar(total_ms, consultas)
+
+
+def metricas():
+    """Resumen por vista de la ventana actual, para el endpoint interno."""
+    with _candado_histogramas:
+        vistas = list(_histogramas.items())
+    resultado = {}
+    for vista, histograma in sorted(vistas):
+        resumen = histograma.resumen()
+        if resumen:
+            resultado[vista] = resumen
+    return {'ventana_minutos': _ventana_minutos(), 'vistas': resultado}
+
+
+# ========== MIDDLEWARE ==========
+def _server_timing(medicion, total):
+    partes = [
+        f'db;dur={medicion.tiempo_db * 1000:.1f};desc="{medicion.consultas} '
+        f'{"consulta" if medicion.consultas == 1 else "consultas"}"',
+        f'plantillas;dur={medicion.tiempo_plantillas * 1000:.1f}',
+        f'total;dur={total * 1000:.1f}',
+    ]
+    repetidas = medicion.repetidas()
+    if repetidas:
+        partes.append(f'repetidas;desc="huellas={len(repetidas)} duplicadas={medicion.duplicadas()}"')
+    return ', '.join(partes)
+
+
+def _nombre_vista(request):
+    coincidencia = getattr(request, 'resolver_match', None)
+    return coincidencia.view_name if coincidencia else 'sin_ruta'
+
+
+def _instalar(pila, medicion):
+    for conexion in connections.all():
+        pila.enter_context(conexion.execute_wrapper(medicion.envoltura))
+
+
+class InstrumentacionMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        medicion = Medicion()
+        token = _medicion_actual.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            with ExitStack() as pila:
+                _instalar(pila, medicion)
+                response = self.get_response(request)
+        finally:
+            _medicion_actual.reset(token)
+        self.registrar(request, response, medicion, time.perf_counter() - inicio)
+        return response
+
+    async def __acall__(self, request):
+        medicion = Medicion()
+        token = _medicion_actual.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            pila = ExitStack()
+            await sync_to_async(_instalar)(pila, medicion)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(pila.close)()
+        finally:
+            _medicion_actual.reset(token)
+        self.registrar(request, response, medicion, time.perf_counter() - inicio)
+        return response
+
+    def registrar(self, request, response, medicion, total):
+        vista = _nombre_vista(request)
+        response['Server-Timing'] = _server_timing(medicion, total)
+        registrar(vista, total * 1000, medicion.consultas)
+
+        if total * 1000 >= _lenta_ms():
+            logger.warning(json.dumps({
+                'evento': 'peticion_lenta',
+                'vista': vista,
+                'metodo': request.method,
+                'ruta': request.path,
+                'estado': response.status_code,
+                'total_ms': round(total * 1000, 1),
+                'db_ms': round(medicion.tiempo_db * 1000, 1),
+                'plantillas_ms': round(medicion.tiempo_plantillas * 1000, 1),
+                'consultas': medicion.consultas,
+                'duplicadas': medicion.duplicadas(),
+                'repetidas': [{'huella': sql[:300], 'veces': veces} for sql, veces in medicion.repetidas()[:5]],
+            }, ensure_ascii=False))
@@ -0,0 +1,287 @@
+"""Planeador de itinerarios con transbordos sobre la red de rutas.
+
+Las rutas activas forman un grafo dirigido ``origen -> destino``. El grafo
+vive en memoria (una lista de adyacencia por ciudad, con las ciudades
+normalizadas como en ``busqueda.py``), se construye la primera vez que se
+usa y después se actualiza ruta por ruta desde las señales de ``Ruta``. Para
+que los demás procesos se enteren, cada cambio escribe una versión nueva en
+la caché y un proceso con una versión distinta reconstruye su grafo (con
+una caché compartida; con ``locmem`` cada proceso solo ve sus cambios).
+
+Hay dos búsquedas:
+
+* ``Grafo.mejor_ruta``: Dijkstra por precio, distancia o duración, con un
+  máximo de tramos. No mira horarios.
+* ``Grafo.planear_salidas``: Dijkstra dependiente del tiempo sobre los
+  viajes reales. Desde una ciudad a la que se llega a la hora ``t``, cada
+  ruta se recorre con el viaje que llega antes entre los que salen después
+  de ``t`` más el transbordo mínimo (búsqueda binaria sobre las salidas de
+  la ruta). Cada ciudad guarda las etiquetas (costo, llegada, tramos) que no
+  están dominadas, así que el resultado es óptimo aunque el criterio sea el
+  precio y no la hora de llegada.
+"""
+import heapq
+import itertools
+import threading
+import time as reloj
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .enrutador import en_primaria
+from .models import Ruta, Viaje, normalizar_lugar
+
+CLAVE_VERSION = 'itinerarios:version'
+# Para rutas sin duración registrada
+VELOCIDAD_PROMEDIO_KMH = 75
+
+CRITERIOS = ('precio', 'distancia', 'duracion')
+CRITERIOS_SALIDAS = ('llegada', 'precio', 'distancia')
+_CAMPO = {'precio': 'precio', 'distancia': 'distancia', 'duracion': 'minutos'}
+
+Arista = namedtuple('Arista', 'ruta_id origen destino distancia precio minutos')
+Salida = namedtuple('Salida', 'viaje_id salida llegada')
+
+CAMPOS_RUTA = ('pk', 'origen', 'destino', 'distancia_km', 'precio_base', 'duracion_estimada', 'activa')
+
+
+def _transbordo_minimo():
+    return timedelta(minutes=getattr(settings, 'ITINERARIOS_TRANSBORDO_MINUTOS', 30))
+
+
+def _max_tramos():
+    return getattr(settings, 'ITINERARIOS_MAX_TRAMOS', 4)
+
+
+def _horizonte():
+    return timedelta(hours=getattr(settings, 'ITINERARIOS_HORIZONTE_HORAS', 48))
+
+
+# ========== GRAFO ==========
+class Grafo:
+    def __init__(self):
+        self._candado = threading.Lock()
+        self.indices = {}    # ciudad normalizada -> nodo
+        self.nombres = []    # nodo -> nombre para mostrar
+        self.salientes = []  # nodo -> {ruta_id: Arista}
+        self.aristas = {}    # ruta_id -> Arista
+
+    @classmethod
+    def construir(cls):
+        grafo = cls()
+        # El grafo se comparte entre peticiones: se lee de la principal
+        with en_primaria():
+            for fila in Ruta.objects.filter(activa=True).values_list(*CAMPOS_RUTA).iterator():
+                grafo.poner(*fila)
+        return grafo
+
+    def nodo(self, ciudad):
+        return self.indices.get(normalizar_lugar(ciudad))
+
+    def _nodo_o_nuevo(self, ciudad):
+        clave = normalizar_lugar(ciudad)
+        nodo = self.indices.get(clave)
+        if nodo is None:
+            nodo = len(self.nombres)
+            self.nombres.append(ciudad)
+            self.salientes.append({})
+            self.indices[clave] = nodo
+        return nodo
+
+    def poner(self, ruta_id, origen, destino, distancia, precio, duracion, activa=True):
+        """Agrega, reemplaza o (si la ruta está inactiva) quita la arista de una ruta."""
+        with self._candado:
+            self._quitar(ruta_id)
+            if not activa:
+                return
+            if duracion is not None:
+                minutos = round(duracion.total_seconds() / 60)
+            else:
+                minutos = round(float(distancia) / VELOCIDAD_PROMEDIO_KMH * 60)
+            arista = Arista(ruta_id, self._nodo_o_nuevo(origen), self._nodo_o_nuevo(destino),
+                            Decimal(distancia), Decimal(precio), minutos)
+            # Se reemplaza el diccionario en lugar de modificarlo: una búsqueda
+            # en otro hilo puede estar recorriendo el anterior
+            self.salientes[arista.origen] = {**self.salientes[arista.origen], ruta_id: arista}
+            self.aristas[ruta_id] = arista
+
+    def quitar(self, ruta_id):
+        with self._candado:
+            self._quitar(ruta_id)
+
+    def _quitar(self, ruta_id):
+        arista = self.aristas.pop(ruta_id, None)
+        if arista is not None:
+            self.salientes[arista.origen] = {
+                otra: valor for otra, valor in self.salientes[arista.origen].items() if otra != ruta_id}
+
+    # ========== SIN HORARIOS ==========
+    def mejor_ruta(self, origen, destino, criterio='precio', max_tramos=None):
+        """Itinerario de menor precio, distancia o duración, o ``None`` si no hay conexión."""
+        campo = _CAMPO[criterio]
+        max_tramos = max_tramos or _max_tramos()
+        inicio, fin = self.nodo(origen), self.nodo(destino)
+        if inicio is None or fin is None or inicio == fin:
+            return None
+
+        contador = itertools.count()
+        pendientes = [(0, 0, next(contador), inicio, None)]
+        # Con límite de tramos, una etiqueta más cara solo sirve si usa menos tramos
+        menos_tramos = {}
+        while pendientes:
+            costo, tramos, _, nodo, camino = heapq.heappop(pendientes)
+            if nodo == fin:
+                return self._itinerario(camino)
+            if menos_tramos.get(nodo, max_tramos + 1) <= tramos:
+                continue
+            menos_tramos[nodo] = tramos
+            if tramos == max_tramos:
+                continue
+            for arista in self.salientes[nodo].values():
+                heapq.heappush(pendientes, (costo + getattr(arista, campo), tramos + 1, next(contador),
+                                            arista.destino, (arista, None, camino)))
+        return None
+
+    # ========== CON HORARIOS ==========
+    def _salidas(self, desde, hasta, pasajeros):
+        """Por ruta: horas de salida ordenadas y, para cada posición, el viaje que
+        llega antes entre los que salen a partir de ella."""
+        filas = (Viaje.objects
+                 .filter(fecha_salida__gte=desde, fecha_salida__lt=hasta, asientos_disponibles__gte=pasajeros)
+                 .exclude(estado='cancelado')
+                 .order_by('fecha_salida')
+                 .values_list('ruta_id', 'id', 'fecha_salida', 'fecha_llegada_estimada'))
+        por_ruta = defaultdict(list)
+        for ruta_id, viaje_id, salida, llegada in filas.iterator():
+            if ruta_id in self.aristas:
+                por_ruta[ruta_id].append(Salida(viaje_id, salida, llegada))
+
+        resultado = {}
+        for ruta_id, salidas in por_ruta.items():
+            mejores = salidas[:]
+            for i in range(len(salidas) - 2, -1, -1):
+                if mejores[i + 1].llegada < mejores[i].llegada:
+                    mejores[i] = mejores[i + 1]
+            resultado[ruta_id] = ([salida.salida for salida in salidas], mejores)
+        return resultado
+
+    def planear_salidas(self, origen, destino, desde, criterio='llegada', max_tramos=None,
+                        transbordo=None, horizonte=None, pasajeros=1):
+        """Itinerario con viajes reales que salen a partir de ``desde``.
+
+        ``criterio`` es ``llegada`` (la más temprana), ``precio`` o
+        ``distancia``; los empates se resuelven por la hora de llegada.
+        """
+        campo = None if criterio in ('llegada', 'duracion') else _CAMPO[criterio]
+        max_tramos = max_tramos or _max_tramos()
+        transbordo = _transbordo_minimo() if transbordo is None else transbordo
+        inicio, fin = self.nodo(origen), self.nodo(destino)
+        if inicio is None or fin is None or inicio == fin:
+            return None
+        salidas = self._salidas(desde, desde + (horizonte or _horizonte()), pasajeros)
+
+        contador = itertools.count()
+        pendientes = [(0, desde, 0, next(contador), inicio, None)]
+        etiquetas = defaultdict(list)  # nodo -> [(costo, llegada, tramos)] no dominadas
+        while pendientes:
+            costo, llegada, tramos, _, nodo, camino = heapq.heappop(pendientes)
+            if any(c <= costo and l <= llegada and t <= tramos for c, l, t in etiquetas[nodo]):
+                continue
+            etiquetas[nodo].append((costo, llegada, tramos))
+            if nodo == fin:
+                return self._itinerario(camino)
+            if tramos == max_tramos:
+                continue
+            listo = llegada if camino is None else llegada + transbordo
+            for arista in self.salientes[nodo].values():
+                horario = salidas.get(arista.ruta_id)
+                if horario is None:
+                    continue
+                horas, mejores = horario
+                posicion = bisect_left(horas, listo)
+                if posicion == len(horas):
+                    continue
+                viaje = mejores[posicion]
+                nuevo_costo = costo + getattr(arista, campo) if campo else 0
+                heapq.heappush(pendientes, (nuevo_costo, viaje.llegada, tramos + 1, next(contador),
+                                            arista.destino, (arista, viaje, camino)))
+        return None
+
+    # ========== RESULTADO ==========
+    def _itinerario(self, camino):
+        pasos = []
+        while camino is not None:
+            arista, viaje, camino = camino
+            pasos.append((arista, viaje))
+        pasos.reverse()
+
+        tramos = []
+        for arista, viaje in pasos:
+            tramo = {
+                'ruta': arista.ruta_id,
+                'origen': self.nombres[arista.origen],
+                'destino': self.nombres[arista.destino],
+                'distancia_km': arista.distancia,
+                'precio': arista.precio,
+                'minutos': arista.minutos,
+            }
+            if viaje is not None:
+                tramo.update(viaje=viaje.viaje_id, salida=viaje.salida, llegada=viaje.llegada)
+            tramos.append(tramo)
+
+        itinerario = {
+            'tramos': tramos,
+            'transbordos': len(tramos) - 1,
+            'precio': sum(tramo['precio'] for tramo in tramos),
+            'distancia_km': sum(tramo['distancia_km'] for tramo in tramos),
+            'minutos': sum(tramo['minutos'] for tramo in tramos),
+        }
+        if pasos[0][1] is not None:
+            itinerario['salida'] = tramos[0]['salida']
+            itinerario['llegada'] = tramos[-1]['llegada']
+            itinerario['minutos'] = round((itinerario['llegada'] - itinerario['salida']).total_seconds() / 60)
+        return itinerario
+
+
+# ========== GRAFO DEL PROCESO ==========
+_grafo = None
+_version = None
+_candado = threading.Lock()
+
+
+def grafo():
+    """El grafo de este proceso; se reconstruye si otro proceso cambió alguna ruta."""
+    global _grafo, _version
+    version = cache.get(CLAVE_VERSION)
+    with _candado:
+        if _grafo is None or version != _version:
+            _grafo = Grafo.construir()
+            _version = version
+        return _grafo
+
+
+def _aplicar_cambio(ruta_id):
+    global _version
+    fila = Ruta.objects.filter(pk=ruta_id).values_list(*CAMPOS_RUTA).first()
+    anterior = cache.get(CLAVE_VERSION)
+    nueva = reloj.time_ns()
+    with _candado:
+        if _grafo is not None:
+            if fila:
+                _grafo.poner(*fila)
+            else:
+                _grafo.quitar(ruta_id)
+            # Si este proceso ya iba atrasado, se deja así para que reconstruya
+            if _version == anterior:
+                _version = nueva
+        cache.set(CLAVE_VERSION, nueva, None)
+
+
+def ruta_cambiada(ruta_id):
+    """Actualiza la arista de la ruta al confirmarse la transacción."""
+    transaction.on_commit(lambda: _aplicar_cambio(ruta_id))
@@ -0,0 +1,201 @@
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.test.utils import override_settings
+
+from app_autobuses.benchmark import percentiles
+from app_autobuses.management.commands.benchmark_vistas import casos
+
+# Vistas con versión async (views.py, sección ASGI)
+VISTAS = (
+    'index', 'autobus_listar', 'ruta_listar', 'empleado_listar', 'pasajero_listar', 'viaje_listar',
+    'boleto_listar', 'api_buscar_viajes', 'api_buscar_pasajeros', 'api_mapa_asientos', 'api_validar_boleto',
+)
+
+# Servidor y vistas de cada modo; asgi_sync separa el efecto del servidor del de las vistas async
+MODOS = {
+    'wsgi': {'SISTEMA_ASGI': '0', 'SISTEMA_VISTAS_ASYNC': '0'},
+    'asgi_sync': {'SISTEMA_ASGI': '1', 'SISTEMA_VISTAS_ASYNC': '0'},
+    'asgi': {'SISTEMA_ASGI': '1', 'SISTEMA_VISTAS_ASYNC': '1'},
+}
+
+HOST = 'testserver'
+
+
+def _llamar_wsgi(aplicacion, url):
+    partes = urlsplit(url)
+    entorno = {
+        'REQUEST_METHOD': 'GET', 'SCRIPT_NAME': '', 'PATH_INFO': partes.path, 'QUERY_STRING': partes.query,
+        'SERVER_NAME': HOST, 'SERVER_PORT': '80', 'HTTP_HOST': HOST, 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+        'wsgi.url_scheme': 'http', 'wsgi.version': (1, 0),
+        'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+    estado = []
+    respuesta = aplicacion(entorno, lambda status, headers, exc_info=None: estado.append(status))
+    try:
+        for _ in respuesta:
+            pass
+    finally:
+        respuesta.close()
+    return int(estado[0].split()[0])
+
+
+async def _llamar_asgi(aplicacion, url):
+    partes = urlsplit(url)
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': partes.path, 'raw_path': partes.path.encode(),
+        'query_string': partes.query.encode(), 'root_path': '',
+        'headers': [(b'host', HOST.encode())], 'client': ('127.0.0.1', 0), 'server': (HOST, 80),
+    }
+    cuerpo_enviado = False
+    estado = []
+
+    async def recibir():
+        nonlocal cuerpo_enviado
+        if not cuerpo_enviado:
+            cuerpo_enviado = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # El cliente no se desconecta; Django cancela esta espera al terminar
+        await asyncio.Event().wait()
+
+    async def enviar(mensaje):
+        if mensaje['type'] == 'http.response.start':
+            estado.append(mensaje['status'])
+
+    await aplicacion(scope, recibir, enviar)
+    return estado[0]
+
+
+async def _carga(llamar, urls, clientes, segundos):
+    """``clientes`` tareas que piden las URLs en ciclo, cada una en cuanto recibe la respuesta anterior."""
+    bucle = asyncio.get_running_loop()
+    fin = bucle.time() + segundos
+    latencias, estados = [], Counter()
+
+    async def cliente(numero):
+        # Cada cliente empieza en una URL distinta para mezclar las vistas
+        for url in itertools.islice(itertools.cycle(urls), numero % len(urls), None):
+            if bucle.time() >= fin:
+                break
+            inicio = time.perf_counter()
+            try:
+                estados[await llamar(url)] += 1
+            except Exception as e:
+                estados[type(e).__name__] += 1
+                continue
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente(numero) for numero in range(clientes)))
+    # Las peticiones en curso al acabar el tiempo también cuentan
+    return latencias, estados, time.perf_counter() - inicio
+
+
+class Command(BaseCommand):
+    help = ('Compara el rendimiento (peticiones por segundo y latencia) de las páginas de lectura con WSGI '
+            'y vistas síncronas frente a ASGI con vistas async, con muchos clientes a la vez. Cada modo '
+            'corre en un proceso aparte con su configuración; úsalo sobre una copia poblada con seed_load.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modo', action='append', choices=list(MODOS),
+                            help='Modo a medir (se puede repetir); por defecto todos')
+        parser.add_argument('--clientes', type=int, default=100)
+        parser.add_argument('--segundos', type=float, default=10)
+        parser.add_argument('--hilos', type=int, default=8,
+                            help='Hilos del servidor WSGI (como los threads de gunicorn)')
+        parser.add_argument('--solo', action='append', help='Mide solo esta vista (se puede repetir)')
+        parser.add_argument('--salida', help='Guarda los resultados en JSON')
+        # Uso interno: medir un solo modo en este proceso e imprimir el JSON
+        parser.add_argument('--proceso', choices=list(MODOS), help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['clientes'] < 1 or options['segundos'] <= 0:
+            raise CommandError('--clientes y --segundos deben ser positivos')
+        if options['proceso']:
+            resultado = self.medir(options['proceso'], options)
+            self.stdout.write(json.dumps(resultado))
+            return
+
+        resultados = {}
+        for modo in options['modo'] or list(MODOS):
+            resultados[modo] = self.en_proceso(modo, options)
+            medida = resultados[modo]
+            self.stdout.write(
+                f'{modo:10} {medida["peticiones"]:6} peticiones  {medida["por_segundo"]:8.1f}/s  '
+                f'p50 {medida["p50_ms"]:8.1f}  p95 {medida["p95_ms"]:8.1f}  p99 {medida["p99_ms"]:8.1f} ms  '
+                f'estados {medida["estados"]}'
+            )
+
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump({'clientes': options['clientes'], 'segundos': options['segundos'],
+                           'hilos_wsgi': options['hilos'], 'modos': resultados}, archivo, indent=2)
+        if 'wsgi' in resultados and 'asgi' in resultados and resultados['wsgi']['por_segundo']:
+            base, asgi = resultados['wsgi']['por_segundo'], resultados['asgi']['por_segundo']
+            self.stdout.write(self.style.SUCCESS(
+                f'ASGI/WSGI con {options["clientes"]} clientes: {base} -> {asgi} peticiones/s ({asgi / base:.2f}x)'))
+
+    def en_proceso(self, modo, options):
+        """Ejecuta este comando con ``--proceso`` y la configuración del modo."""
+        argumentos = [sys.executable, '-m', 'django', 'benchmark_asgi', '--proceso', modo,
+                      '--clientes', str(options['clientes']), '--segundos', str(options['segundos']),
+                      '--hilos', str(options['hilos'])]
+        for vista in options['solo'] or []:
+            argumentos += ['--solo', vista]
+        entorno = {**os.environ, **MODOS[modo]}
+        # python -m django necesita encontrar el proyecto
+        entorno['PYTHONPATH'] = os.pathsep.join(filter(None, [str(settings.BASE_DIR), entorno.get('PYTHONPATH')]))
+        proceso = subprocess.run(argumentos, env=entorno, capture_output=True, text=True)
+        if proceso.returncode:
+            raise CommandError(f'Falló la medición de {modo}:\n{proceso.stderr[-2000:]}')
+        return json.loads(proceso.stdout.strip().splitlines()[-1])
+
+    def medir(self, modo, options):
+        urls = [url for nombre, url in casos()
+                if nombre in VISTAS and (not options['solo'] or nombre in options['solo'])]
+        if not urls:
+            raise CommandError('Ninguna vista que medir')
+
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, HOST],
+                               INSTRUMENTACION_LENTA_MS=float('inf')):
+            if modo == 'wsgi':
+                aplicacion = get_wsgi_application()
+                hilos = ThreadPoolExecutor(max_workers=options['hilos'])
+
+                async def llamar(url):
+                    return await asyncio.get_running_loop().run_in_executor(hilos, _llamar_wsgi, aplicacion, url)
+            else:
+                aplicacion = get_asgi_application()
+
+                async def llamar(url):
+                    return await _llamar_asgi(aplicacion, url)
+
+            latencias, estados, duracion = asyncio.run(
+                _carga(llamar, urls, options['clientes'], options['segundos']))
+            if modo == 'wsgi':
+                hilos.shutdown()
+
+        return {
+            'vistas_async': settings.VISTAS_ASYNC,
+            'urls': urls,
+            'peticiones': len(latencias),
+            'por_segundo': round(len(latencias) / duracion, 1),
+            'estados': {str(estado): veces for estado, veces in estados.items()},
+            **(percentiles(latencias) if latencias else {'p50_ms': 0, 'p95_ms': 0, 'p99_ms': 0, 'media_ms': 0}),
+        }
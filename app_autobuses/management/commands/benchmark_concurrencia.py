@@ -0,0 +1,201 @@
+import itertools
+import json
+import random
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from app_autobuses.asientos import MapaAsientos
+from app_autobuses.benchmark import percentiles
+from app_autobuses.models import Boleto, Pasajero, Viaje
+
+VIAJES_PARA_VENTA = 50
+
+
+def _fijar_diario(wal):
+    with connection.cursor() as cursor:
+        cursor.execute(f'PRAGMA journal_mode={"WAL" if wal else "DELETE"}')
+    connection.close()
+
+
+def _usa_wal(config):
+    return 'journal_mode=WAL' in config.get('OPTIONS', {}).get('init_command', '')
+
+
+def _aplicar_perfil(nombre):
+    """Cambia la configuración de la conexión ``default`` al perfil indicado.
+
+    Conserva el archivo de la base de datos. El modo de diario se fija de
+    forma explícita porque WAL queda guardado en el archivo.
+    """
+    perfil = settings.DATABASE_PERFILES[nombre]
+    actual = connections.settings['default']
+    connection.close()
+    # Las conexiones de cada hilo se crean a partir de este mismo diccionario
+    actual['OPTIONS'] = dict(perfil.get('OPTIONS', {}))
+    actual['CONN_MAX_AGE'] = perfil.get('CONN_MAX_AGE', 0)
+    actual['CONN_HEALTH_CHECKS'] = perfil.get('CONN_HEALTH_CHECKS', False)
+    _fijar_diario(_usa_wal(perfil))
+
+
+def _asientos_libres():
+    """Pares (viaje, asiento) libres en los próximos viajes, en orden aleatorio."""
+    viajes = (Viaje.objects.select_related('autobus', 'ruta')
+              .filter(fecha_salida__gte=timezone.now(), estado='programado', asientos_disponibles__gt=0)
+              .order_by('fecha_salida')[:VIAJES_PARA_VENTA])
+    pares = []
+    for viaje in viajes:
+        mapa = MapaAsientos.de_viaje(viaje)
+        pares.extend((viaje.pk, viaje.ruta.precio_base, asiento)
+                     for asiento in range(1, mapa.capacidad + 1) if not mapa.ocupado(asiento))
+    random.shuffle(pares)
+    return pares
+
+
+class Command(BaseCommand):
+    help = ('Mide el rendimiento de lectura mientras varios hilos venden boletos con boleto_crear, '
+            'con el perfil de base de datos de desarrollo y el de producción. '
+            'Escribe boletos en la base configurada (y los borra al final): úsalo sobre una copia '
+            'poblada con seed_load.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--perfil', choices=['desarrollo', 'produccion', 'ambos'], default='ambos')
+        parser.add_argument('--segundos', type=float, default=10)
+        parser.add_argument('--lectores', type=int, default=8)
+        parser.add_argument('--escritores', type=int, default=2)
+        parser.add_argument('--salida', help='Guarda los resultados en JSON')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Este benchmark compara perfiles de SQLite')
+        pasajeros = list(Pasajero.objects.order_by('-pk').values_list('pk', flat=True)[:1000])
+        if not pasajeros:
+            raise CommandError('No hay pasajeros; ejecuta antes seed_load')
+
+        perfiles = ['desarrollo', 'produccion'] if options['perfil'] == 'ambos' else [options['perfil']]
+        original = dict(connections.settings['default'])
+        resultados = {}
+        try:
+            for perfil in perfiles:
+                _aplicar_perfil(perfil)
+                resultados[perfil] = self.medir(perfil, pasajeros, options)
+        finally:
+            connection.close()
+            connections.settings['default'].clear()
+            connections.settings['default'].update(original)
+            _fijar_diario(_usa_wal(original))
+
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump(resultados, archivo, indent=2, ensure_ascii=False)
+        if len(resultados) == 2:
+            lectura = [resultados[p]['lecturas']['por_segundo'] for p in perfiles]
+            if lectura[0]:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Lecturas por segundo: {lectura[0]} -> {lectura[1]} ({lectura[1] / lectura[0]:.1f}x)'))
+
+    def medir(self, perfil, pasajeros, options):
+        ultimo = Boleto.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        pares = _asientos_libres()
+        if not pares:
+            raise CommandError('No hay viajes próximos con asientos libres; ejecuta antes seed_load')
+        siguiente_par = itertools.cycle(pares).__next__
+        candado = threading.Lock()
+        viaje_muestra = pares[0][0]
+        urls_lectura = [
+            reverse('index'),
+            reverse('boleto_listar'),
+            reverse('api_mapa_asientos', args=[viaje_muestra]),
+            reverse('api_buscar_viajes') + '?q=gua',
+        ]
+
+        fin = time.monotonic() + options['segundos']
+        lecturas, escrituras = [], []
+        errores = Counter()
+        estados_escritura = Counter()
+
+        def lector():
+            cliente = Client()
+            propias = []
+            try:
+                for url in itertools.cycle(urls_lectura):
+                    if time.monotonic() >= fin:
+                        break
+                    inicio = time.perf_counter()
+                    try:
+                        cliente.get(url)
+                        propias.append((time.perf_counter() - inicio) * 1000)
+                    except Exception as e:
+                        with candado:
+                            errores[f'lectura: {e}'] += 1
+            finally:
+                connection.close()
+            with candado:
+                lecturas.extend(propias)
+
+        def escritor():
+            cliente = Client()
+            propias = []
+            try:
+                while time.monotonic() < fin:
+                    with candado:
+                        viaje, precio, asiento = siguiente_par()
+                    datos = {
+                        'viaje': viaje, 'pasajero': random.choice(pasajeros),
+                        'asiento_numero': asiento, 'precio': precio, 'estado': 'pagado',
+                    }
+                    inicio = time.perf_counter()
+                    try:
+                        respuesta = cliente.post(reverse('boleto_crear'), datos)
+                        propias.append((time.perf_counter() - inicio) * 1000)
+                        # 302 = vendido; 200 = formulario con error (asiento ya tomado)
+                        with candado:
+                            estados_escritura['vendidos' if respuesta.status_code == 302 else 'rechazados'] += 1
+                    except Exception as e:
+                        with candado:
+                            errores[f'escritura: {e}'] += 1
+            finally:
+                connection.close()
+            with candado:
+                escrituras.extend(propias)
+
+        hilos = [threading.Thread(target=lector) for _ in range(options['lectores'])]
+        hilos += [threading.Thread(target=escritor) for _ in range(options['escritores'])]
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                               INSTRUMENTACION_LENTA_MS=float('inf')):
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+
+        # Deja la base como estaba
+        for boleto in Boleto.objects.filter(pk__gt=ultimo):
+            boleto.delete()
+
+        resultado = {
+            'lecturas': {
+                'total': len(lecturas),
+                'por_segundo': round(len(lecturas) / options['segundos'], 1),
+                **(percentiles(lecturas) if lecturas else {}),
+            },
+            'escrituras': {
+                'total': len(escrituras),
+                'por_segundo': round(len(escrituras) / options['segundos'], 1),
+                **dict(estados_escritura),
+                **(percentiles(escrituras) if escrituras else {}),
+            },
+            'errores': dict(errores.most_common(10)),
+        }
+        self.stdout.write(f'[{perfil}] lecturas {resultado["lecturas"]}')
+        self.stdout.write(f'[{perfil}] escrituras {resultado["escrituras"]}')
+        if errores:
+            self.stdout.write(self.style.WARNING(f'[{perfil}] {sum(errores.values())} errores: {resultado["errores"]}'))
+        return resultado
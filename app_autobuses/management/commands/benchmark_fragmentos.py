@@ -0,0 +1,76 @@
+import itertools
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from app_autobuses import fragmentos
+from app_autobuses.benchmark import percentiles
+from app_autobuses.views import _viajes
+
+PLANTILLA = 'app_autobuses/viaje/listar.html'
+
+# Qué cambia antes de cada render: (sin caché, limpiar la caché, nueva generación, filas editadas)
+ESCENARIOS = {
+    'sin_cache': (False, False, False, 0),
+    'todo_nuevo': (True, True, True, 0),
+    'una_fila': (True, False, True, 1),
+    'sin_cambios': (True, False, False, 0),
+}
+
+
+class Command(BaseCommand):
+    help = ('Mide el render del listado de viajes con N filas sin caché de fragmentos y con ella: '
+            'con la caché vacía, tras editar una fila (la tabla cambia, las demás filas siguen en caché) '
+            'y sin cambios (la tabla completa en caché). Las consultas se hacen una vez, antes de medir.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=10000)
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--salida', help='Guarda los resultados en JSON')
+
+    def handle(self, *args, **options):
+        if options['filas'] < 1 or options['repeticiones'] < 1:
+            raise CommandError('--filas y --repeticiones deben ser positivos')
+        viajes = list(_viajes()[:options['filas']])
+        if len(viajes) < options['filas']:
+            raise CommandError(f'Solo hay {len(viajes)} viajes; genera más con seed_load')
+
+        request = RequestFactory().get(reverse('viaje_listar'))
+        # Generación simulada: cada valor nuevo equivale a un cambio en algún modelo del listado
+        generaciones = itertools.count()
+        request.sellos = (next(generaciones),)
+        editadas = itertools.cycle(viajes)
+
+        resultados = {}
+        for escenario, (activos, limpiar, nueva_generacion, filas_editadas) in ESCENARIOS.items():
+            with override_settings(FRAGMENTOS_ACTIVOS=activos):
+                render_to_string(PLANTILLA, {'viajes': viajes}, request)
+                tiempos = []
+                for _ in range(options['repeticiones']):
+                    if limpiar:
+                        fragmentos._cache().clear()
+                    if nueva_generacion:
+                        request.sellos = (next(generaciones),)
+                    # Como un save(): otra fecha_actualizacion, en memoria para no escribir en la base
+                    for viaje in itertools.islice(editadas, filas_editadas):
+                        viaje.fecha_actualizacion = timezone.now()
+                    inicio = time.perf_counter()
+                    render_to_string(PLANTILLA, {'viajes': viajes}, request)
+                    tiempos.append((time.perf_counter() - inicio) * 1000)
+            resultados[escenario] = percentiles(tiempos)
+            self.stdout.write(f'{escenario:12} p50 {resultados[escenario]["p50_ms"]:9.1f} ms  '
+                              f'media {resultados[escenario]["media_ms"]:9.1f} ms')
+
+        base, una_fila = resultados['sin_cache']['p50_ms'], resultados['una_fila']['p50_ms']
+        self.stdout.write(self.style.SUCCESS(
+            f'{options["filas"]} filas, una editada: {base:.1f} -> {una_fila:.1f} ms ({base / una_fila:.1f}x)'))
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump({'filas': options['filas'], 'repeticiones': options['repeticiones'],
+                           'escenarios': resultados}, archivo, indent=2)
@@ -0,0 +1,147 @@
+import json
+from datetime import timedelta
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.urls import URLPattern, reverse
+from django.urls.converters import IntConverter
+from django.utils import timezone
+
+from app_autobuses import urls
+from app_autobuses.benchmark import comparar, medir
+from app_autobuses.exportacion import EXPORTACIONES
+from app_autobuses.models import Autobus, Boleto, Empleado, Pasajero, Ruta, Viaje
+
+# Modelo del que se toma el id para las URLs con <int:id>
+MODELOS_POR_VISTA = {
+    'autobus': Autobus,
+    'ruta': Ruta,
+    'empleado': Empleado,
+    'pasajero': Pasajero,
+    'viaje': Viaje,
+    'boleto': Boleto,
+    'api_mapa_asientos': Viaje,
+}
+
+
+def _modelo_de(nombre):
+    return MODELOS_POR_VISTA.get(nombre) or MODELOS_POR_VISTA.get(nombre.split('_')[0])
+
+
+def _consultas():
+    """Parámetros GET que representan el uso normal de algunas vistas."""
+    ultimo_boleto = Boleto.objects.order_by('-pk').values_list('codigo_boleto', flat=True).first()
+    desde = (timezone.localdate() - timedelta(days=7)).isoformat()
+    # La búsqueda de viajes se mide con la ruta y el día del próximo viaje
+    proximo = (Viaje.objects.select_related('ruta').filter(fecha_salida__gte=timezone.now())
+               .exclude(estado='cancelado').order_by('fecha_salida').first())
+    busqueda = urlencode({
+        'origen': proximo.ruta.origen, 'destino': proximo.ruta.destino,
+        'fecha': timezone.localtime(proximo.fecha_salida).date().isoformat(),
+    }) if proximo else 'origen=Tijuana&destino=Ensenada'
+    return {
+        'viaje_buscar': busqueda,
+        'api_viajes_disponibles': busqueda,
+        'api_buscar_viajes': 'q=tij',
+        'api_buscar_pasajeros': 'q=gar',
+        'api_validar_boleto': f'codigo={ultimo_boleto or ""}',
+        # Una semana: exportar la tabla completa en cada repetición no es un caso real
+        'exportar_datos': f'desde={desde}',
+    }
+
+
+def casos():
+    """Devuelve ``[(nombre, url)]`` para cada URL de ``app_autobuses/urls.py``."""
+    consultas = _consultas()
+    resultado = []
+    for patron in urls.urlpatterns:
+        if not isinstance(patron, URLPattern):
+            continue
+        nombre = patron.name
+        convertidores = patron.pattern.converters
+        variantes = [({}, nombre)]
+        for parametro, convertidor in convertidores.items():
+            if isinstance(convertidor, IntConverter):
+                modelo = _modelo_de(nombre)
+                pk = modelo.objects.order_by('-pk').values_list('pk', flat=True).first() if modelo else None
+                if pk is None:
+                    variantes = []
+                    break
+                variantes = [({**kwargs, parametro: pk}, etiqueta) for kwargs, etiqueta in variantes]
+            elif parametro == 'recurso':
+                variantes = [({**kwargs, parametro: recurso}, f'{etiqueta}[{recurso}]')
+                             for kwargs, etiqueta in variantes for recurso in EXPORTACIONES]
+        for kwargs, etiqueta in variantes:
+            url = reverse(nombre, kwargs=kwargs)
+            if nombre in consultas:
+                url = f'{url}?{consultas[nombre]}'
+            resultado.append((etiqueta, url))
+    return resultado
+
+
+class Command(BaseCommand):
+    help = ('Mide latencia (p50/p95/p99), consultas SQL y memoria pico de cada URL de la app '
+            'y la compara con una línea base en JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--calentamiento', type=int, default=2)
+        parser.add_argument('--salida', help='Guarda el resultado como nueva línea base (JSON)')
+        parser.add_argument('--base', help='Línea base JSON con la que comparar')
+        parser.add_argument('--umbral', type=float, default=0.25,
+                            help='Crecimiento tolerado del p95 y la memoria (0.25 = 25%%)')
+        parser.add_argument('--minimo-ms', type=float, default=2.0,
+                            help='Diferencia mínima de p95 en ms para contar como regresión')
+        parser.add_argument('--consultas-extra', type=int, default=0,
+                            help='Consultas adicionales toleradas por vista')
+        parser.add_argument('--solo', action='append', help='Mide solo esta vista (se puede repetir)')
+        parser.add_argument('--excluir', action='append', default=[], help='Omite esta vista')
+
+    def handle(self, *args, **options):
+        if options['repeticiones'] < 1:
+            raise CommandError('--repeticiones debe ser al menos 1')
+        base = None
+        if options['base']:
+            try:
+                with open(options['base'], encoding='utf-8') as archivo:
+                    base = json.load(archivo)['vistas']
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f'No se pudo leer la línea base: {e}')
+
+        vistas = {}
+        hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=hosts):
+            for nombre, url in casos():
+                raiz = nombre.split('[')[0]
+                if (options['solo'] and nombre not in options['solo'] and raiz not in options['solo']) \
+                        or nombre in options['excluir'] or raiz in options['excluir']:
+                    continue
+                medida = medir(url, options['repeticiones'], options['calentamiento'])
+                vistas[nombre] = medida
+                self.stdout.write(
+                    f'{nombre:32} {medida["estado"]}  p50 {medida["p50_ms"]:9.2f}  p95 {medida["p95_ms"]:9.2f}  '
+                    f'p99 {medida["p99_ms"]:9.2f} ms  {medida["consultas"]:3} consultas  '
+                    f'{medida["memoria_pico_kb"]:9.1f} KB'
+                )
+
+        if options['salida']:
+            resultado = {
+                'generado': timezone.now().isoformat(),
+                'base_de_datos': connection.vendor,
+                'registros': {modelo.__name__: modelo.objects.count()
+                              for modelo in (Autobus, Ruta, Empleado, Pasajero, Viaje, Boleto)},
+                'vistas': vistas,
+            }
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f'Línea base guardada en {options["salida"]}'))
+
+        if base is not None:
+            regresiones = comparar(base, vistas, options['umbral'], options['minimo_ms'],
+                                   options['consultas_extra'])
+            if regresiones:
+                raise CommandError(f'{len(regresiones)} regresiones:\n' + '\n'.join(regresiones))
+            self.stdout.write(self.style.SUCCESS('Sin regresiones respecto de la línea base.'))
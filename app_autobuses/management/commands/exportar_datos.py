@@ -0,0 +1,38 @@
+import sys
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app_autobuses.exportacion import EXPORTACIONES, FORMATOS, generar, validar_estado
+
+
+class Command(BaseCommand):
+    help = 'Exporta boletos, viajes o pasajeros a CSV o JSONL sin cargarlos en memoria'
+
+    def add_arguments(self, parser):
+        parser.add_argument('recurso', choices=sorted(EXPORTACIONES))
+        parser.add_argument('--formato', choices=FORMATOS, default='csv')
+        parser.add_argument('--desde', type=date.fromisoformat, help='Fecha inicial (AAAA-MM-DD)')
+        parser.add_argument('--hasta', type=date.fromisoformat, help='Fecha final, inclusive (AAAA-MM-DD)')
+        parser.add_argument('--estado')
+        parser.add_argument('--gzip', action='store_true', help='Comprimir la salida con gzip')
+        parser.add_argument('--salida', help='Archivo de salida (por defecto la salida estándar)')
+
+    def handle(self, *args, **options):
+        filtros = {clave: options[clave] for clave in ('desde', 'hasta', 'estado') if options[clave]}
+        try:
+            validar_estado(options['recurso'], options['estado'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        trozos = generar(options['recurso'], options['formato'], options['gzip'], **filtros)
+        try:
+            if options['salida']:
+                with open(options['salida'], 'wb') as destino:
+                    for trozo in trozos:
+                        destino.write(trozo)
+            else:
+                for trozo in trozos:
+                    sys.stdout.buffer.write(trozo)
+                sys.stdout.buffer.flush()
+        except OSError as e:
+            raise CommandError(f'No se pudo escribir la exportación: {e}')
@@ -0,0 +1,86 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from app_autobuses import imagenes, versiones
+from app_autobuses.models import Autobus, Empleado
+
+MODELOS = {
+    'autobuses': Autobus,
+    'empleados': Empleado,
+}
+
+
+class Command(BaseCommand):
+    help = ('Pasa las fotos existentes a nombres por contenido y genera las miniaturas '
+            'JPEG y WebP que faltan')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recurso', choices=sorted(MODELOS), action='append',
+                            help='Solo este recurso (se puede repetir); por defecto todos')
+        parser.add_argument('--hilos', type=int, default=getattr(settings, 'IMAGENES_HILOS', 2),
+                            help='Hilos para generar miniaturas')
+        parser.add_argument('--forzar', action='store_true',
+                            help='Regenera las miniaturas aunque ya existan')
+
+    def _abrir_original(self, nombre):
+        """Abre la foto desde MEDIA_ROOT o, si no está, desde las rutas anteriores."""
+        storage = imagenes.almacenamiento()
+        if storage.exists(nombre):
+            return storage.open(nombre)
+        for raiz in getattr(settings, 'IMAGENES_RUTAS_ANTERIORES', []):
+            ruta = os.path.join(raiz, nombre)
+            if os.path.isfile(ruta):
+                return open(ruta, 'rb')
+        return None
+
+    def _mover_a_contenido(self, modelo, carpeta, pk, nombre):
+        """Copia la foto a su nombre por contenido y actualiza el registro."""
+        archivo = self._abrir_original(nombre)
+        if archivo is None:
+            return None
+        with archivo:
+            original = File(archivo, name=nombre)
+            nuevo = imagenes.ruta_por_contenido(carpeta, original, nombre)
+            nuevo = imagenes.almacenamiento().save(nuevo, original)
+        if modelo.objects.filter(pk=pk, imagen=nombre).update(imagen=nuevo, fecha_actualizacion=timezone.now()):
+            versiones.modelo_cambiado(modelo)
+        return nuevo
+
+    def handle(self, *args, **options):
+        recursos = options['recurso'] or sorted(MODELOS)
+        faltantes = movidas = 0
+        pendientes = []
+
+        for recurso in recursos:
+            modelo = MODELOS[recurso]
+            registros = (modelo.objects.exclude(imagen='').exclude(imagen__isnull=True)
+                         .values_list('pk', 'imagen', 'miniatura').iterator())
+            for pk, nombre, miniatura in registros:
+                if not imagenes.es_ruta_por_contenido(nombre):
+                    nuevo = self._mover_a_contenido(modelo, recurso, pk, nombre)
+                    if nuevo is None:
+                        faltantes += 1
+                        self.stderr.write(f'{recurso} #{pk}: no se encontró {nombre}')
+                        continue
+                    movidas += 1
+                    nombre = nuevo
+                if options['forzar'] or miniatura != imagenes.nombres_miniatura(nombre)[0]:
+                    pendientes.append((modelo, pk))
+        # Los hilos abren sus propias conexiones
+        connection.close()
+
+        with ThreadPoolExecutor(max_workers=max(1, options['hilos'])) as ejecutor:
+            resultados = list(ejecutor.map(
+                lambda pendiente: imagenes.tarea(*pendiente, forzar=options['forzar']), pendientes))
+        generadas = sum(1 for resultado in resultados if resultado)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{movidas} fotos renombradas por contenido, {generadas} miniaturas generadas, '
+            f'{len(pendientes) - generadas} con error, {faltantes} fotos sin archivo.'
+        ))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app_autobuses.forms import etiqueta_choque
+from app_autobuses.models import PlantillaHorario
+from app_autobuses.plantillas import TAMANO_LOTE, PlantillaInvalida, generar
+
+
+class Command(BaseCommand):
+    help = ('Crea los viajes de las plantillas de horario. Es idempotente: las salidas que ya '
+            'existen no se duplican y las que chocan con otro viaje del autobús o del conductor '
+            'se reportan sin crearse.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('plantillas', nargs='*', type=int,
+                            help='Ids de las plantillas; sin ids se usan todas las activas')
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help='Viajes por inserción')
+        parser.add_argument('--simular', action='store_true', help='Solo muestra lo que se crearía')
+        parser.add_argument('--limite', type=int, default=20, help='Máximo de choques a listar por plantilla')
+
+    def handle(self, *args, **options):
+        plantillas = PlantillaHorario.objects.select_related('ruta', 'autobus', 'conductor')
+        if options['plantillas']:
+            plantillas = plantillas.filter(pk__in=options['plantillas'])
+            faltantes = set(options['plantillas']) - {plantilla.pk for plantilla in plantillas}
+            if faltantes:
+                raise CommandError(f'No existen las plantillas: {", ".join(map(str, sorted(faltantes)))}')
+        else:
+            plantillas = plantillas.filter(activa=True)
+
+        creados = choques = 0
+        for plantilla in plantillas:
+            try:
+                resultado = generar(plantilla, lote=options['lote'], simular=options['simular'])
+            except PlantillaInvalida as error:
+                self.stderr.write(f'{plantilla.nombre}: {error}')
+                continue
+            creados += resultado['creados']
+            choques += len(resultado['choques'])
+            self.stdout.write(f'{plantilla.nombre}: {resultado["creados"]} viajes nuevos, '
+                              f'{resultado["existentes"]} ya existían, {len(resultado["choques"])} choques')
+            for choque in resultado['choques'][:options['limite']]:
+                self.stdout.write(f'  {etiqueta_choque(choque)}')
+
+        accion = 'se crearían' if options['simular'] else 'creados'
+        estilo = self.style.WARNING if choques else self.style.SUCCESS
+        self.stdout.write(estilo(f'{creados} viajes {accion}, {choques} salidas con choques.'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app_autobuses.importacion import FORMATOS, LOTE, RECURSOS, formato_de_nombre, importar
+
+
+class Command(BaseCommand):
+    help = 'Importa pasajeros, empleados o autobuses desde un archivo CSV o JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('recurso', choices=sorted(RECURSOS))
+        parser.add_argument('archivo')
+        parser.add_argument('--formato', choices=FORMATOS,
+                            help='Por defecto se deduce de la extensión del archivo')
+        parser.add_argument('--lote', type=int, default=LOTE,
+                            help=f'Filas por inserción (por defecto {LOTE})')
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or formato_de_nombre(options['archivo'])
+
+        def al_error(numero, errores):
+            self.stderr.write(f'Fila {numero}: {"; ".join(errores)}')
+
+        try:
+            with open(options['archivo'], newline='', encoding='utf-8-sig') as archivo:
+                resumen = importar(options['recurso'], archivo, formato, options['lote'], al_error)
+        except OSError as e:
+            raise CommandError(f'No se pudo leer el archivo: {e}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{resumen["creados"]} registros importados, {resumen["errores"]} filas con errores.'
+        ))
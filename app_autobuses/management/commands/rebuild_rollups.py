@@ -0,0 +1,35 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app_autobuses.resumenes import reconstruir
+
+
+def _fecha(texto):
+    try:
+        return date.fromisoformat(texto)
+    except ValueError:
+        raise CommandError(f'Fecha inválida: {texto} (usa AAAA-MM-DD)')
+
+
+class Command(BaseCommand):
+    help = ('Recalcula los resúmenes por ruta y día (ingresos, boletos y ocupación) desde los '
+            'viajes y boletos, y corrige las filas que no coinciden')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=_fecha,
+                            help='Solo los días a partir de esta fecha (AAAA-MM-DD); sin ella, todos')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Solo cuenta las diferencias, sin guardar cambios')
+
+    def handle(self, *args, **options):
+        cambios = reconstruir(options['since'], simular=options['dry_run'])
+        total = sum(cambios.values())
+        detalle = (f'{cambios["nuevas"]} nuevas, {cambios["cambiadas"]} corregidas, '
+                   f'{cambios["sobrantes"]} sin viajes ni boletos')
+        if not total:
+            self.stdout.write(self.style.SUCCESS('Los resúmenes ya estaban al día.'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{total} filas con diferencias (sin cambios): {detalle}.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{total} filas actualizadas: {detalle}.'))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app_autobuses.estadisticas import calcular_desde_boletos
+from app_autobuses.models import EstadisticaBoleto
+
+
+class Command(BaseCommand):
+    help = 'Recalcula la tabla de estadísticas de boletos y corrige cualquier desviación'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Solo muestra las diferencias, sin guardar cambios')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            reales = calcular_desde_boletos()
+            guardadas = {
+                fila.estado: fila
+                for fila in EstadisticaBoleto.objects.select_for_update()
+            }
+
+            desviaciones = 0
+            for estado, valores in reales.items():
+                fila = guardadas.get(estado)
+                actual = (fila.cantidad, fila.total) if fila else (0, 0)
+                if actual == (valores['cantidad'], valores['total']):
+                    continue
+                desviaciones += 1
+                self.stdout.write(
+                    f'{estado}: {actual[0]} boletos / ${actual[1]} -> '
+                    f'{valores["cantidad"]} boletos / ${valores["total"]}'
+                )
+                if options['dry_run']:
+                    continue
+                EstadisticaBoleto.objects.update_or_create(
+                    estado=estado,
+                    defaults={'cantidad': valores['cantidad'], 'total': valores['total']},
+                )
+
+        if not desviaciones:
+            self.stdout.write(self.style.SUCCESS('Las estadísticas ya estaban al día.'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{desviaciones} estados con diferencias (sin cambios).'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{desviaciones} estados corregidos.'))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app_autobuses.carga import LOTE, VOLUMENES, Generador, volumenes
+
+
+class Command(BaseCommand):
+    help = ('Genera datos sintéticos en volumen (autobuses, rutas, empleados, pasajeros, '
+            'viajes y boletos) para pruebas de carga')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escala', type=float, default=1.0,
+                            help='Multiplica todos los volúmenes por defecto (p. ej. 0.01)')
+        for nombre, valor in VOLUMENES.items():
+            parser.add_argument(f'--{nombre}', type=int,
+                                help=f'Cantidad de {nombre} (por defecto {valor} por la escala)')
+        parser.add_argument('--lote', type=int, default=LOTE,
+                            help=f'Filas por inserción (por defecto {LOTE})')
+        parser.add_argument('--semilla', type=int,
+                            help='Semilla para obtener siempre los mismos datos')
+
+    def handle(self, *args, **options):
+        cantidades = volumenes(options['escala'], **{nombre: options[nombre] for nombre in VOLUMENES})
+        inicio = time.perf_counter()
+
+        def avisar(mensaje):
+            self.stdout.write(f'[{time.perf_counter() - inicio:7.1f}s] {mensaje}')
+
+        creados = Generador(options['semilla'], options['lote'], avisar).generar(cantidades)
+        resumen = ', '.join(f'{cantidad} {nombre}' for nombre, cantidad in creados.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'Creados {resumen} en {time.perf_counter() - inicio:.1f}s.'
+        ))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from app_autobuses.enrutador import _replicas
+
+
+class Command(BaseCommand):
+    help = ('Copia la base principal a las réplicas SQLite con la API de respaldo de SQLite. '
+            'Con --cada se repite cada tantos segundos, como una réplica local con retraso.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cada', type=float, help='Segundos entre copias; sin esta opción copia una vez')
+
+    def handle(self, *args, **options):
+        replicas = _replicas()
+        if not replicas:
+            raise CommandError('No hay réplicas configuradas (SISTEMA_DB_REPLICA)')
+        if any(connections[alias].vendor != 'sqlite' for alias in [DEFAULT_DB_ALIAS, *replicas]):
+            raise CommandError('Solo se copian bases SQLite; otras réplicas se sincronizan con su propio motor')
+
+        while True:
+            inicio = time.perf_counter()
+            for alias in replicas:
+                self.copiar(alias)
+            self.stdout.write(f'Réplicas al día en {(time.perf_counter() - inicio) * 1000:.0f} ms')
+            if not options['cada']:
+                break
+            time.sleep(options['cada'])
+
+    def copiar(self, alias):
+        origen, destino = connections[DEFAULT_DB_ALIAS], connections[alias]
+        origen.ensure_connection()
+        destino.ensure_connection()
+        # Copia consistente página a página, aunque la principal siga recibiendo escrituras
+        origen.connection.backup(destino.connection)
@@ -0,0 +1,66 @@
+from collections import Counter
+from datetime import date, datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from app_autobuses.horarios import solapamientos
+from app_autobuses.models import Autobus, Empleado
+
+
+def _fecha(texto):
+    try:
+        return timezone.make_aware(datetime.combine(date.fromisoformat(texto), time.min))
+    except ValueError:
+        raise CommandError(f'Fecha inválida: {texto} (usa AAAA-MM-DD)')
+
+
+class Command(BaseCommand):
+    help = ('Revisa todo el horario y reporta los viajes en los que un autobús o un conductor '
+            'está asignado a dos viajes a la vez (línea de barrido, O(n log n)).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=_fecha, help='Solo viajes que salen a partir de esta fecha (AAAA-MM-DD)')
+        parser.add_argument('--hasta', type=_fecha, help='Solo viajes que salen antes de esta fecha (AAAA-MM-DD)')
+        parser.add_argument('--limite', type=int, default=50,
+                            help='Máximo de choques a listar; el resumen los cuenta todos (0 = todos)')
+        parser.add_argument('--estricto', action='store_true',
+                            help='Termina con error si hay choques (para revisiones automáticas)')
+
+    def handle(self, *args, **options):
+        choques = []
+        por_recurso = Counter()
+        for choque in solapamientos(options['desde'], options['hasta']):
+            por_recurso[choque.recurso] += 1
+            if not options['limite'] or len(choques) < options['limite']:
+                choques.append(choque)
+
+        if not por_recurso:
+            self.stdout.write(self.style.SUCCESS('Sin choques de horario.'))
+            return
+
+        nombres = {
+            'autobus': Autobus.objects.in_bulk({c.recurso_id for c in choques if c.recurso == 'autobus'}),
+            'conductor': Empleado.objects.in_bulk({c.recurso_id for c in choques if c.recurso == 'conductor'}),
+        }
+        for choque in choques:
+            recurso = nombres[choque.recurso].get(choque.recurso_id)
+            etiqueta = (f'Autobús {recurso.placa}' if choque.recurso == 'autobus'
+                        else f'Conductor {recurso.nombre} {recurso.apellido}')
+            self.stdout.write(f'{etiqueta}: viaje {choque.viaje.viaje_id} '
+                              f'({self.intervalo(choque.viaje)}) y viaje {choque.otro.viaje_id} '
+                              f'({self.intervalo(choque.otro)})')
+
+        total = sum(por_recurso.values())
+        if len(choques) < total:
+            self.stdout.write(f'... y {total - len(choques)} más')
+        resumen = (f'{total} choques: {por_recurso["autobus"]} de autobús, '
+                   f'{por_recurso["conductor"]} de conductor.')
+        if options['estricto']:
+            raise CommandError(resumen)
+        self.stdout.write(self.style.WARNING(resumen))
+
+    def intervalo(self, viaje):
+        salida = timezone.localtime(viaje.salida).strftime('%d/%m/%Y %H:%M')
+        llegada = timezone.localtime(viaje.llegada).strftime('%d/%m/%Y %H:%M')
+        return f'{salida} - {llegada}'
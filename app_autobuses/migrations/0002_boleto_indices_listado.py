@@ -0,0 +1,25 @@
+# Generated by Django 6.0 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_autobuses', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='boleto',
+            index=models.Index(fields=['-fecha_compra', 'id'], name='boleto_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='boleto',
+            index=models.Index(fields=['estado', '-fecha_compra', 'id'], name='boleto_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='boleto',
+            index=models.Index(fields=['viaje', '-fecha_compra', 'id'], name='boleto_viaje_fecha_idx'),
+        ),
+    ]
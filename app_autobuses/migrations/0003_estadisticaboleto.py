@@ -0,0 +1,44 @@
+# Generated by Django 6.0 on 2026-10-18 18:01
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def calcular_estadisticas(apps, schema_editor):
+    Boleto = apps.get_model('app_autobuses', 'Boleto')
+    EstadisticaBoleto = apps.get_model('app_autobuses', 'EstadisticaBoleto')
+    filas = {
+        fila['estado']: fila
+        for fila in Boleto.objects.order_by().values('estado').annotate(cantidad=Count('id'), total=Sum('precio'))
+    }
+    for estado in ('reservado', 'pagado', 'usado', 'cancelado'):
+        fila = filas.get(estado, {})
+        EstadisticaBoleto.objects.create(
+            estado=estado,
+            cantidad=fila.get('cantidad', 0),
+            total=fila.get('total') or 0,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_autobuses', '0002_boleto_indices_listado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticaBoleto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('reservado', 'Reservado'), ('pagado', 'Pagado'), ('usado', 'Usado'), ('cancelado', 'Cancelado')], max_length=20, unique=True)),
+                ('cantidad', models.IntegerField(default=0)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name': 'Estadística de boletos',
+                'verbose_name_plural': 'Estadísticas de boletos',
+            },
+        ),
+        migrations.RunPython(calcular_estadisticas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 6.0 on 2026-10-18 18:02
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_autobuses', '0003_estadisticaboleto'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pasajero',
+            index=models.Index(django.db.models.functions.text.Lower('apellido'), name='pasajero_apellido_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pasajero',
+            index=models.Index(django.db.models.functions.text.Lower('nombre'), name='pasajero_nombre_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pasajero',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='pasajero_email_lower_idx'),
+        ),
+    ]
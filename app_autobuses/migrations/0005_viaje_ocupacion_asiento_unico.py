@@ -0,0 +1,89 @@
+# Generated by Django 6.0 on 2026-10-18 18:03
+
+import logging
+
+from django.db import migrations, models
+from django.db.models import Count, F
+
+logger = logging.getLogger(__name__)
+
+
+def _libres(capacidad, ocupados):
+    return (asiento for asiento in range(1, capacidad + 1) if asiento not in ocupados)
+
+
+def resolver_duplicados(apps, schema_editor):
+    """Deja un solo boleto vigente por asiento antes de crear la restricción única.
+
+    En cada asiento repetido se queda el boleto más antiguo; los demás pasan
+    a un asiento libre del mismo viaje o, si el autobús está lleno, se
+    cancelan (ajustando ``EstadisticaBoleto``). Cada cambio se registra en
+    el log de ``app_autobuses``.
+    """
+    Boleto = apps.get_model('app_autobuses', 'Boleto')
+    Viaje = apps.get_model('app_autobuses', 'Viaje')
+    EstadisticaBoleto = apps.get_model('app_autobuses', 'EstadisticaBoleto')
+    vigentes = Boleto.objects.exclude(estado='cancelado')
+    repetidos = (vigentes.order_by().values('viaje_id', 'asiento_numero')
+                 .annotate(boletos=Count('id')).filter(boletos__gt=1))
+    for viaje_id in sorted({fila['viaje_id'] for fila in repetidos}):
+        viaje = Viaje.objects.select_related('autobus').get(pk=viaje_id)
+        boletos = list(vigentes.filter(viaje_id=viaje_id).order_by('id'))
+        ocupados = {boleto.asiento_numero for boleto in boletos}
+        libres = _libres(viaje.autobus.capacidad, ocupados)
+        vistos = set()
+        for boleto in boletos:
+            if boleto.asiento_numero not in vistos:
+                vistos.add(boleto.asiento_numero)
+                continue
+            asiento = next(libres, None)
+            if asiento is not None:
+                logger.warning('Boleto %s: asiento %s repetido en el viaje %s, pasa al %s',
+                               boleto.codigo_boleto, boleto.asiento_numero, viaje_id, asiento)
+                Boleto.objects.filter(pk=boleto.pk).update(asiento_numero=asiento)
+                vistos.add(asiento)
+                continue
+            logger.warning('Boleto %s: asiento %s repetido en el viaje %s sin asientos libres, se cancela',
+                           boleto.codigo_boleto, boleto.asiento_numero, viaje_id)
+            Boleto.objects.filter(pk=boleto.pk).update(estado='cancelado')
+            for estado, signo in ((boleto.estado, -1), ('cancelado', 1)):
+                EstadisticaBoleto.objects.filter(estado=estado).update(
+                    cantidad=F('cantidad') + signo, total=F('total') + signo * boleto.precio)
+
+
+def construir_mapas(apps, schema_editor):
+    Viaje = apps.get_model('app_autobuses', 'Viaje')
+    Boleto = apps.get_model('app_autobuses', 'Boleto')
+    for viaje in Viaje.objects.select_related('autobus').iterator():
+        capacidad = viaje.autobus.capacidad
+        bits = bytearray((capacidad + 7) // 8)
+        asientos = (Boleto.objects.filter(viaje=viaje).exclude(estado='cancelado')
+                    .values_list('asiento_numero', flat=True))
+        for asiento in asientos:
+            if 1 <= asiento <= capacidad:
+                bits[(asiento - 1) >> 3] |= 1 << ((asiento - 1) & 7)
+        viaje.ocupacion = bytes(bits)
+        # El contador anterior se editaba a mano: se recalcula desde el mapa
+        viaje.asientos_disponibles = capacidad - sum(bin(byte).count('1') for byte in bits)
+        viaje.save(update_fields=['ocupacion', 'asientos_disponibles'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_autobuses', '0004_pasajero_indices_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='viaje',
+            name='ocupacion',
+            field=models.BinaryField(default=bytes),
+        ),
+        migrations.RunPython(resolver_duplicados, migrations.RunPython.noop),
+        migrations.RunPython(construir_mapas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='boleto',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado', 'cancelado'), _negated=True), fields=('viaje', 'asiento_numero'), name='boleto_asiento_unico_por_viaje', violation_error_message='Ese asiento ya está ocupado en este viaje.'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 6.0 on 2026-10-18 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_autobuses', '0005_viaje_ocupacion_asiento_unico'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='autobus',
+            index=models.Index(fields=['marca', 'modelo'], name='autobus_marca_modelo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='empleado',
+            index=models.Index(fields=['apellido', 'nombre'], name='empleado_apellido_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='empleado',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['apellido', 'nombre'], name='empleado_activo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='empleado',
+            index=models.Index(fields=['puesto', 'apellido', 'nombre'], name='empleado_puesto_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pasajero',
+            index=models.Index(fields=['apellido', 'nombre'], name='pasajero_apellido_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ruta',
+            index=models.Index(fields=['origen', 'destino'], name='ruta_origen_destino_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ruta',
+            index=models.Index(condition=models.Q(('activa', True)), fields=['origen', 'destino'], name='ruta_activa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='viaje',
+            index=models.Index(fields=['-fecha_salida'], name='viaje_fecha_salida_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='viaje',
+            index=models.Index(fields=['estado', 'fecha_salida'], name='viaje_estado_salida_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='viaje',
+            index=models.Index(condition=models.Q(('estado', 'cancelado'), _negated=True), fields=['fecha_salida'], name='viaje_salida_vigente_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 6.0 on 2026-10-18 18:10
+
+import app_autobuses.imagenes
+import app_autobuses.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_autobuses', '0006_indices_filtros_frecuentes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='autobus',
+            name='miniatura',
+            field=models.FileField(blank=True, editable=False, max_length=150, storage=app_autobuses.imagenes.almacenamiento, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='autobus',
+            name='miniatura_alto',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='autobus',
+            name='miniatura_ancho',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='autobus',
+            name='miniatura_webp',
+            field=models.FileField(blank=True, editable=False, max_length=150, storage=app_autobuses.imagenes.almacenamiento, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='empleado',
+            name='miniatura',
+            field=models.FileField(blank=True, editable=False, max_length=150, storage=app_autobuses.imagenes.almacenamiento, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='empleado',
+            name='miniatura_alto',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='empleado',
+            name='miniatura_ancho',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='empleado',
+            name='miniatura_webp',
+            field=models.FileField(blank=True, editable=False, max_length=150, storage=app_autobuses.imagenes.almacenamiento, upload_to=''),
+        ),
+        migrations.AlterField(
+            model_name='autobus',
+            name='imagen',
+            field=models.ImageField(blank=True, null=True, storage=app_autobuses.imagenes.almacenamiento, upload_to=app_autobuses.models.autobus_imagen_path),
+        ),
+        migrations.AlterField(
+            model_name='empleado',
+            name='imagen',
+            field=models.ImageField(blank=True, null=True, storage=app_autobuses.imagenes.almacenamiento, upload_to=app_autobuses.models.empleado_imagen_path),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-18 18:12
+
+from django.db import migrations, models
+
+
+def crear_secuencia(apps, schema_editor):
+    SecuenciaCodigo = apps.get_model('app_autobuses', 'SecuenciaCodigo')
+    SecuenciaCodigo.objects.get_or_create(nombre='boletos')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_autobuses', '0007_imagenes_por_contenido_miniaturas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SecuenciaCodigo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=30, unique=True)),
+                ('siguiente', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Secuencia de códigos',
+                'verbose_name_plural': 'Secuencias de códigos',
+            },
+        ),
+        migrations.RunPython(crear_secuencia, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 6.0 on 2026-10-18 18:25
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+# Copia de app_autobuses.models.normalizar_lugar al momento de esta migración:
+# si la función cambia o se mueve, lo que se escribe aquí no debe cambiar
+def normalizar_lugar(texto):
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(caracter for caracter in texto if not unicodedata.combining(caracter))
+    return ' '.join(texto.lower().split())
+
+
+def normalizar_rutas(apps, schema_editor):
+    Ruta = apps.get_model('app_autobuses', 'Ruta')
+    rutas = list(Ruta.objects.only('origen', 'destino'))
+    for ruta in rutas:
+        ruta.origen_normalizado = normalizar_lugar(ruta.origen)
+        ruta.destino_normalizado = normalizar_lugar(ruta.destino)
+    Ruta.objects.bulk_update(rutas, ['origen_normalizado', 'destino_normalizado'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_autobuses', '0008_secuenciacodigo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ruta',
+            name='destino_normalizado',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='ruta',
+            name='origen_normalizado',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(normalizar_rutas, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ruta',
+            index=models.Index(fields=['origen_normalizado', 'destino_normalizado'], name='ruta_normalizada_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='viaje',
+            index=models.Index(condition=models.Q(('estado', 'cancelado'), _negated=True), fields=['ruta', 'fecha_salida'], name='viaje_ruta_salida_idx'),
+        ),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 6.0 on 2026-10-18 19:05
+
+import logging
+import re
+from datetime import timedelta
+
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+# Copia de app_autobuses/duraciones.py al momento de esta migración: si el
+# módulo cambia después, la conversión de los datos viejos no debe cambiar
+_HORAS_MINUTOS = re.compile(
+    r'^(?:(?P<horas>\d+(?:[.,]\d+)?)\s*(?:h|hr|hrs|hora|horas))?\s*'
+    r'(?:(?P<minutos>\d+)\s*(?:m|min|mins|minuto|minutos))?$')
+_RELOJ = re.compile(r'^(?P<horas>\d+):(?P<minutos>[0-5]\d)$')
+
+
+def a_timedelta(texto):
+    """Duración de "2h 30m", "2:30", "1.5 h", "45 min" o "90", o ``None`` si no se entiende."""
+    texto = (texto or '').strip().lower()
+    if not texto:
+        return None
+    if texto.isdigit():
+        return timedelta(minutes=int(texto))
+    reloj = _RELOJ.match(texto)
+    if reloj:
+        return timedelta(hours=int(reloj['horas']), minutes=int(reloj['minutos']))
+    partes = _HORAS_MINUTOS.match(texto)
+    if not partes or not (partes['horas'] or partes['minutos']):
+        return None
+    horas = float(partes['horas'].replace(',', '.')) if partes['horas'] else 0
+    return timedelta(minutes=round(horas * 60) + int(partes['minutos'] or 0))
+
+
+def formatear(duracion):
+    horas, resto = divmod(round(duracion.total_seconds() / 60), 60)
+    if horas and resto:
+        return f'{horas}h {resto}m'
+    return f'{horas}h' if horas else f'{resto}m'
+
+
+def convertir_duraciones(apps, schema_editor):
+    """Pasa el texto ("2h 30m") al campo nuevo y registra en el log lo que no se entiende."""
+    Ruta = apps.get_model('app_autobuses', 'Ruta')
+    rutas = list(Ruta.objects.only('duracion_texto'))
+    for ruta in rutas:
+        ruta.duracion = a_timedelta(ruta.duracion_texto)
+        if ruta.duracion is None and ruta.duracion_texto.strip():
+            logger.warning('Ruta %s: no se pudo leer la duración %r, queda vacía', ruta.pk, ruta.duracion_texto)
+    Ruta.objects.bulk_update(rutas, ['duracion'], batch_size=500)
+
+
+def duraciones_a_texto(apps, schema_editor):
+    Ruta = apps.get_model('app_autobuses', 'Ruta')
+    rutas = list(Ruta.objects.only('duracion'))
+    for ruta in rutas:
+        ruta.duracion_texto = formatear(ruta.duracion) if ruta.duracion is not None else ''
+    Ruta.objects.bulk_update(rutas, ['duracion_texto'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_autobuses', '0009_busqueda_viajes'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='ruta',
+            old_name='duracion_estimada',
+            new_name='duracion_texto',
+        ),
+        # Con default, para que al revertir se pueda volver a crear la columna
+        migrations.AlterField(
+            model_name='ruta',
+            name='duracion_texto',
+            field=models.CharField(default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='ruta',
+            name='duracion',
+            field=models.DurationField(null=True),
+        ),
+        migrations.RunPython(convertir_duraciones, duraciones_a_texto),
+        migrations.RemoveField(
+            model_name='ruta',
+            name='duracion_texto',
+        ),
+        migrations.RenameField(
+            model_name='ruta',
+            old_name='duracion',
+            new_name='duracion_estimada',
+        ),
+        migrations.AlterField(
+            model_name='ruta',
+            name='duracion_estimada',
+            field=models.DurationField(help_text='Formato: 2h 30m', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='ruta',
+            index=models.Index(fields=['duracion_estimada'], name='ruta_duracion_idx'),
+        ),
+    ]
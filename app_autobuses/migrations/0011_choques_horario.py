@@ -0,0 +1,21 @@
+# Generated by Django 6.0 on 2026-10-18 18:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_autobuses', '0010_duracion_estructurada'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='viaje',
+            index=models.Index(condition=models.Q(('estado', 'cancelado'), _negated=True), fields=['autobus', 'fecha_salida'], name='viaje_autobus_salida_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='viaje',
+            index=models.Index(condition=models.Q(('estado', 'cancelado'), _negated=True), fields=['conductor', 'fecha_salida'], name='viaje_conductor_salida_idx'),
+        ),
+    ]
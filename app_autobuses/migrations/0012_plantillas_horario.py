@@ -0,0 +1,45 @@
+# Generated by Django 6.0 on 2026-10-18 18:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_autobuses', '0011_choques_horario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlantillaHorario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+                ('horas_salida', models.CharField(help_text='Horas separadas por coma: 06:00, 14:30', max_length=200)),
+                ('dias_semana', models.CharField(default='0123456', max_length=7)),
+                ('fecha_inicio', models.DateField()),
+                ('fecha_fin', models.DateField()),
+                ('activa', models.BooleanField(default=True)),
+                ('autobus', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app_autobuses.autobus')),
+                ('conductor', models.ForeignKey(limit_choices_to={'puesto': 'conductor'}, on_delete=django.db.models.deletion.CASCADE, to='app_autobuses.empleado')),
+                ('ruta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app_autobuses.ruta')),
+            ],
+            options={
+                'ordering': ['nombre'],
+            },
+        ),
+        migrations.AddField(
+            model_name='viaje',
+            name='plantilla',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='viajes', to='app_autobuses.plantillahorario'),
+        ),
+        migrations.AddConstraint(
+            model_name='viaje',
+            constraint=models.UniqueConstraint(fields=('plantilla', 'fecha_salida'), name='viaje_plantilla_salida_unica'),
+        ),
+        migrations.AddIndex(
+            model_name='plantillahorario',
+            index=models.Index(fields=['nombre'], name='plantilla_nombre_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 6.0 on 2026-10-18 18:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+
+
+def calcular_resumenes(apps, schema_editor):
+    Viaje = apps.get_model('app_autobuses', 'Viaje')
+    Boleto = apps.get_model('app_autobuses', 'Boleto')
+    ResumenRutaDia = apps.get_model('app_autobuses', 'ResumenRutaDia')
+    vendidos = Q(estado__in=('pagado', 'usado'))
+    resumenes = {}
+
+    def fila(ruta_id, fecha):
+        if (ruta_id, fecha) not in resumenes:
+            resumenes[ruta_id, fecha] = ResumenRutaDia(ruta_id=ruta_id, fecha=fecha)
+        return resumenes[ruta_id, fecha]
+
+    for datos in (Viaje.objects.exclude(estado='cancelado').order_by()
+                  .annotate(fecha=TruncDate('fecha_salida'))
+                  .values('ruta_id', 'fecha').annotate(asientos=Sum('autobus__capacidad'))):
+        fila(datos['ruta_id'], datos['fecha']).asientos = datos['asientos']
+    for datos in (Boleto.objects.order_by().annotate(fecha=TruncDate('viaje__fecha_salida'))
+                  .values('viaje__ruta_id', 'fecha')
+                  .annotate(ocupados=Count('id', filter=~Q(estado='cancelado')),
+                            vendidos=Count('id', filter=vendidos), ingresos=Sum('precio', filter=vendidos))):
+        resumen = fila(datos['viaje__ruta_id'], datos['fecha'])
+        resumen.ocupados, resumen.vendidos = datos['ocupados'], datos['vendidos']
+        resumen.ingresos = datos['ingresos'] or 0
+    ResumenRutaDia.objects.bulk_create(resumenes.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_autobuses', '0012_plantillas_horario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenRutaDia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('asientos', models.IntegerField(default=0)),
+                ('ocupados', models.IntegerField(default=0)),
+                ('vendidos', models.IntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('ruta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app_autobuses.ruta')),
+            ],
+            options={
+                'verbose_name': 'Resumen de ruta por día',
+                'verbose_name_plural': 'Resúmenes de ruta por día',
+                'indexes': [models.Index(fields=['fecha', 'ruta'], name='resumen_fecha_ruta_idx')],
+                'constraints': [models.UniqueConstraint(fields=('ruta', 'fecha'), name='resumen_ruta_fecha_unico')],
+            },
+        ),
+        migrations.RunPython(calcular_resumenes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 6.0 on 2026-10-18 18:55
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fechas_conocidas(apps, schema_editor):
+    # Los autobuses y boletos ya guardaban su alta; el resto queda con la fecha de la migración
+    apps.get_model('app_autobuses', 'Autobus').objects.update(fecha_actualizacion=F('fecha_creacion'))
+    apps.get_model('app_autobuses', 'Boleto').objects.update(fecha_actualizacion=F('fecha_compra'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_autobuses', '0013_resumen_ruta_dia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='autobus',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='boleto',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='empleado',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='pasajero',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='ruta',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='viaje',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(fechas_conocidas, migrations.RunPython.noop),
+    ]
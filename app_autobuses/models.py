@@ -1,16 +1,20 @@
-from django.db import models
+import unicodedata
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models.functions import Lower
 from django.core.validators import MinValueValidator, MaxValueValidator
-import os
+
+from .duraciones import formatear
+from .imagenes import almacenamiento, ruta_por_contenido
 
 def autobus_imagen_path(instance, filename):
-    ext = filename.split('.')[-1]
-    filename = f'autobus_{instance.id}.{ext}'
-    return os.path.join('autobuses', filename)
+    # El nombre sale del contenido: en un alta instance.id todavía es None
+    return ruta_por_contenido('autobuses', instance.imagen.file, filename)
 
 def empleado_imagen_path(instance, filename):
-    ext = filename.split('.')[-1]
-    filename = f'empleado_{instance.id}.{ext}'
-    return os.path.join('empleados', filename)
+    return ruta_por_contenido('empleados', instance.imagen.file, filename)
 
 class Autobus(models.Model):
     ESTADOS = [
@@ -25,8 +29,15 @@ class Autobus(models.Model):
     año = models.IntegerField(validators=[MinValueValidator(2000), MaxValueValidator(2024)])
     capacidad = models.IntegerField(validators=[MinValueValidator(10), MaxValueValidator(100)])
     estado = models.CharField(max_length=20, choices=ESTADOS, default='activo')
-    imagen = models.ImageField(upload_to=autobus_imagen_path, null=True, blank=True)
+    imagen = models.ImageField(upload_to=autobus_imagen_path, storage=almacenamiento, null=True, blank=True)
+    # Variantes pequeñas para los listados (ver imagenes.py)
+    miniatura = models.FileField(storage=almacenamiento, max_length=150, blank=True, editable=False)
+    miniatura_webp = models.FileField(storage=almacenamiento, max_length=150, blank=True, editable=False)
+    miniatura_ancho = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    miniatura_alto = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    # Última modificación; update() no la toca, hay que ponerla a mano
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f'{self.marca} {self.modelo} - {self.placa}'
@@ -34,20 +45,57 @@ class Autobus(models.Model):
     class Meta:
         verbose_name = 'Autobús'
         verbose_name_plural = 'Autobuses'
+        indexes = [
+            models.Index(fields=['marca', 'modelo'], name='autobus_marca_modelo_idx'),
+        ]
+
+def normalizar_lugar(texto):
+    """Minúsculas, sin acentos y con un solo espacio: "  San José " -> "san jose"."""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(caracter for caracter in texto if not unicodedata.combining(caracter))
+    return ' '.join(texto.lower().split())
 
 class Ruta(models.Model):
     origen = models.CharField(max_length=100)
     destino = models.CharField(max_length=100)
+    # Copias normalizadas para la búsqueda de viajes (busqueda.py)
+    origen_normalizado = models.CharField(max_length=100, editable=False, default='')
+    destino_normalizado = models.CharField(max_length=100, editable=False, default='')
     distancia_km = models.DecimalField(max_digits=10, decimal_places=2)
-    duracion_estimada = models.CharField(max_length=20, help_text="Formato: 2h 30m")
+    # En los formularios se escribe como "2h 30m" (forms.DuracionField)
+    duracion_estimada = models.DurationField(null=True, help_text="Formato: 2h 30m")
     precio_base = models.DecimalField(max_digits=10, decimal_places=2)
     activa = models.BooleanField(default=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f'{self.origen} → {self.destino}'
     
+    @property
+    def duracion_texto(self):
+        return formatear(self.duracion_estimada) if self.duracion_estimada is not None else ''
+    
+    def normalizar(self):
+        self.origen_normalizado = normalizar_lugar(self.origen)
+        self.destino_normalizado = normalizar_lugar(self.destino)
+    
+    def save(self, *args, **kwargs):
+        self.normalizar()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'origen', 'destino'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'origen_normalizado', 'destino_normalizado'}
+        super().save(*args, **kwargs)
+    
     class Meta:
         ordering = ['origen']
+        indexes = [
+            models.Index(fields=['origen', 'destino'], name='ruta_origen_destino_idx'),
+            models.Index(fields=['origen_normalizado', 'destino_normalizado'], name='ruta_normalizada_idx'),
+            # Orden y filtros por duración
+            models.Index(fields=['duracion_estimada'], name='ruta_duracion_idx'),
+            # Parcial: solo rutas activas (conteo del tablero y selects)
+            models.Index(fields=['origen', 'destino'], condition=models.Q(activa=True), name='ruta_activa_idx'),
+        ]
 
 class Empleado(models.Model):
     PUESTOS = [
@@ -64,14 +112,26 @@ class Empleado(models.Model):
     email = models.EmailField()
     fecha_contratacion = models.DateField()
     salario = models.DecimalField(max_digits=10, decimal_places=2)
-    imagen = models.ImageField(upload_to=empleado_imagen_path, null=True, blank=True)
+    imagen = models.ImageField(upload_to=empleado_imagen_path, storage=almacenamiento, null=True, blank=True)
+    # Variantes pequeñas para los listados (ver imagenes.py)
+    miniatura = models.FileField(storage=almacenamiento, max_length=150, blank=True, editable=False)
+    miniatura_webp = models.FileField(storage=almacenamiento, max_length=150, blank=True, editable=False)
+    miniatura_ancho = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    miniatura_alto = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
     activo = models.BooleanField(default=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f'{self.nombre} {self.apellido} - {self.puesto}'
     
     class Meta:
         ordering = ['apellido']
+        indexes = [
+            models.Index(fields=['apellido', 'nombre'], name='empleado_apellido_nombre_idx'),
+            # Parcial: solo empleados activos (conteo del tablero)
+            models.Index(fields=['apellido', 'nombre'], condition=models.Q(activo=True), name='empleado_activo_idx'),
+            models.Index(fields=['puesto', 'apellido', 'nombre'], name='empleado_puesto_idx'),
+        ]
 
 class Pasajero(models.Model):
     nombre = models.CharField(max_length=50)
@@ -80,12 +140,76 @@ class Pasajero(models.Model):
     email = models.EmailField()
     fecha_nacimiento = models.DateField()
     direccion = models.TextField()
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f'{self.nombre} {self.apellido}'
     
     class Meta:
         ordering = ['apellido']
+        # Búsqueda por prefijo sin distinguir mayúsculas (api_buscar_pasajeros)
+        indexes = [
+            models.Index(fields=['apellido', 'nombre'], name='pasajero_apellido_nombre_idx'),
+            models.Index(Lower('apellido'), name='pasajero_apellido_lower_idx'),
+            models.Index(Lower('nombre'), name='pasajero_nombre_lower_idx'),
+            models.Index(Lower('email'), name='pasajero_email_lower_idx'),
+        ]
+
+def leer_horas(texto):
+    """"06:00, 14:30" -> horas ordenadas y sin repetir; ``ValueError`` si alguna no es hh:mm."""
+    return sorted({datetime.strptime(hora.strip(), '%H:%M').time() for hora in texto.split(',') if hora.strip()})
+
+class PlantillaHorario(models.Model):
+    """Salidas recurrentes de una ruta; ``plantillas.generar`` las convierte en viajes."""
+    DIAS_SEMANA = [
+        ('0', 'Lunes'),
+        ('1', 'Martes'),
+        ('2', 'Miércoles'),
+        ('3', 'Jueves'),
+        ('4', 'Viernes'),
+        ('5', 'Sábado'),
+        ('6', 'Domingo'),
+    ]
+    
+    nombre = models.CharField(max_length=100)
+    ruta = models.ForeignKey(Ruta, on_delete=models.CASCADE)
+    autobus = models.ForeignKey(Autobus, on_delete=models.CASCADE)
+    conductor = models.ForeignKey(Empleado, on_delete=models.CASCADE, limit_choices_to={'puesto': 'conductor'})
+    horas_salida = models.CharField(max_length=200, help_text="Horas separadas por coma: 06:00, 14:30")
+    # Días de la semana como dígitos, 0 = lunes ("01234" = entre semana)
+    dias_semana = models.CharField(max_length=7, default='0123456')
+    fecha_inicio = models.DateField()
+    fecha_fin = models.DateField()
+    activa = models.BooleanField(default=True)
+    
+    def __str__(self):
+        return f'{self.nombre} ({self.ruta})'
+    
+    def horas(self):
+        return leer_horas(self.horas_salida)
+    
+    def dias(self):
+        return {int(dia) for dia in self.dias_semana}
+    
+    def clean(self):
+        errores = {}
+        try:
+            if not self.horas():
+                errores['horas_salida'] = 'Indica al menos una hora de salida.'
+        except ValueError:
+            errores['horas_salida'] = 'Usa horas en formato hh:mm separadas por coma (06:00, 14:30).'
+        if not self.dias_semana:
+            errores['dias_semana'] = 'Elige al menos un día de la semana.'
+        if self.fecha_inicio and self.fecha_fin and self.fecha_fin < self.fecha_inicio:
+            errores['fecha_fin'] = 'La fecha final no puede ser anterior a la inicial.'
+        if errores:
+            raise ValidationError(errores)
+    
+    class Meta:
+        ordering = ['nombre']
+        indexes = [
+            models.Index(fields=['nombre'], name='plantilla_nombre_idx'),
+        ]
 
 class Viaje(models.Model):
     ESTADOS = [
@@ -103,12 +227,32 @@ class Viaje(models.Model):
     fecha_llegada_estimada = models.DateTimeField()
     estado = models.CharField(max_length=20, choices=ESTADOS, default='programado')
     asientos_disponibles = models.IntegerField()
+    # Mapa de bits de asientos ocupados (ver asientos.py)
+    ocupacion = models.BinaryField(default=bytes, editable=False)
+    # Viaje generado desde una plantilla; con la salida evita duplicarlo al volver a generar
+    plantilla = models.ForeignKey(PlantillaHorario, on_delete=models.SET_NULL, null=True, blank=True,
+                                  editable=False, related_name='viajes')
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f'Viaje {self.id}: {self.ruta}'
     
     class Meta:
         ordering = ['-fecha_salida']
+        indexes = [
+            models.Index(fields=['-fecha_salida'], name='viaje_fecha_salida_idx'),
+            models.Index(fields=['estado', 'fecha_salida'], name='viaje_estado_salida_idx'),
+            # Parcial: viajes no cancelados (búsqueda de próximos viajes)
+            models.Index(fields=['fecha_salida'], condition=~models.Q(estado='cancelado'), name='viaje_salida_vigente_idx'),
+            # Búsqueda por ruta y día (busqueda.py)
+            models.Index(fields=['ruta', 'fecha_salida'], condition=~models.Q(estado='cancelado'), name='viaje_ruta_salida_idx'),
+            # Choques de horario por autobús y por conductor (horarios.py)
+            models.Index(fields=['autobus', 'fecha_salida'], condition=~models.Q(estado='cancelado'), name='viaje_autobus_salida_idx'),
+            models.Index(fields=['conductor', 'fecha_salida'], condition=~models.Q(estado='cancelado'), name='viaje_conductor_salida_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['plantilla', 'fecha_salida'], name='viaje_plantilla_salida_unica'),
+        ]
 
 class Boleto(models.Model):
     ESTADOS = [
@@ -126,9 +270,96 @@ class Boleto(models.Model):
     estado = models.CharField(max_length=20, choices=ESTADOS, default='reservado')
     fecha_compra = models.DateTimeField(auto_now_add=True)
     codigo_boleto = models.CharField(max_length=10, unique=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f'Boleto {self.codigo_boleto} - {self.pasajero}'
     
+    def save(self, *args, **kwargs):
+        # Las señales actualizan las estadísticas dentro de la misma transacción
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
+    class Meta:
+        ordering = ['-fecha_compra']
+        # Índices que respaldan la paginación por cursor (-fecha_compra, id)
+        # y los filtros del listado de boletos
+        indexes = [
+            models.Index(fields=['-fecha_compra', 'id'], name='boleto_fecha_id_idx'),
+            models.Index(fields=['estado', '-fecha_compra', 'id'], name='boleto_estado_fecha_idx'),
+            models.Index(fields=['viaje', '-fecha_compra', 'id'], name='boleto_viaje_fecha_idx'),
+        ]
+        constraints = [
+            # Un asiento solo puede tener un boleto vigente por viaje
+            models.UniqueConstraint(
+                fields=['viaje', 'asiento_numero'],
+                condition=~models.Q(estado='cancelado'),
+                name='boleto_asiento_unico_por_viaje',
+                violation_error_message='Ese asiento ya está ocupado en este viaje.',
+            ),
+        ]
+
+class EstadisticaBoleto(models.Model):
+    """Conteo e ingresos acumulados de boletos por estado.
+
+    Se mantiene de forma incremental desde las señales de ``Boleto``
+    (ver ``estadisticas.py``) para no recorrer la tabla de boletos en cada
+    vista. ``manage.py rebuild_ticket_stats`` la recalcula desde cero.
+    """
+    estado = models.CharField(max_length=20, choices=Boleto.ESTADOS, unique=True)
+    cantidad = models.IntegerField(default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    def __str__(self):
+        return f'{self.estado}: {self.cantidad} (${self.total})'
+    
+    class Meta:
+        verbose_name = 'Estadística de boletos'
+        verbose_name_plural = 'Estadísticas de boletos'
+
+class ResumenRutaDia(models.Model):
+    """Asientos, boletos e ingresos por ruta y día de salida del viaje.
+
+    Se mantiene de forma incremental desde las señales de ``Viaje`` y
+    ``Boleto`` (ver ``resumenes.py``); los reportes suman estas filas en lugar
+    de recorrer los boletos. ``manage.py rebuild_rollups`` la recalcula.
+    """
+    ruta = models.ForeignKey(Ruta, on_delete=models.CASCADE)
+    fecha = models.DateField()
+    # Capacidad de los viajes no cancelados
+    asientos = models.IntegerField(default=0)
+    # Boletos no cancelados (asientos ocupados)
+    ocupados = models.IntegerField(default=0)
+    # Boletos pagados o usados y lo cobrado por ellos
+    vendidos = models.IntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    def __str__(self):
+        return f'{self.ruta} {self.fecha}: {self.vendidos} boletos (${self.ingresos})'
+    
+    class Meta:
+        verbose_name = 'Resumen de ruta por día'
+        verbose_name_plural = 'Resúmenes de ruta por día'
+        indexes = [
+            # Reportes por rango de fechas de todas las rutas
+            models.Index(fields=['fecha', 'ruta'], name='resumen_fecha_ruta_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['ruta', 'fecha'], name='resumen_ruta_fecha_unico'),
+        ]
+
+class SecuenciaCodigo(models.Model):
+    """Contador para los códigos de boleto (ver ``codigos.py``).
+
+    Se reserva por bloques, así que ``siguiente`` avanza de golpe y no
+    coincide con el número de boletos emitidos.
+    """
+    nombre = models.CharField(max_length=30, unique=True)
+    siguiente = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f'{self.nombre}: {self.siguiente}'
+    
     class Meta:
-        ordering = ['-fecha_compra']
\ No newline at end of file
+        verbose_name = 'Secuencia de códigos'
+        verbose_name_plural = 'Secuencias de códigos'
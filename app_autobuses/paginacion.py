@@ -0,0 +1,85 @@
+"""Paginación por cursor (keyset) para listados grandes.
+
+Los listados se ordenan por ``-<campo_fecha>, id``. El cursor codifica la
+fecha y el id de la última (o primera) fila mostrada, así que los enlaces
+siguen siendo válidos aunque se inserten registros nuevos mientras tanto.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+TAMANO_PAGINA = 50
+TAMANO_MAXIMO = 200
+
+
+def codificar_cursor(fecha, pk):
+    texto = f'{fecha.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """Devuelve ``(fecha, pk)`` o ``None`` si el cursor no es válido."""
+    if not cursor:
+        return None
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        texto = base64.urlsafe_b64decode(cursor + relleno).decode()
+        fecha, pk = texto.split('|')
+        return datetime.fromisoformat(fecha), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _consulta(queryset, campo, despues, antes, tamano):
+    """La consulta de la página (con una fila extra) y lo necesario para armarla."""
+    tamano = max(1, min(tamano, TAMANO_MAXIMO))
+    cursor_despues = decodificar_cursor(despues)
+    cursor_antes = decodificar_cursor(antes)
+
+    if cursor_antes:
+        fecha, pk = cursor_antes
+        queryset = (queryset.filter(Q(**{f'{campo}__gt': fecha}) | Q(**{campo: fecha, 'id__lt': pk}))
+                    .order_by(campo, '-id'))
+    else:
+        if cursor_despues:
+            fecha, pk = cursor_despues
+            queryset = queryset.filter(Q(**{f'{campo}__lt': fecha}) | Q(**{campo: fecha, 'id__gt': pk}))
+        queryset = queryset.order_by(f'-{campo}', 'id')
+    return queryset[:tamano + 1], tamano, cursor_despues, cursor_antes
+
+
+def _pagina(filas, campo, tamano, cursor_despues, cursor_antes):
+    if cursor_antes:
+        hay_mas = len(filas) > tamano
+        objetos = filas[:tamano][::-1]
+        hay_anterior, hay_siguiente = hay_mas, True
+    else:
+        objetos = filas[:tamano]
+        hay_anterior, hay_siguiente = cursor_despues is not None, len(filas) > tamano
+
+    siguiente = anterior = None
+    if objetos and hay_siguiente:
+        ultimo = objetos[-1]
+        siguiente = codificar_cursor(getattr(ultimo, campo), ultimo.pk)
+    if objetos and hay_anterior:
+        primero = objetos[0]
+        anterior = codificar_cursor(getattr(primero, campo), primero.pk)
+
+    return {'objetos': objetos, 'siguiente': siguiente, 'anterior': anterior}
+
+
+def paginar_keyset(queryset, campo, despues=None, antes=None, tamano=TAMANO_PAGINA):
+    """Devuelve un dict con ``objetos``, ``siguiente`` y ``anterior``.
+
+    Solo se lee una fila extra para saber si hay más páginas; nunca se hace
+    ``COUNT`` ni ``OFFSET`` sobre la tabla completa.
+    """
+    consulta, *datos = _consulta(queryset, campo, despues, antes, tamano)
+    return _pagina(list(consulta), campo, *datos)
+
+
+async def apaginar_keyset(queryset, campo, despues=None, antes=None, tamano=TAMANO_PAGINA):
+    """Versión async de ``paginar_keyset`` (iteración async del ORM)."""
+    consulta, *datos = _consulta(queryset, campo, despues, antes, tamano)
+    return _pagina([fila async for fila in consulta], campo, *datos)
@@ -0,0 +1,106 @@
+"""Generación de viajes desde plantillas de horario.
+
+Una ``PlantillaHorario`` da una ruta, un autobús, un conductor, las horas de
+salida, los días de la semana y un rango de fechas. ``generar`` la expande
+en viajes con ``bulk_create`` por lotes, con los asientos disponibles de la
+capacidad del autobús y la llegada de la duración de la ruta.
+
+Es idempotente: cada viaje guarda su plantilla y la restricción única
+(plantilla, fecha de salida) impide repetir una salida, así que volver a
+generar solo crea las que faltan (por ejemplo, al alargar la temporada).
+Para quitar una salida se cancela el viaje; si se le cambia la hora, la
+salida original se vuelve a crear.
+
+Las salidas en las que el autobús o el conductor ya tienen otro viaje no se
+crean y se reportan como choques. Se revisan en la misma pasada con una
+``horarios.Agenda`` por recurso.
+"""
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import busqueda, dashboard, resumenes, versiones
+from .horarios import Agenda, Intervalo, duracion_maxima
+from .models import Viaje
+
+TAMANO_LOTE = 500
+
+
+class PlantillaInvalida(Exception):
+    pass
+
+
+def salidas(plantilla):
+    """Fechas de salida de la plantilla, en orden, en la zona horaria actual."""
+    horas, dias = plantilla.horas(), plantilla.dias()
+    dia = plantilla.fecha_inicio
+    while dia <= plantilla.fecha_fin:
+        if dia.weekday() in dias:
+            for hora in horas:
+                yield timezone.make_aware(datetime.combine(dia, hora))
+        dia += timedelta(days=1)
+
+
+def generar(plantilla, lote=TAMANO_LOTE, simular=False):
+    """Crea los viajes que faltan de la plantilla.
+
+    Devuelve ``{'creados', 'existentes', 'choques'}``; cada choque es una
+    salida que no se creó: un diccionario con la ``salida`` y, para el
+    ``autobus`` y/o el ``conductor``, el id del viaje con el que choca. Con
+    ``simular`` solo se calcula el resultado.
+    """
+    duracion = plantilla.ruta.duracion_estimada
+    if duracion is None:
+        raise PlantillaInvalida(f'La ruta {plantilla.ruta} no tiene duración estimada.')
+    if duracion > duracion_maxima():
+        raise PlantillaInvalida(f'La ruta {plantilla.ruta} dura más que la duración máxima de un viaje.')
+    inicio = timezone.make_aware(datetime.combine(plantilla.fecha_inicio, datetime.min.time()))
+    fin = timezone.make_aware(datetime.combine(plantilla.fecha_fin + timedelta(days=1), datetime.min.time()))
+
+    resultado = {'creados': 0, 'existentes': 0, 'choques': []}
+    pendientes = []
+
+    def guardar():
+        if not simular:
+            Viaje.objects.bulk_create(pendientes, batch_size=lote)
+            resumenes.registrar_viajes_creados(pendientes)
+        resultado['creados'] += len(pendientes)
+        pendientes.clear()
+
+    with transaction.atomic():
+        existentes = set(plantilla.viajes.filter(fecha_salida__gte=inicio, fecha_salida__lt=fin)
+                         .values_list('fecha_salida', flat=True))
+        # Con llegadas incluidas: un viaje que sale antes del inicio puede seguir en curso
+        agendas = {
+            'autobus': Agenda.de('autobus', plantilla.autobus_id, inicio, fin + duracion),
+            'conductor': Agenda.de('conductor', plantilla.conductor_id, inicio, fin + duracion),
+        }
+        for salida in salidas(plantilla):
+            if salida in existentes:
+                resultado['existentes'] += 1
+                continue
+            llegada = salida + duracion
+            choques = {recurso: agenda.choque(salida, llegada) for recurso, agenda in agendas.items()}
+            if any(choques.values()):
+                resultado['choques'].append({'salida': salida, **{
+                    recurso: viaje.viaje_id for recurso, viaje in choques.items() if viaje is not None}})
+                continue
+            for agenda in agendas.values():
+                agenda.agregar(Intervalo(None, salida, llegada))
+            pendientes.append(Viaje(
+                plantilla=plantilla, ruta_id=plantilla.ruta_id, autobus_id=plantilla.autobus_id,
+                conductor_id=plantilla.conductor_id, fecha_salida=salida, fecha_llegada_estimada=llegada,
+                asientos_disponibles=plantilla.autobus.capacidad,
+            ))
+            if len(pendientes) >= lote:
+                guardar()
+        guardar()
+
+        if resultado['creados'] and not simular:
+            # bulk_create no envía señales: se aplican a mano los mismos efectos
+            # (los resúmenes ya se ajustaron por lote)
+            dashboard.modelo_cambiado(Viaje, creado=True, cantidad=resultado['creados'])
+            versiones.modelo_cambiado(Viaje)
+            busqueda.invalidar_ruta(plantilla.ruta_id)
+    return resultado
@@ -0,0 +1,250 @@
+"""Resúmenes de ingresos y ocupación por ruta y día, mantenidos de forma incremental.
+
+Cada fila de ``ResumenRutaDia`` junta los viajes de una ruta que salen ese
+día (en la zona horaria actual):
+
+* ``asientos``: capacidad del autobús de los viajes no cancelados.
+* ``ocupados``: boletos no cancelados.
+* ``vendidos`` e ``ingresos``: boletos pagados o usados y su precio.
+
+Las señales de ``Viaje`` y ``Boleto`` calculan lo que aporta el objeto
+antes y después del cambio y aplican la diferencia con actualizaciones
+``F()``, como ``estadisticas.py``. Si un viaje cambia de ruta o de día, sus
+boletos se mueven de fila con una consulta agregada sobre el índice
+``boleto_viaje_fecha_idx``. Los reportes leen solo estas filas (una por ruta
+y día), así que un año son cientos de filas y no millones de boletos.
+"""
+from collections import defaultdict
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Autobus, Boleto, ResumenRutaDia, Viaje
+
+ESTADOS_VENDIDOS = ('pagado', 'usado')
+CAMPOS = ('asientos', 'ocupados', 'vendidos', 'ingresos')
+
+
+def dia_de(fecha_salida):
+    return timezone.localdate(fecha_salida)
+
+
+# ========== APLICAR DIFERENCIAS ==========
+def ajustar(cambios):
+    """Suma a cada fila ``{(ruta_id, fecha): {campo: delta}}``; las filas que faltan se crean."""
+    for (ruta_id, fecha), deltas in cambios.items():
+        deltas = {campo: valor for campo, valor in deltas.items() if valor}
+        if not deltas:
+            continue
+        valores = {campo: F(campo) + valor for campo, valor in deltas.items()}
+        filas = ResumenRutaDia.objects.filter(ruta_id=ruta_id, fecha=fecha)
+        if not filas.update(**valores):
+            ResumenRutaDia.objects.get_or_create(ruta_id=ruta_id, fecha=fecha)
+            filas.update(**valores)
+
+
+def _sumar(cambios, clave, aporte, signo):
+    if clave is None or aporte is None:
+        return
+    for campo, valor in aporte.items():
+        cambios[clave][campo] += signo * valor
+
+
+def _vacio():
+    return defaultdict(lambda: dict.fromkeys(CAMPOS, 0))
+
+
+def _diferencia(clave_anterior, anterior, clave_actual, actual):
+    cambios = _vacio()
+    _sumar(cambios, clave_anterior, anterior, -1)
+    _sumar(cambios, clave_actual, actual, 1)
+    return cambios
+
+
+# ========== BOLETOS ==========
+def aporte_boleto(estado, precio):
+    vendido = estado in ESTADOS_VENDIDOS
+    return {
+        'ocupados': int(estado != 'cancelado'),
+        'vendidos': int(vendido),
+        'ingresos': Decimal(precio) if vendido else Decimal('0'),
+    }
+
+
+def clave_viaje(viaje_id):
+    """``(ruta_id, fecha)`` de la fila a la que van los boletos del viaje."""
+    fila = Viaje.objects.filter(pk=viaje_id).values_list('ruta_id', 'fecha_salida').first()
+    return (fila[0], dia_de(fila[1])) if fila else None
+
+
+def registrar_boleto(anterior, actual):
+    """Aplica el cambio de un boleto.
+
+    ``anterior`` y ``actual`` son diccionarios con ``viaje``, ``estado`` y
+    ``precio``, o ``None`` en un alta o una baja.
+    """
+    claves = {}
+    for datos in (anterior, actual):
+        if datos and datos['viaje'] not in claves:
+            claves[datos['viaje']] = clave_viaje(datos['viaje'])
+    ajustar(_diferencia(
+        claves[anterior['viaje']] if anterior else None,
+        aporte_boleto(anterior['estado'], anterior['precio']) if anterior else None,
+        claves[actual['viaje']] if actual else None,
+        aporte_boleto(actual['estado'], actual['precio']) if actual else None,
+    ))
+
+
+def registrar_boletos_creados(viaje, boletos):
+    """Versión por lotes para boletos de un mismo viaje creados con ``bulk_create``."""
+    clave = (viaje.ruta_id, dia_de(viaje.fecha_salida))
+    cambios = _vacio()
+    for boleto in boletos:
+        _sumar(cambios, clave, aporte_boleto(boleto.estado, boleto.precio), 1)
+    ajustar(cambios)
+
+
+# ========== VIAJES ==========
+def datos_viaje(viaje_id):
+    """Lo que el resumen necesita de un viaje guardado, para comparar antes y después."""
+    return (Viaje.objects.filter(pk=viaje_id)
+            .values('ruta_id', 'fecha_salida', 'estado', 'autobus__capacidad').first())
+
+
+def _aporte_viaje(datos):
+    return {'asientos': datos['autobus__capacidad'] if datos['estado'] != 'cancelado' else 0}
+
+
+def _boletos_del_viaje(viaje_id):
+    totales = Boleto.objects.filter(viaje_id=viaje_id).aggregate(
+        ocupados=Count('id', filter=~Q(estado='cancelado')),
+        vendidos=Count('id', filter=Q(estado__in=ESTADOS_VENDIDOS)),
+        ingresos=Sum('precio', filter=Q(estado__in=ESTADOS_VENDIDOS)),
+    )
+    totales['ingresos'] = totales['ingresos'] or Decimal('0')
+    return totales
+
+
+def registrar_viaje(viaje_id, anterior, actual):
+    """Aplica el cambio de un viaje; ``anterior``/``actual`` vienen de ``datos_viaje`` o son ``None``."""
+    clave_anterior = (anterior['ruta_id'], dia_de(anterior['fecha_salida'])) if anterior else None
+    clave_actual = (actual['ruta_id'], dia_de(actual['fecha_salida'])) if actual else None
+    cambios = _diferencia(clave_anterior, anterior and _aporte_viaje(anterior),
+                          clave_actual, actual and _aporte_viaje(actual))
+    # Al cambiar de ruta o de día, los boletos se van con el viaje
+    if anterior and actual and clave_anterior != clave_actual:
+        boletos = _boletos_del_viaje(viaje_id)
+        _sumar(cambios, clave_anterior, boletos, -1)
+        _sumar(cambios, clave_actual, boletos, 1)
+    ajustar(cambios)
+
+
+def registrar_viajes_creados(viajes):
+    """Versión por lotes para viajes nuevos (sin boletos) creados con ``bulk_create``."""
+    capacidades = dict(Autobus.objects.filter(pk__in={viaje.autobus_id for viaje in viajes})
+                       .values_list('pk', 'capacidad'))
+    cambios = _vacio()
+    for viaje in viajes:
+        if viaje.estado != 'cancelado':
+            _sumar(cambios, (viaje.ruta_id, dia_de(viaje.fecha_salida)),
+                   {'asientos': capacidades[viaje.autobus_id]}, 1)
+    ajustar(cambios)
+
+
+# ========== AUTOBUSES ==========
+def registrar_capacidad(autobus_id, anterior, actual):
+    """Aplica a los ``asientos`` el cambio de capacidad de un autobús.
+
+    Cada viaje no cancelado del autobús aporta la diferencia a su fila; se
+    cuentan agrupados por ruta y día en una sola consulta.
+    """
+    if anterior is None or anterior == actual:
+        return
+    filas = (Viaje.objects.filter(autobus_id=autobus_id).exclude(estado='cancelado').order_by()
+             .annotate(fecha=TruncDate('fecha_salida'))
+             .values('ruta_id', 'fecha').annotate(viajes=Count('id')))
+    cambios = _vacio()
+    for fila in filas:
+        _sumar(cambios, (fila['ruta_id'], fila['fecha']), {'asientos': fila['viajes'] * (actual - anterior)}, 1)
+    ajustar(cambios)
+
+
+# ========== RECÁLCULO ==========
+def calcular(desde=None):
+    """Resúmenes desde cero con dos consultas agrupadas: ``{(ruta_id, fecha): {campo: valor}}``.
+
+    Con ``desde`` (una fecha) solo se calculan los días a partir de ella.
+    """
+    viajes, boletos = Viaje.objects.exclude(estado='cancelado'), Boleto.objects.all()
+    if desde is not None:
+        inicio = timezone.make_aware(datetime.combine(desde, time.min))
+        viajes = viajes.filter(fecha_salida__gte=inicio)
+        boletos = boletos.filter(viaje__fecha_salida__gte=inicio)
+
+    resultado = _vacio()
+    filas = (viajes.order_by().annotate(fecha=TruncDate('fecha_salida'))
+             .values('ruta_id', 'fecha').annotate(asientos=Sum('autobus__capacidad')))
+    for fila in filas.iterator():
+        resultado[fila['ruta_id'], fila['fecha']]['asientos'] = fila['asientos']
+    filas = (boletos.order_by().annotate(fecha=TruncDate('viaje__fecha_salida'))
+             .values('viaje__ruta_id', 'fecha')
+             .annotate(ocupados=Count('id', filter=~Q(estado='cancelado')),
+                       vendidos=Count('id', filter=Q(estado__in=ESTADOS_VENDIDOS)),
+                       ingresos=Sum('precio', filter=Q(estado__in=ESTADOS_VENDIDOS))))
+    for fila in filas.iterator():
+        resultado[fila['viaje__ruta_id'], fila['fecha']].update(
+            ocupados=fila['ocupados'], vendidos=fila['vendidos'], ingresos=fila['ingresos'] or Decimal('0'))
+    return resultado
+
+
+def reconstruir(desde=None, simular=False):
+    """Corrige las filas que no coinciden con ``calcular``; devuelve cuántas cambiaron."""
+    with transaction.atomic():
+        guardadas = ResumenRutaDia.objects.select_for_update()
+        if desde is not None:
+            guardadas = guardadas.filter(fecha__gte=desde)
+        guardadas = {(fila.ruta_id, fila.fecha): fila for fila in guardadas}
+        reales = calcular(desde)
+
+        nuevas, cambiadas = [], []
+        for clave, valores in reales.items():
+            fila = guardadas.pop(clave, None)
+            if fila is None:
+                nuevas.append(ResumenRutaDia(ruta_id=clave[0], fecha=clave[1], **valores))
+            elif any(getattr(fila, campo) != valor for campo, valor in valores.items()):
+                for campo, valor in valores.items():
+                    setattr(fila, campo, valor)
+                cambiadas.append(fila)
+        # Lo que queda son días que ya no tienen viajes ni boletos
+        sobrantes = [fila.pk for fila in guardadas.values()]
+
+        if not simular:
+            ResumenRutaDia.objects.bulk_create(nuevas, batch_size=1000)
+            ResumenRutaDia.objects.bulk_update(cambiadas, CAMPOS, batch_size=1000)
+            ResumenRutaDia.objects.filter(pk__in=sobrantes).delete()
+    return {'nuevas': len(nuevas), 'cambiadas': len(cambiadas), 'sobrantes': len(sobrantes)}
+
+
+# ========== REPORTES ==========
+def reporte(desde, hasta, agrupar=None, ruta_id=None):
+    """Totales por ruta y periodo entre ``desde`` y ``hasta`` (incluidos).
+
+    ``agrupar`` es una función de ``django.db.models.functions`` como
+    ``TruncWeek`` o ``TruncMonth``; sin ella el periodo es el día.
+    """
+    filas = ResumenRutaDia.objects.filter(fecha__gte=desde, fecha__lte=hasta)
+    if ruta_id is not None:
+        filas = filas.filter(ruta_id=ruta_id)
+    periodo = agrupar('fecha') if agrupar else F('fecha')
+    return list(
+        filas.order_by()
+        .annotate(periodo=periodo)
+        .values('periodo', 'ruta_id', 'ruta__origen', 'ruta__destino')
+        .annotate(asientos=Sum('asientos'), ocupados=Sum('ocupados'),
+                  vendidos=Sum('vendidos'), ingresos=Sum('ingresos'))
+        .order_by('periodo', 'ruta__origen', 'ruta__destino')
+    )
@@ -0,0 +1,174 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import asientos, busqueda, dashboard, estadisticas, imagenes, itinerarios, resumenes, versiones
+from .models import Autobus, Boleto, Empleado, EstadisticaBoleto, Pasajero, PlantillaHorario, Ruta, Viaje
+
+
+# Campos del viaje que cambian su fila en ResumenRutaDia
+CAMPOS_RESUMEN_VIAJE = {'ruta', 'fecha_salida', 'estado', 'autobus'}
+
+
+def _datos_boleto(boleto):
+    return {'viaje': boleto.viaje_id, 'estado': boleto.estado, 'precio': boleto.precio}
+
+
+def _borrado_por_ruta(origin):
+    # Al borrar una ruta sus resúmenes se borran en cascada
+    return isinstance(origin, Ruta) or getattr(origin, 'model', None) is Ruta
+
+
+# ========== BOLETOS ==========
+@receiver(pre_save, sender=Boleto)
+def boleto_guardando(sender, instance, raw=False, **kwargs):
+    """Guarda el estado anterior del boleto para calcular la diferencia."""
+    instance._datos_anteriores = None
+    if raw or instance._state.adding or not instance.pk:
+        return
+    # Boleto.save() abre la transacción antes de esta señal: el bloqueo dura hasta
+    # aplicar la diferencia, así dos ediciones a la vez no parten del mismo estado
+    instance._datos_anteriores = (Boleto.objects.select_for_update().filter(pk=instance.pk)
+                                  .values('viaje', 'estado', 'precio').first())
+
+
+@receiver(post_save, sender=Boleto)
+def boleto_guardado(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    estadisticas.registrar_cambio(getattr(instance, '_datos_anteriores', None), _datos_boleto(instance))
+    resumenes.registrar_boleto(getattr(instance, '_datos_anteriores', None), _datos_boleto(instance))
+    asientos.invalidar_mapa(instance.viaje_id)
+
+
+@receiver(post_delete, sender=Boleto)
+def boleto_eliminado(sender, instance, origin=None, **kwargs):
+    estadisticas.registrar_cambio(_datos_boleto(instance), None)
+    if not _borrado_por_ruta(origin):
+        resumenes.registrar_boleto(_datos_boleto(instance), None)
+    # Si se está borrando el viaje completo no tiene caso liberar asientos
+    if not isinstance(origin, Viaje) and getattr(origin, 'model', None) is not Viaje:
+        asientos.liberar_asiento(instance)
+    asientos.invalidar_mapa(instance.viaje_id)
+
+
+# ========== VIAJES ==========
+@receiver(pre_save, sender=Viaje)
+def viaje_guardando(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Guarda la ruta, el día, el estado y la capacidad anteriores si pueden cambiar."""
+    instance._ruta_anterior = instance._resumen_anterior = None
+    if raw or instance._state.adding or not instance.pk:
+        return
+    if update_fields is None or CAMPOS_RESUMEN_VIAJE.intersection(update_fields):
+        instance._resumen_anterior = resumenes.datos_viaje(instance.pk)
+        if instance._resumen_anterior:
+            instance._ruta_anterior = instance._resumen_anterior['ruta_id']
+
+
+def _datos_resumen(viaje):
+    return {'ruta_id': viaje.ruta_id, 'fecha_salida': viaje.fecha_salida, 'estado': viaje.estado,
+            'autobus__capacidad': viaje.autobus.capacidad}
+
+
+@receiver(post_save, sender=Viaje)
+def viaje_guardado(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if created or update_fields is None or CAMPOS_RESUMEN_VIAJE.intersection(update_fields):
+        resumenes.registrar_viaje(instance.pk, getattr(instance, '_resumen_anterior', None), _datos_resumen(instance))
+
+
+@receiver(post_delete, sender=Viaje)
+def viaje_eliminado(sender, instance, origin=None, **kwargs):
+    # Sus boletos ya se descontaron al borrarse antes que el viaje
+    if not _borrado_por_ruta(origin):
+        resumenes.registrar_viaje(instance.pk, _datos_resumen(instance), None)
+
+
+@receiver(post_save, sender=Viaje)
+@receiver(post_delete, sender=Viaje)
+def viaje_cambiado(sender, instance, **kwargs):
+    # Cambia la ocupación o el autobús (y con él la capacidad)
+    asientos.invalidar_mapa(instance.pk)
+    # Cambian los asientos libres, la hora o la ruta del viaje
+    busqueda.invalidar_ruta(instance.ruta_id)
+    anterior = getattr(instance, '_ruta_anterior', None)
+    if anterior != instance.ruta_id:
+        busqueda.invalidar_ruta(anterior)
+
+
+# ========== AUTOBUSES ==========
+@receiver(pre_save, sender=Autobus)
+def autobus_guardando(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Guarda la capacidad anterior: los mapas de asientos y los resúmenes de sus viajes dependen de ella."""
+    instance._capacidad_anterior = None
+    if raw or instance._state.adding or not instance.pk:
+        return
+    if update_fields is None or 'capacidad' in update_fields:
+        instance._capacidad_anterior = (Autobus.objects.filter(pk=instance.pk)
+                                        .values_list('capacidad', flat=True).first())
+
+
+@receiver(post_save, sender=Autobus)
+def autobus_guardado(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    anterior = getattr(instance, '_capacidad_anterior', None)
+    if anterior is not None and anterior != instance.capacidad:
+        # Los mapas de sus viajes se dimensionan con la capacidad del autobús
+        asientos.ajustar_viajes_de_autobus(instance)
+    resumenes.registrar_capacidad(instance.pk, anterior, instance.capacidad)
+
+
+# ========== RUTAS ==========
+@receiver(post_save, sender=Ruta)
+@receiver(post_delete, sender=Ruta)
+def ruta_cambiada(sender, instance, **kwargs):
+    # Los resultados de búsqueda llevan el origen, el destino y el precio de la ruta
+    busqueda.invalidar_ruta(instance.pk)
+    # Arista del planeador de itinerarios (alta, cambio, baja o activa/inactiva)
+    itinerarios.ruta_cambiada(instance.pk)
+
+
+# ========== IMÁGENES ==========
+@receiver(post_save, sender=Autobus)
+@receiver(post_save, sender=Empleado)
+def imagen_guardada(sender, instance, raw=False, **kwargs):
+    """Programa las miniaturas cuando la foto cambió, o las quita si se borró."""
+    if raw or imagenes.miniatura_al_dia(instance):
+        return
+    if not instance.imagen:
+        if instance.miniatura:
+            sender.objects.filter(pk=instance.pk).update(
+                miniatura='', miniatura_webp='', miniatura_ancho=None, miniatura_alto=None,
+                fecha_actualizacion=timezone.now())
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: imagenes.encolar(sender, pk))
+
+
+# ========== TABLERO ==========
+def _modelo_guardado(sender, instance, created=False, raw=False, **kwargs):
+    if not raw:
+        dashboard.modelo_cambiado(sender, creado=created)
+
+
+def _modelo_eliminado(sender, instance, **kwargs):
+    dashboard.modelo_cambiado(sender, eliminado=True)
+
+
+for _modelo in (Autobus, Ruta, Empleado, Pasajero, Viaje, Boleto):
+    post_save.connect(_modelo_guardado, sender=_modelo, dispatch_uid=f'dashboard_guardado_{_modelo.__name__}')
+    post_delete.connect(_modelo_eliminado, sender=_modelo, dispatch_uid=f'dashboard_eliminado_{_modelo.__name__}')
+
+
+# ========== VERSIONES (GET condicionales) ==========
+def _version_cambiada(sender, **kwargs):
+    versiones.modelo_cambiado(sender)
+
+
+# Los modelos que se muestran en algún listado (las estadísticas, en el de boletos)
+for _modelo in (Autobus, Ruta, Empleado, Pasajero, Viaje, Boleto, PlantillaHorario, EstadisticaBoleto):
+    post_save.connect(_version_cambiada, sender=_modelo, dispatch_uid=f'version_guardado_{_modelo.__name__}')
+    post_delete.connect(_version_cambiada, sender=_modelo, dispatch_uid=f'version_eliminado_{_modelo.__name__}')
@@ -0,0 +1,60 @@
+"""Etiquetas para las tablas de los listados con caché de fragmentos (fragmentos.py).
+
+    {% load tablas %}
+    {% tabla 'viajes' %}
+    <div class="card">... {{ viajes|length }} ...
+        {% filas viajes 'app_autobuses/viaje/fila.html' 'viaje' 'ruta autobus conductor' %}
+    </div>
+    {% endtabla %}
+
+``tabla`` envuelve todo lo que usa el queryset del listado: si el bloque está
+en caché, la consulta no se llega a ejecutar.
+"""
+from django import template
+from django.utils.safestring import mark_safe
+
+from app_autobuses import fragmentos
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def filas(context, objetos, plantilla, como, relaciones=''):
+    """Renderiza ``plantilla`` para cada objeto, disponible como ``como``, con caché por fila.
+
+    ``relaciones`` lista, separadas por espacios, las relaciones que muestra
+    la fila; sus ``fecha_actualizacion`` entran en la versión de la fila.
+    """
+    fila = context.template.engine.get_template(plantilla)
+
+    def render(objeto):
+        with context.push({como: objeto}):
+            return fila.render(context)
+
+    return mark_safe(''.join(fragmentos.filas(objetos, render, plantilla, relaciones.split())))
+
+
+class TablaNode(template.Node):
+    def __init__(self, nombre, nodelist):
+        self.nombre = nombre
+        self.nodelist = nodelist
+
+    def render(self, context):
+        request = context.get('request')
+        # La generación la deja versiones.condicional; sin ella la tabla no se guarda
+        sellos = getattr(request, 'sellos', None)
+        if sellos is None:
+            return self.nodelist.render(context)
+        return fragmentos.tabla(self.nombre.resolve(context), request.get_full_path(), sellos,
+                                lambda: self.nodelist.render(context))
+
+
+@register.tag
+def tabla(parser, token):
+    """``{% tabla 'nombre' %}...{% endtabla %}``: guarda el bloque por URL y por generación de la vista."""
+    bits = token.split_contents()
+    if len(bits) != 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' recibe solo el nombre de la tabla")
+    nodelist = parser.parse(('endtabla',))
+    parser.delete_first_token()
+    return TablaNode(parser.compile_filter(bits[1]), nodelist)
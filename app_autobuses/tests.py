@@ -1,3 +1,1656 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import runpy
+import sqlite3
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from unittest import mock, skipUnless
+from urllib.parse import urlencode
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import Count, Q, Sum
+from django.db.utils import ConnectionHandler, load_backend
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from . import (asientos, codigos, dashboard, duraciones, exportacion, fragmentos, horarios, imagenes, importacion,
+               instrumentacion, itinerarios, plantillas, resumenes, versiones, views)
+from .asientos import MapaAsientos, guardar_boleto
+from .dashboard import aobtener_contadores, obtener_contadores
+from .enrutador import CLAVE_SESION, EnrutadorReplicas, _leer_de_replica, en_primaria
+from .estadisticas import calcular_desde_boletos, obtener_estadisticas
+from .forms import PlantillaHorarioForm, ViajeForm
+from .management.commands import benchmark_asgi, benchmark_vistas
+from .models import (Autobus, Boleto, Empleado, EstadisticaBoleto, Pasajero, PlantillaHorario, ResumenRutaDia, Ruta,
+                     Viaje)
+from .paginacion import apaginar_keyset, codificar_cursor, paginar_keyset
+
+
+class DatosMixin:
+    """Crea los autobuses, rutas, empleados, pasajeros y viajes que usan las pruebas."""
+
+    @classmethod
+    def crear_autobus(cls, placa, capacidad=40):
+        return Autobus.objects.create(modelo='9700', marca='Volvo', placa=placa, año=2020, capacidad=capacidad)
+
+    @classmethod
+    def crear_ruta(cls, origen='Tijuana', destino='Mexicali', duracion=timedelta(hours=2), precio=300,
+                   distancia=180):
+        return Ruta.objects.create(origen=origen, destino=destino, distancia_km=distancia,
+                                   duracion_estimada=duracion, precio_base=precio)
+
+    @classmethod
+    def crear_empleado(cls, nombre='Luis', apellido='Soto', puesto='conductor', salario=15000):
+        return Empleado.objects.create(
+            nombre=nombre, apellido=apellido, puesto=puesto, telefono='6640000000',
+            email=f'{nombre.lower()}@example.com', fecha_contratacion=date(2020, 1, 1), salario=salario)
+
+    @classmethod
+    def crear_pasajero(cls, nombre='Ana', apellido='López'):
+        return Pasajero.objects.create(
+            nombre=nombre, apellido=apellido, telefono='6641111111', email=f'{nombre.lower()}@example.com',
+            fecha_nacimiento=date(1990, 5, 1), direccion='Centro')
+
+    @classmethod
+    def crear_viaje(cls, salida, autobus=None, ruta=None, conductor=None, duracion=timedelta(hours=2), **extra):
+        autobus = autobus or cls.autobus
+        return Viaje.objects.create(
+            autobus=autobus, ruta=ruta or cls.ruta, conductor=conductor or cls.conductor,
+            fecha_salida=salida, fecha_llegada_estimada=salida + duracion,
+            asientos_disponibles=autobus.capacidad, **extra)
+
+    @classmethod
+    def crear_datos(cls, placa, capacidad=40, **ruta):
+        """Un autobús, una ruta, un conductor y un pasajero en ``cls``."""
+        cls.autobus = cls.crear_autobus(placa, capacidad)
+        cls.ruta = cls.crear_ruta(**ruta)
+        cls.conductor = cls.crear_empleado()
+        cls.pasajero = cls.crear_pasajero()
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Los planes se revisan con EXPLAIN QUERY PLAN de SQLite')
+class PlanConsultasTests(DatosMixin, TestCase):
+    """Cada consulta de las vistas debe usar un índice, nunca un recorrido completo.
+
+    Las exportaciones quedan fuera a propósito: leen toda la tabla por diseño.
+    """
+    # Tablas acotadas por diseño (una fila por estado de boleto)
+    TABLAS_PEQUENAS = {'app_autobuses_estadisticaboleto'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos('BUS-001', destino='Ensenada', distancia=105,
+                        duracion=timedelta(hours=1, minutes=30), precio=250)
+        cls.viaje = cls.crear_viaje(timezone.now() + timedelta(days=1))
+        cls.boleto = guardar_boleto(Boleto(
+            viaje=cls.viaje, pasajero=cls.pasajero, asiento_numero=1,
+            precio=250, estado='pagado', codigo_boleto='BTEST0001'))
+
+    def setUp(self):
+        cache.clear()
+
+    def escaneos_completos(self, url):
+        """Devuelve las líneas de plan que recorren una tabla sin índice."""
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url)
+        self.assertLess(respuesta.status_code, 400, url)
+        return self.escaneos_de(consultas)
+
+    def escaneos_de(self, consultas):
+        escaneos = []
+        with connection.cursor() as cursor:
+            for consulta in consultas.captured_queries:
+                sql = consulta['sql']
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                for fila in cursor.fetchall():
+                    detalle = fila[-1]
+                    escaneo = re.match(r'SCAN (\w+)( \(|$)', detalle)
+                    if escaneo and escaneo.group(1) not in self.TABLAS_PEQUENAS:
+                        escaneos.append(f'{detalle}  <-  {sql}')
+        return escaneos
+
+    def assertSinEscaneoCompleto(self, url):
+        escaneos = self.escaneos_completos(url)
+        self.assertEqual(escaneos, [], f'{url} hace recorridos completos:\n' + '\n'.join(escaneos))
+
+    def test_index(self):
+        self.assertSinEscaneoCompleto(reverse('index'))
+
+    def test_listados(self):
+        for nombre in ('autobus_listar', 'ruta_listar', 'empleado_listar',
+                       'pasajero_listar', 'viaje_listar', 'boleto_listar', 'plantilla_listar'):
+            with self.subTest(vista=nombre):
+                self.assertSinEscaneoCompleto(reverse(nombre))
+
+    def test_rutas_por_duracion(self):
+        self.assertSinEscaneoCompleto(reverse('ruta_listar') + '?orden=duracion')
+        self.assertSinEscaneoCompleto(reverse('ruta_listar') + '?duracion_min=1h&duracion_max=2:30&orden=-duracion')
+
+    def test_listado_boletos_con_filtros(self):
+        url = reverse('boleto_listar')
+        hoy = timezone.localdate().isoformat()
+        for consulta in ('estado=pagado', f'viaje={self.viaje.pk}', f'desde={hoy}&hasta={hoy}',
+                         f'estado=pagado&desde={hoy}'):
+            with self.subTest(filtros=consulta):
+                self.assertSinEscaneoCompleto(f'{url}?{consulta}')
+
+    def test_formularios_de_venta(self):
+        self.assertSinEscaneoCompleto(reverse('boleto_crear'))
+        self.assertSinEscaneoCompleto(reverse('boleto_editar', args=[self.boleto.pk]))
+        self.assertSinEscaneoCompleto(reverse('boleto_manual'))
+
+    def test_api(self):
+        self.assertSinEscaneoCompleto(reverse('api_buscar_viajes'))
+        self.assertSinEscaneoCompleto(reverse('api_buscar_viajes') + '?q=tij')
+        self.assertSinEscaneoCompleto(reverse('api_buscar_pasajeros') + '?q=lo')
+        self.assertSinEscaneoCompleto(reverse('api_mapa_asientos', args=[self.viaje.pk]))
+
+    def test_busqueda_de_viajes(self):
+        fecha = timezone.localtime(self.viaje.fecha_salida).date().isoformat()
+        consulta = f'?origen=tijuana&destino=ENSENADA&fecha={fecha}'
+        self.assertSinEscaneoCompleto(reverse('viaje_buscar') + consulta)
+        self.assertSinEscaneoCompleto(reverse('api_viajes_disponibles') + consulta)
+
+    def test_reporte_por_ruta(self):
+        for consulta in ('', '?agrupar=semana', f'?agrupar=mes&ruta={self.ruta.pk}'):
+            with self.subTest(filtros=consulta):
+                self.assertSinEscaneoCompleto(reverse('reporte_rutas') + consulta)
+
+    def test_choques_de_horario(self):
+        salida = self.viaje.fecha_salida + timedelta(hours=1)
+        with CaptureQueriesContext(connection) as consultas:
+            choques = horarios.conflictos(salida, salida + timedelta(hours=2), autobus_id=self.autobus.pk,
+                                          conductor_id=self.conductor.pk)
+        self.assertEqual(self.escaneos_de(consultas), [])
+        self.assertEqual([viaje['id'] for viaje in choques['autobus']], [self.viaje.pk])
+
+    def test_busqueda_se_invalida_al_vender(self):
+        url = reverse('api_viajes_disponibles') + '?' + urlencode({
+            'origen': ' TIJUÁNA ', 'destino': 'ensenada',
+            'fecha': timezone.localtime(self.viaje.fecha_salida).date().isoformat(),
+        })
+        resultados = self.client.get(url).json()['resultados']
+        self.assertEqual([(r['id'], r['asientos_disponibles']) for r in resultados], [(self.viaje.pk, 39)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            guardar_boleto(Boleto(viaje=self.viaje, pasajero=self.pasajero, asiento_numero=2,
+                                  precio=250, estado='pagado', codigo_boleto='BTEST0002'))
+        self.assertEqual(self.client.get(url).json()['resultados'][0]['asientos_disponibles'], 38)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            viaje = Viaje.objects.get(pk=self.viaje.pk)
+            viaje.estado = 'cancelado'
+            viaje.save()
+        self.assertEqual(self.client.get(url).json()['resultados'], [])
+
+
+class PaginacionTests(DatosMixin, TestCase):
+    """Los cursores del listado de boletos recorren todas las filas en ambos sentidos sin repetir ninguna."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos('BUS-911')
+        cls.viaje = cls.crear_viaje(timezone.make_aware(timezone.datetime(2030, 1, 10, 8, 0)))
+        cls.compra = timezone.make_aware(timezone.datetime(2029, 12, 1, 12, 0))
+        # Siete boletos; los minutos repetidos se desempatan por id
+        for asiento, minutos in enumerate((0, 10, 10, 20, 30, 30, 40), start=1):
+            cls.boleto(asiento, cls.compra + timedelta(minutes=minutos))
+        cls.orden = list(Boleto.objects.order_by('-fecha_compra', 'id').values_list('pk', flat=True))
+
+    @classmethod
+    def boleto(cls, asiento, fecha_compra):
+        boleto = guardar_boleto(Boleto(viaje=cls.viaje, pasajero=cls.pasajero, asiento_numero=asiento, precio=300,
+                                       estado='pagado', codigo_boleto=f'BPAG{asiento:04d}'))
+        Boleto.objects.filter(pk=boleto.pk).update(fecha_compra=fecha_compra)
+        return boleto
+
+    def pagina(self, **cursor):
+        pagina = paginar_keyset(Boleto.objects.all(), 'fecha_compra', tamano=3, **cursor)
+        return [boleto.pk for boleto in pagina['objetos']], pagina['anterior'], pagina['siguiente']
+
+    def test_hacia_adelante_y_atras(self):
+        paginas, cursores, siguiente = [], [], None
+        while True:
+            pks, anterior, siguiente = self.pagina(despues=siguiente)
+            paginas.append(pks)
+            cursores.append(anterior)
+            if siguiente is None:
+                break
+        self.assertEqual(paginas, [self.orden[:3], self.orden[3:6], self.orden[6:]])
+        # La primera página no tiene anterior; la última, siguiente
+        self.assertIsNone(cursores[0])
+        self.assertTrue(all(cursores[1:]))
+
+        # De la última hacia atrás se vuelven a ver las mismas páginas
+        atras, anterior = [], cursores[-1]
+        while anterior is not None:
+            pks, anterior, siguiente = self.pagina(antes=anterior)
+            self.assertIsNotNone(siguiente)
+            atras.append(pks)
+        self.assertEqual(atras, paginas[-2::-1])
+
+        asincrona = async_to_sync(apaginar_keyset)(Boleto.objects.all(), 'fecha_compra', tamano=3)
+        self.assertEqual([boleto.pk for boleto in asincrona['objetos']], paginas[0])
+
+    def test_cursores_invalidos(self):
+        primera = self.pagina()
+        for cursor in ('no-es-cursor', '!!!', codificar_cursor(self.compra, 1)[:-3], 'MjAyOXxhYmM'):
+            self.assertEqual(self.pagina(despues=cursor), primera)
+            self.assertEqual(self.pagina(antes=cursor), primera)
+        respuesta = self.client.get(reverse('boleto_listar'), {'despues': '!!!'})
+        self.assertEqual([boleto.pk for boleto in respuesta.context['boletos']], self.orden)
+        self.assertIsNone(respuesta.context['cursor_anterior'])
+
+    def test_altas_entre_peticiones(self):
+        _, _, siguiente = self.pagina()
+        segunda = self.pagina(despues=siguiente)
+        # Un boleto nuevo al principio no recorre las filas de la página siguiente
+        nuevo = self.boleto(8, self.compra + timedelta(hours=1))
+        self.assertEqual(self.pagina(despues=siguiente), segunda)
+        self.assertEqual(self.pagina()[0], [nuevo.pk, *self.orden[:2]])
+        # Tampoco uno con la misma fecha que la última fila mostrada y un id mayor: va después
+        empate = self.boleto(9, Boleto.objects.get(pk=self.orden[2]).fecha_compra)
+        self.assertEqual(self.pagina(despues=siguiente)[0], [empate.pk, *segunda[0][:2]])
+
+        respuesta = self.client.get(reverse('boleto_listar'), {'despues': siguiente})
+        self.assertEqual([boleto.pk for boleto in respuesta.context['boletos']], [empate.pk, *self.orden[3:]])
+        self.assertIsNotNone(respuesta.context['cursor_anterior'])
+        self.assertIsNone(respuesta.context['cursor_siguiente'])
+
+
+class PerfilProduccionTests(SimpleTestCase):
+    """El perfil ``SISTEMA_DB=produccion`` aplica sus PRAGMA, BEGIN IMMEDIATE y conexiones persistentes."""
+
+    def settings_con(self, **entorno):
+        with mock.patch.dict(os.environ, entorno):
+            return runpy.run_path(os.path.join(settings.BASE_DIR, 'sistema_autobuses', 'settings.py'))
+
+    def test_pragmas_al_conectar(self):
+        carpeta = self.enterContext(tempfile.TemporaryDirectory())
+        nombre = os.path.join(carpeta, 'produccion.sqlite3')
+        perfil = self.settings_con(SISTEMA_DB='produccion', SISTEMA_DB_NOMBRE=nombre)['DATABASES']['default']
+        self.assertEqual(perfil['NAME'], nombre)
+        # Con un alias propio: no toca la base de pruebas ni las conexiones de default
+        configurado = ConnectionHandler({'default': perfil}).settings['default']
+        conexion = load_backend(configurado['ENGINE']).DatabaseWrapper(configurado, 'produccion')
+        self.addCleanup(conexion.close)
+
+        with conexion.cursor() as cursor:
+            valores = {}
+            for pragma in ('journal_mode', 'synchronous', 'mmap_size', 'cache_size', 'busy_timeout', 'temp_store'):
+                cursor.execute(f'PRAGMA {pragma}')
+                valores[pragma] = cursor.fetchone()[0]
+        self.assertEqual(valores, {'journal_mode': 'wal', 'synchronous': 1, 'mmap_size': 268435456,
+                                   'cache_size': -65536, 'busy_timeout': 10000, 'temp_store': 2})
+
+        # BEGIN IMMEDIATE: el bloqueo de escritura se toma al abrir la transacción, antes de escribir
+        otra = sqlite3.connect(nombre, timeout=0, isolation_level=None)
+        self.addCleanup(otra.close)
+        # Lo mismo que hace atomic() al abrir la transacción, con esta conexión
+        conexion.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        try:
+            with self.assertRaisesMessage(sqlite3.OperationalError, 'database is locked'):
+                otra.execute('BEGIN IMMEDIATE')
+        finally:
+            conexion.rollback()
+            conexion.set_autocommit(True)
+
+        # CONN_MAX_AGE: al terminar una petición la conexión sigue abierta
+        self.assertEqual((perfil['CONN_MAX_AGE'], perfil['CONN_HEALTH_CHECKS']), (600, True))
+        conexion.close_if_unusable_or_obsolete()
+        self.assertIsNotNone(conexion.connection)
+
+    def test_asgi_sin_conexiones_persistentes(self):
+        perfil = self.settings_con(SISTEMA_DB='produccion', SISTEMA_ASGI='1')['DATABASES']['default']
+        self.assertEqual(perfil['CONN_MAX_AGE'], 0)
+        self.assertEqual(perfil['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+
+
+class DuracionesTests(DatosMixin, TestCase):
+    def test_formatos_aceptados(self):
+        for texto, minutos in [('2h 30m', 150), ('2h', 120), ('45 min', 45), ('2:05', 125),
+                               ('1.5 h', 90), ('150', 150), ('unas horas', None), ('', None)]:
+            with self.subTest(texto=texto):
+                self.assertEqual(duraciones.minutos(texto), minutos)
+        self.assertEqual(duraciones.formatear(timedelta(minutes=150)), '2h 30m')
+        self.assertEqual(duraciones.formatear(timedelta(hours=3)), '3h')
+
+    def test_viaje_form_calcula_la_llegada(self):
+        autobus = self.crear_autobus('BUS-201')
+        ruta = self.crear_ruta(duracion=duraciones.a_timedelta('2h 45m'))
+        conductor = self.crear_empleado()
+        datos = {'autobus': autobus.pk, 'ruta': ruta.pk, 'conductor': conductor.pk, 'estado': 'programado',
+                 'fecha_salida': '2030-01-10T08:00', 'fecha_llegada_estimada': ''}
+        form = ViajeForm(datos)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['fecha_llegada_estimada'] - form.cleaned_data['fecha_salida'],
+                         timedelta(hours=2, minutes=45))
+        self.assertIn('data-minutos="165"', str(form['ruta']))
+
+
+class CargaYBenchmarkTests(TestCase):
+    """``seed_load`` deja datos coherentes y ``benchmark_vistas`` detecta regresiones."""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_load', autobuses=3, rutas=5, empleados=4, pasajeros=30,
+                     viajes=40, boletos=300, semilla=7, stdout=io.StringIO())
+
+    def test_volumenes(self):
+        self.assertEqual(Autobus.objects.count(), 3)
+        self.assertEqual(Viaje.objects.count(), 40)
+        self.assertTrue(0 < Boleto.objects.count() <= 300)
+
+    def test_fechas(self):
+        viajes = Viaje.objects.select_related('ruta')
+        self.assertTrue(all(viaje.fecha_llegada_estimada - viaje.fecha_salida == viaje.ruta.duracion_estimada
+                            for viaje in viajes))
+        # Las fechas de compra quedan repartidas antes de cada salida y el campo sigue siendo auto_now_add
+        compras = Boleto.objects.select_related('viaje').only('fecha_compra', 'viaje__fecha_salida')
+        self.assertTrue(all(boleto.fecha_compra < boleto.viaje.fecha_salida for boleto in compras))
+        self.assertGreater(len({boleto.fecha_compra.date() for boleto in compras}), 10)
+        self.assertTrue(Boleto._meta.get_field('fecha_compra').auto_now_add)
+
+    def test_mapas_y_estadisticas_coherentes(self):
+        self.assertEqual(obtener_estadisticas(), calcular_desde_boletos())
+        self.assertEqual(resumenes.reconstruir(simular=True), {'nuevas': 0, 'cambiadas': 0, 'sobrantes': 0})
+        viajes = Viaje.objects.select_related('autobus').annotate(
+            vigentes=Count('boleto', filter=~Q(boleto__estado='cancelado')))
+        for viaje in viajes:
+            with self.subTest(viaje=viaje.pk):
+                mapa = MapaAsientos.de_viaje(viaje)
+                self.assertEqual(mapa.total_ocupados(), viaje.vigentes)
+                self.assertEqual(viaje.asientos_disponibles, viaje.autobus.capacidad - viaje.vigentes)
+
+    def test_benchmark_contra_linea_base(self):
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = os.path.join(carpeta, 'base.json')
+            call_command('benchmark_vistas', repeticiones=1, calentamiento=0, salida=ruta, stdout=io.StringIO())
+            with open(ruta, encoding='utf-8') as archivo:
+                base = json.load(archivo)
+            self.assertIn('boleto_listar', base['vistas'])
+            self.assertIn('exportar_datos[boletos]', base['vistas'])
+
+            # Una línea base con menos consultas hace fallar la comparación
+            base['vistas']['boleto_listar']['consultas'] = 0
+            with open(ruta, 'w', encoding='utf-8') as archivo:
+                json.dump(base, archivo)
+            with self.assertRaisesMessage(CommandError, 'boleto_listar'):
+                call_command('benchmark_vistas', repeticiones=1, calentamiento=0, base=ruta,
+                             solo=['boleto_listar'], stdout=io.StringIO())
+
+
+class ItinerariosTests(DatosMixin, TestCase):
+    """Red A -> B -> C más una ruta directa A -> C, más cara pero más corta."""
+
+    @classmethod
+    def setUpTestData(cls):
+        autobus = cls.crear_autobus('BUS-101')
+        conductor = cls.crear_empleado('Juan', 'Pérez')
+        rutas = {}
+        for origen, destino, precio, minutos in [('Ciudad A', 'Ciudad B', 100, 60),
+                                                 ('Ciudad B', 'Ciudad C', 100, 60),
+                                                 ('Ciudad A', 'Ciudad C', 500, 90)]:
+            rutas[origen[-1] + destino[-1]] = cls.crear_ruta(origen, destino, timedelta(minutes=minutos), precio,
+                                                            distancia=100)
+        cls.rutas = rutas
+        cls.inicio = timezone.now().replace(microsecond=0) + timedelta(days=1)
+        cls.viajes = {}
+        for nombre, ruta, sale, llega in [('AB', 'AB', 60, 120), ('BC_justo', 'BC', 130, 190),
+                                          ('BC', 'BC', 180, 240), ('AC', 'AC', 300, 390)]:
+            cls.viajes[nombre] = cls.crear_viaje(cls.inicio + timedelta(minutes=sale), autobus, rutas[ruta],
+                                                 conductor, timedelta(minutes=llega - sale))
+
+    def setUp(self):
+        self.grafo = itinerarios.Grafo.construir()
+
+    def ciudades(self, itinerario):
+        return [(tramo['origen'], tramo['destino']) for tramo in itinerario['tramos']]
+
+    def test_mejor_ruta_por_criterio(self):
+        barata = self.grafo.mejor_ruta('ciudad a', 'CIUDAD C', 'precio')
+        self.assertEqual(self.ciudades(barata), [('Ciudad A', 'Ciudad B'), ('Ciudad B', 'Ciudad C')])
+        self.assertEqual(barata['precio'], 200)
+        rapida = self.grafo.mejor_ruta('Ciudad A', 'Ciudad C', 'duracion')
+        self.assertEqual(self.ciudades(rapida), [('Ciudad A', 'Ciudad C')])
+        self.assertEqual(self.ciudades(self.grafo.mejor_ruta('Ciudad A', 'Ciudad C', 'precio', max_tramos=1)),
+                         [('Ciudad A', 'Ciudad C')])
+        self.assertIsNone(self.grafo.mejor_ruta('Ciudad C', 'Ciudad A'))
+
+    def test_salidas_respetan_el_transbordo(self):
+        itinerario = self.grafo.planear_salidas('Ciudad A', 'Ciudad C', self.inicio, 'llegada')
+        # El B -> C de las 2:10 no deja 30 minutos de transbordo
+        self.assertEqual([tramo['viaje'] for tramo in itinerario['tramos']],
+                         [self.viajes['AB'].pk, self.viajes['BC'].pk])
+        self.assertEqual(itinerario['minutos'], 180)
+        sin_transbordo = self.grafo.planear_salidas('Ciudad A', 'Ciudad C', self.inicio, transbordo=timedelta(0))
+        self.assertEqual(sin_transbordo['tramos'][-1]['viaje'], self.viajes['BC_justo'].pk)
+        # Saliendo después del A -> B solo queda el directo
+        tarde = self.grafo.planear_salidas('Ciudad A', 'Ciudad C', self.inicio + timedelta(minutes=90), 'precio')
+        self.assertEqual([tramo['viaje'] for tramo in tarde['tramos']], [self.viajes['AC'].pk])
+
+    def test_actualizacion_incremental(self):
+        itinerarios._grafo, itinerarios._version = self.grafo, cache.get(itinerarios.CLAVE_VERSION)
+        self.addCleanup(setattr, itinerarios, '_grafo', None)
+        ruta = self.rutas['AC']
+        ruta.activa = False
+        with self.captureOnCommitCallbacks(execute=True):
+            ruta.save()
+        # Se quitó la arista en el grafo existente, sin reconstruirlo
+        self.assertIs(itinerarios.grafo(), self.grafo)
+        self.assertNotIn(ruta.pk, self.grafo.aristas)
+        rapida = self.grafo.mejor_ruta('Ciudad A', 'Ciudad C', 'duracion')
+        self.assertEqual(self.ciudades(rapida), [('Ciudad A', 'Ciudad B'), ('Ciudad B', 'Ciudad C')])
+
+
+class HorariosTests(DatosMixin, TestCase):
+    """Un autobús o un conductor no pueden estar en dos viajes a la vez."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autobuses = [cls.crear_autobus(f'BUS-30{i}') for i in range(2)]
+        cls.conductores = [cls.crear_empleado(nombre) for nombre in ('Luis', 'Mario')]
+        cls.ruta = cls.crear_ruta()
+        cls.salida = timezone.make_aware(timezone.datetime(2030, 1, 10, 8, 0))
+        cls.viaje = cls.crear_viaje(cls.salida, cls.autobuses[0], conductor=cls.conductores[0])
+
+    def datos(self, autobus=0, conductor=0, salida='2030-01-10T09:00', **extra):
+        return {'autobus': self.autobuses[autobus].pk, 'ruta': self.ruta.pk,
+                'conductor': self.conductores[conductor].pk, 'estado': 'programado', 'fecha_salida': salida,
+                'fecha_llegada_estimada': '', **extra}
+
+    def test_formulario_rechaza_choques(self):
+        form = ViajeForm(self.datos())
+        self.assertFalse(form.is_valid())
+        self.assertIn(f'ya tiene el viaje {self.viaje.pk} ', form.errors['autobus'][0])
+        self.assertIn('conductor', form.errors)
+        self.assertNotIn('conductor', ViajeForm(self.datos(conductor=1)).errors)
+        # Seguido del otro, cancelado o editando el mismo viaje no hay choque
+        self.assertTrue(ViajeForm(self.datos(salida='2030-01-10T10:00')).is_valid())
+        self.assertTrue(ViajeForm(self.datos(estado='cancelado')).is_valid())
+        self.assertTrue(ViajeForm(self.datos(), instance=self.viaje).is_valid())
+
+    def test_formulario_solo_ofrece_conductores(self):
+        auxiliar = self.crear_empleado('Ana', 'Ruiz', 'auxiliar', 12000)
+        self.assertNotIn(auxiliar, ViajeForm().fields['conductor'].queryset)
+        datos = {**self.datos(salida='2030-01-11T08:00'), 'conductor': auxiliar.pk}
+        self.assertIn('conductor', ViajeForm(datos).errors)
+
+    def test_validar_todo_el_horario(self):
+        for autobus, conductor, horas in [(0, 1, 1), (1, 1, 1.5), (1, 0, 2.5)]:
+            salida = self.salida + timedelta(hours=horas)
+            self.crear_viaje(salida, self.autobuses[autobus], conductor=self.conductores[conductor])
+        choques = list(horarios.solapamientos())
+        self.assertEqual(sorted((choque.recurso, choque.recurso_id) for choque in choques),
+                         [('autobus', self.autobuses[0].pk), ('autobus', self.autobuses[1].pk),
+                          ('conductor', self.conductores[1].pk)])
+
+        salida = io.StringIO()
+        with self.assertRaisesMessage(CommandError, '3 choques: 2 de autobús, 1 de conductor.'):
+            call_command('validar_horarios', estricto=True, stdout=salida)
+        self.assertIn('Autobús BUS-300', salida.getvalue())
+
+
+class AsientosTests(DatosMixin, TestCase):
+    """El mapa de bits de cada viaje sigue a sus boletos vigentes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos('BUS-801')
+        cls.salida = timezone.make_aware(timezone.datetime(2030, 1, 10, 8, 0))
+        cls.viaje = cls.crear_viaje(cls.salida)
+
+    def ocupacion(self, viaje):
+        viaje = Viaje.objects.select_related('autobus').get(pk=viaje.pk)
+        return MapaAsientos.de_viaje(viaje).ocupados(), viaje.asientos_disponibles
+
+    def boleto(self, asiento, viaje=None, **extra):
+        return guardar_boleto(Boleto(viaje=viaje or self.viaje, pasajero=self.pasajero, asiento_numero=asiento,
+                                     precio=300, estado=extra.pop('estado', 'pagado'),
+                                     codigo_boleto=f'BASI{asiento:04d}', **extra))
+
+    def test_bloque_libre_prefiere_menos_filas(self):
+        mapa = MapaAsientos(12)
+        mapa.ocupar(1)
+        mapa.ocupar(2)
+        # 3-5 cruza de la primera fila a la segunda; 5-7 cabe en la segunda
+        self.assertEqual(mapa.bloque_libre(3), [5, 6, 7])
+        self.assertEqual(mapa.bloque_libre(2), [3, 4])
+        # Ningún bloque de 5 cabe en una fila: el de número más bajo
+        self.assertEqual(mapa.bloque_libre(5), [3, 4, 5, 6, 7])
+        self.assertIsNone(mapa.bloque_libre(11))
+        self.assertIsNone(mapa.bloque_libre(0))
+
+    def test_cambio_cancelacion_y_reactivacion(self):
+        boleto = self.boleto(1)
+        self.assertEqual(self.ocupacion(self.viaje), ([1], 39))
+        boleto.asiento_numero = 5
+        guardar_boleto(boleto)
+        self.assertEqual(self.ocupacion(self.viaje), ([5], 39))
+        boleto.estado = 'cancelado'
+        guardar_boleto(boleto)
+        self.assertEqual(self.ocupacion(self.viaje), ([], 40))
+
+        # Mientras estuvo cancelado otro boleto tomó su asiento
+        self.boleto(5)
+        boleto.estado = 'pagado'
+        with self.assertRaisesMessage(asientos.AsientoNoDisponible, 'El asiento 5 ya está ocupado'):
+            guardar_boleto(boleto)
+        boleto.asiento_numero = 6
+        guardar_boleto(boleto)
+        self.assertEqual(self.ocupacion(self.viaje), ([5, 6], 38))
+        boleto.delete()
+        self.assertEqual(self.ocupacion(self.viaje), ([5], 39))
+
+    def test_mover_a_otro_viaje(self):
+        otro = self.crear_viaje(self.salida + timedelta(days=1))
+        boleto = self.boleto(3)
+        boleto.viaje = otro
+        guardar_boleto(boleto)
+        self.assertEqual(self.ocupacion(self.viaje), ([], 40))
+        self.assertEqual(self.ocupacion(otro), ([3], 39))
+
+    def test_restriccion_de_la_base(self):
+        self.boleto(7)
+        duplicado = dict(viaje=self.viaje, pasajero=self.pasajero, asiento_numero=7, precio=300)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Boleto.objects.create(estado='pagado', codigo_boleto='BASI9999', **duplicado)
+        # Un boleto cancelado no ocupa el asiento
+        Boleto.objects.create(estado='cancelado', codigo_boleto='BASI9998', **duplicado)
+
+    def test_venta_con_mapa_desfasado(self):
+        self.boleto(2)
+        # Mapa vacío por error y el otro boleto vendido después de validar el formulario:
+        # la restricción única de la base evita el segundo boleto
+        Viaje.objects.filter(pk=self.viaje.pk).update(ocupacion=b'')
+        with mock.patch.object(Boleto, 'validate_constraints'):
+            respuesta = self.client.post(reverse('boleto_crear'), {
+                'viaje': self.viaje.pk, 'pasajero': self.pasajero.pk, 'asiento_numero': 2,
+                'precio': 300, 'estado': 'pagado'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context['form'].errors['asiento_numero'], [views.ASIENTO_OCUPADO])
+        self.assertEqual(Boleto.objects.count(), 1)
+
+    def test_mapa_en_cache_y_etag(self):
+        cache.clear()
+        url = reverse('api_mapa_asientos', args=[self.viaje.pk])
+        respuesta = self.client.get(url)
+        etag = respuesta['ETag']
+        self.assertEqual((respuesta.json()['ocupados'], respuesta.json()['asientos_disponibles']), ([], 40))
+        # Con el mapa en caché y el mismo ETag: 304 sin consultas
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Un cambio sin señales no se ve hasta invalidar el mapa
+        Viaje.objects.filter(pk=self.viaje.pk).update(asientos_disponibles=39)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            asientos.invalidar_mapa(self.viaje.pk)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(reverse('api_mapa_asientos', args=[0])).status_code, 404)
+
+    def test_etag_tras_venta_y_cancelacion(self):
+        cache.clear()
+        url = reverse('api_mapa_asientos', args=[self.viaje.pk])
+        etags = [self.client.get(url)['ETag']]
+        with self.captureOnCommitCallbacks(execute=True):
+            boleto = self.boleto(9)
+        self.assertIsNone(cache.get(asientos._clave_mapa(self.viaje.pk)))
+        respuesta = self.client.get(url, HTTP_IF_NONE_MATCH=etags[0])
+        self.assertEqual((respuesta.status_code, respuesta.json()['ocupados']), (200, [9]))
+        etags.append(respuesta['ETag'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            boleto.estado = 'cancelado'
+            guardar_boleto(boleto)
+        respuesta = self.client.get(url, HTTP_IF_NONE_MATCH=etags[1])
+        datos = respuesta.json()
+        self.assertEqual((respuesta.status_code, datos['ocupados'], datos['por_estado']['cancelado']), (200, [], 1))
+        etags.append(respuesta['ETag'])
+        # Mismos asientos libres que al principio, pero otro conteo por estado: otro ETag
+        self.assertEqual(len(set(etags)), 3)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etags[2]).status_code, 304)
+
+    def test_formulario_de_viaje(self):
+        datos = {'autobus': self.autobus.pk, 'ruta': self.ruta.pk, 'conductor': self.conductor.pk,
+                 'estado': 'programado', 'fecha_salida': '2030-01-12T08:00', 'fecha_llegada_estimada': ''}
+        viaje = ViajeForm(datos).save()
+        self.assertEqual(self.ocupacion(viaje), ([], 40))
+
+        self.boleto(35, viaje)
+        chico, grande = self.crear_autobus('BUS-802', 30), self.crear_autobus('BUS-803', 50)
+        form = ViajeForm({**datos, 'autobus': chico.pk}, instance=Viaje.objects.get(pk=viaje.pk))
+        self.assertIn('ya tiene vendido el asiento 35', form.errors['autobus'][0])
+        ViajeForm({**datos, 'autobus': grande.pk}, instance=Viaje.objects.get(pk=viaje.pk)).save()
+        self.assertEqual(self.ocupacion(viaje), ([35], 49))
+
+    def test_capacidad_del_autobus(self):
+        cache.clear()
+        otro = self.crear_viaje(self.salida + timedelta(days=1))
+        self.boleto(35)
+        # Un boleto cancelado no cuenta para la capacidad mínima
+        self.boleto(38, otro, estado='cancelado')
+        self.assertEqual(asientos.obtener_mapa(self.viaje.pk)[0]['capacidad'], 40)
+        url = reverse('autobus_editar', args=[self.autobus.pk])
+        datos = {'modelo': '9700', 'marca': 'Volvo', 'placa': 'BUS-801', 'año': 2020, 'estado': 'activo'}
+
+        respuesta = self.client.post(url, {**datos, 'capacidad': 30})
+        self.assertIn('ya tiene vendido el asiento 35', respuesta.context['form'].errors['capacidad'][0])
+        self.assertEqual(self.ocupacion(self.viaje), ([35], 39))
+
+        for capacidad in (36, 50):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertRedirects(self.client.post(url, {**datos, 'capacidad': capacidad}),
+                                     reverse('autobus_listar'))
+            self.assertEqual(self.ocupacion(self.viaje), ([35], capacidad - 1))
+            self.assertEqual(self.ocupacion(otro), ([], capacidad))
+            # El mapa en caché se descartó
+            mapa = asientos.obtener_mapa(self.viaje.pk)[0]
+            self.assertEqual((mapa['capacidad'], mapa['asientos_disponibles']), (capacidad, capacidad - 1))
+        self.boleto(50)
+        self.assertEqual(self.ocupacion(self.viaje), ([35, 50], 48))
+
+        # Un asiento vendido mientras se editaba: no se cambia nada
+        autobus = Autobus.objects.get(pk=self.autobus.pk)
+        autobus.capacidad = 40
+        with self.assertRaises(asientos.AsientoNoDisponible), transaction.atomic():
+            autobus.save()
+        self.assertEqual(Autobus.objects.get(pk=self.autobus.pk).capacidad, 50)
+
+
+class VentaMultipleTests(DatosMixin, TestCase):
+    """``api_venta_multiple`` vende todos los boletos o ninguno."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos('BUS-811')
+        cls.otro = cls.crear_pasajero('Eva', 'Ruiz')
+        cls.viaje = cls.crear_viaje(timezone.make_aware(timezone.datetime(2030, 1, 10, 8, 0)))
+        guardar_boleto(Boleto(viaje=cls.viaje, pasajero=cls.pasajero, asiento_numero=3, precio=300,
+                              estado='pagado', codigo_boleto='BVEN0003'))
+
+    def setUp(self):
+        # Los números de código reservados se deshacen con la transacción de la prueba
+        self.addCleanup(codigos._bloques.clear)
+
+    def vender(self, boletos, viaje=None, **extra):
+        datos = {'viaje': viaje or self.viaje.pk, 'boletos': boletos, **extra}
+        return self.client.post(reverse('api_venta_multiple'), json.dumps(datos), content_type='application/json')
+
+    def entrada(self, asiento=None, pasajero=None):
+        return {'pasajero': (pasajero or self.pasajero).pk, 'asiento': asiento, 'precio': '280.00'}
+
+    def assertSinVenta(self, respuesta, status, asientos=None):
+        self.assertEqual(respuesta.status_code, status)
+        if asientos is not None:
+            self.assertEqual(respuesta.json()['asientos'], asientos)
+        viaje = Viaje.objects.get(pk=self.viaje.pk)
+        self.assertEqual(Boleto.objects.count(), 1)
+        self.assertEqual(MapaAsientos.de_viaje(viaje).ocupados(), [3])
+        self.assertEqual(viaje.asientos_disponibles, 39)
+
+    def test_un_asiento_ocupado_cancela_todo(self):
+        respuesta = self.vender([self.entrada(4), self.entrada(3, self.otro), self.entrada(41)])
+        self.assertSinVenta(respuesta, 409, [3, 41])
+
+    def test_asientos_repetidos(self):
+        self.assertSinVenta(self.vender([self.entrada(5), self.entrada(5, self.otro)]), 409, [5])
+
+    def test_asientos_automaticos(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.vender([self.entrada(), self.entrada(1), self.entrada(pasajero=self.otro)])
+        self.assertEqual(respuesta.status_code, 201)
+        vendidos = respuesta.json()['boletos']
+        # El 1 lo pidió una entrada; 2 y 4 no son contiguos, el primer bloque de dos en una fila es 5-6
+        self.assertEqual([boleto['asiento'] for boleto in vendidos], [5, 1, 6])
+        self.assertEqual(len({boleto['codigo'] for boleto in vendidos}), 3)
+        viaje = Viaje.objects.get(pk=self.viaje.pk)
+        self.assertEqual(MapaAsientos.de_viaje(viaje).ocupados(), [1, 3, 5, 6])
+        self.assertEqual(viaje.asientos_disponibles, 36)
+        self.assertEqual(obtener_estadisticas(), calcular_desde_boletos())
+
+    def test_datos_invalidos(self):
+        url = reverse('api_venta_multiple')
+        self.assertSinVenta(self.client.post(url, 'no es json', content_type='application/json'), 400)
+        self.assertSinVenta(self.client.post(url, json.dumps({'viaje': self.viaje.pk}),
+                                             content_type='application/json'), 400)
+        self.assertSinVenta(self.vender([]), 400)
+        self.assertSinVenta(self.vender([{'pasajero': self.pasajero.pk, 'precio': 'gratis'}]), 400)
+        self.assertSinVenta(self.vender([{**self.entrada(4), 'precio': -1}]), 400)
+        self.assertSinVenta(self.vender([self.entrada(4, Pasajero(pk=999999))]), 400)
+        self.assertSinVenta(self.vender([self.entrada(4)], estado='cancelado'), 400)
+        self.assertSinVenta(self.vender([self.entrada(4)], viaje=999999), 404)
+        self.assertEqual(self.client.get(url).status_code, 405)
+
+
+class CodigosTests(DatosMixin, TestCase):
+    """Códigos sin colisiones, con carácter de control y validables sin consultar la base."""
+
+    def setUp(self):
+        # Los números de código reservados se deshacen con la transacción de la prueba
+        self.addCleanup(codigos._bloques.clear)
+
+    def muestra(self):
+        return [codigos.formatear(codigos.permutar(numero)) for numero in (0, 1, 2, 12345, 2 ** 40 - 1)]
+
+    def test_permutacion_biyectiva(self):
+        numeros = [*range(4096), *range(2 ** 40 - 4096, 2 ** 40)]
+        permutados = [codigos.permutar(numero) for numero in numeros]
+        self.assertEqual(len(set(permutados)), len(numeros))
+        self.assertTrue(all(0 <= numero < 2 ** 40 for numero in permutados))
+
+        # Deshaciendo las rondas de Feistel se recupera el número original
+        def inversa(numero):
+            izquierda, derecha = numero >> codigos.MITAD, numero & codigos.MASCARA_MITAD
+            for numero_ronda in reversed(range(codigos.RONDAS)):
+                izquierda, derecha = derecha ^ codigos._ronda(numero_ronda, izquierda), izquierda
+            return (izquierda << codigos.MITAD) | derecha
+        self.assertEqual([inversa(numero) for numero in permutados], numeros)
+
+    def test_control_detecta_errores(self):
+        for codigo in self.muestra():
+            self.assertTrue(codigos.codigo_valido(codigo))
+            for posicion in range(1, len(codigo)):
+                for caracter in codigos.ALFABETO.replace(codigo[posicion], ''):
+                    otro = codigo[:posicion] + caracter + codigo[posicion + 1:]
+                    self.assertFalse(codigos.codigo_valido(otro), otro)
+                if posicion + 1 < len(codigo) and codigo[posicion] != codigo[posicion + 1]:
+                    cambiado = codigo[:posicion] + codigo[posicion + 1] + codigo[posicion] + codigo[posicion + 2:]
+                    # Luhn mod 32 solo no ve el cambio de 0 por Z (valores 0 y 31)
+                    if {codigo[posicion], codigo[posicion + 1]} != {'0', 'Z'}:
+                        self.assertFalse(codigos.codigo_valido(cambiado), cambiado)
+
+    def test_normalizar(self):
+        codigo = codigos.formatear(0b00001_11111_00000_00001_00000_00001_00001_00000, codigos.PREFIJO_MANUAL)
+        self.assertEqual(codigo[1:-1], '1Z010110')
+        escrito = f' {codigo[0].lower()}lz-o1o i1O{codigo[-1].lower()} '
+        self.assertEqual(codigos.normalizar_codigo(escrito), codigo)
+        # Los códigos anteriores conservan el guion y no se corrigen
+        self.assertEqual(codigos.normalizar_codigo('man-00ab12cd'), 'MAN-00AB12CD')
+        self.assertEqual(codigos.normalizar_codigo(None), '')
+        self.assertTrue(codigos.es_codigo_anterior('B00AB12CD'))
+
+    def test_api_validar(self):
+        self.crear_datos('BUS-851')
+        viaje = self.crear_viaje(timezone.make_aware(timezone.datetime(2030, 1, 10, 8, 0)))
+        boleto = guardar_boleto(Boleto(viaje=viaje, pasajero=self.pasajero, asiento_numero=4, precio=300,
+                                       estado='pagado', codigo_boleto=codigos.generar_codigo()))
+        url = reverse('api_validar_boleto')
+        mal_escrito = boleto.codigo_boleto[:-1] + ('0' if boleto.codigo_boleto[-1] != '0' else '1')
+        with self.assertNumQueries(0):
+            respuesta = self.client.get(url, {'codigo': mal_escrito})
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(self.client.get(url, {'codigo': codigos.formatear(1)}).status_code, 404)
+        respuesta = self.client.get(url, {'codigo': boleto.codigo_boleto.lower()})
+        self.assertEqual((respuesta.status_code, respuesta.json()['asiento']), (200, 4))
+
+    @override_settings(CODIGOS_TAMANO_BLOQUE=5)
+    def test_bloques_sin_repetir(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            emitidos = codigos.generar_codigos(3)
+        self.assertEqual(codigos._bloques, [(3, 5)])
+        # El sobrante del bloque se reparte sin consultar la base
+        with self.assertNumQueries(0):
+            emitidos += codigos.generar_codigos(2, codigos.PREFIJO_MANUAL)
+        with self.captureOnCommitCallbacks(execute=True):
+            emitidos += codigos.generar_codigos(7)
+        self.assertEqual(len({codigo[1:] for codigo in emitidos}), 12)
+        self.assertTrue(all(codigos.codigo_valido(codigo) for codigo in emitidos))
+
+        # Si la venta se revierte, el sobrante de su reserva no se reparte
+        codigos._bloques.clear()
+        with self.assertRaises(RuntimeError), self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                codigos.generar_codigos(1)
+                raise RuntimeError
+        self.assertEqual(codigos._bloques, [])
+
+
+class ImportacionTests(DatosMixin, TestCase):
+    """Las filas con error se reportan una por una y las demás se importan."""
+
+    AUTOBUSES = 'modelo,marca,placa,año,capacidad,estado\n'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_autobus('BUS-821')
+
+    def importar(self, recurso, contenido, formato='csv', **opciones):
+        errores = []
+        texto = io.TextIOWrapper(io.BytesIO(contenido.encode() if isinstance(contenido, str) else contenido),
+                                 encoding='utf-8-sig', newline='')
+        resumen = importacion.importar(recurso, texto, formato, al_error=lambda *error: errores.append(error),
+                                       **opciones)
+        return resumen, errores
+
+    def test_csv_y_jsonl(self):
+        resumen, errores = self.importar('pasajeros', (
+            'nombre,apellido,telefono,email,fecha_nacimiento,direccion\n'
+            'Eva,Ruiz,6642222222,eva@example.com,1985-02-03,Centro\n'
+            'Sin,Correo,6643333333,no-es-correo,1985-02-03,Centro\n'))
+        self.assertEqual(resumen, {'creados': 1, 'errores': 1})
+        self.assertEqual([(numero, mensajes[0].split(':')[0]) for numero, mensajes in errores], [(2, 'email')])
+
+        resumen, errores = self.importar('autobuses', '\n'.join([
+            json.dumps({'modelo': '9700', 'marca': 'Volvo', 'placa': placa, 'año': 2020, 'capacidad': 40,
+                        'estado': 'activo'}) for placa in ('BUS-822', 'BUS-821', 'BUS-822')] + ['[1, 2]']), 'jsonl')
+        self.assertEqual(resumen, {'creados': 1, 'errores': 3})
+        self.assertEqual([numero for numero, _ in errores], [2, 3, 4])
+        self.assertTrue(Autobus.objects.filter(placa='BUS-822').exists())
+
+    def test_fila_ilegible_para_csv(self):
+        fila = '9700,Volvo,{},2020,40,activo\n'
+        contenido = self.AUTOBUSES + fila.format('BUS-823') + '"' + 'x' * (csv.field_size_limit() + 1) + '"\n'
+        resumen, errores = self.importar('autobuses', contenido + fila.format('BUS-824'))
+        self.assertEqual(resumen, {'creados': 2, 'errores': 1})
+        self.assertEqual(errores[0][0], 2)
+        self.assertTrue(errores[0][1][0].startswith('csv: '))
+
+    def test_archivo_que_no_es_utf8(self):
+        contenido = (self.AUTOBUSES + '9700,Volvo,BUS-825,2020,40,activo\n').encode() + 'Ñandú'.encode('latin-1')
+        resumen, errores = self.importar('autobuses', contenido)
+        self.assertEqual(resumen['errores'], 1)
+        self.assertIn('no es texto UTF-8 válido', errores[0][1][0])
+
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = os.path.join(carpeta, 'autobuses.csv')
+            with open(ruta, 'wb') as archivo:
+                archivo.write(contenido)
+            salida, errores = io.StringIO(), io.StringIO()
+            call_command('importar_datos', 'autobuses', ruta, stdout=salida, stderr=errores)
+        self.assertIn('Fila 1: archivo: no es texto UTF-8 válido', errores.getvalue())
+        self.assertIn('0 registros importados, 1 filas con errores.', salida.getvalue())
+        with self.assertRaisesMessage(CommandError, 'No se pudo leer el archivo'):
+            call_command('importar_datos', 'autobuses', ruta)
+
+    def test_choque_en_la_base(self):
+        filas = [f'9700,Volvo,BUS-83{i},2020,40,activo' for i in range(4)]
+        filas.insert(2, '9700,Volvo,BUS-839,1990,40,activo')
+
+        def al_error(numero, mensajes):
+            # Otro proceso da de alta una placa del lote después de validarla aquí
+            Autobus.objects.get_or_create(placa='BUS-831', defaults={
+                'modelo': '9700', 'marca': 'Volvo', 'año': 2020, 'capacidad': 40})
+            errores.append((numero, mensajes))
+
+        errores = []
+        texto = io.StringIO(self.AUTOBUSES + '\n'.join(filas) + '\n', newline='')
+        resumen = importacion.importar('autobuses', texto, lote=3, al_error=al_error)
+        self.assertEqual(resumen, {'creados': 3, 'errores': 2})
+        self.assertEqual([numero for numero, _ in errores], [3, 2])
+        self.assertTrue(errores[1][1][0].startswith('base de datos: '))
+        self.assertEqual(Autobus.objects.filter(placa__startswith='BUS-83').count(), 4)
+
+
+class ExportacionTests(DatosMixin, TestCase):
+    """Las exportaciones en streaming respetan los filtros, con o sin gzip."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos('BUS-841')
+        cls.viaje = cls.crear_viaje(timezone.make_aware(timezone.datetime(2030, 1, 10, 8, 0)))
+        for asiento, estado in ((1, 'pagado'), (2, 'reservado'), (3, 'pagado')):
+            guardar_boleto(Boleto(viaje=cls.viaje, pasajero=cls.pasajero, asiento_numero=asiento, precio=300,
+                                  estado=estado, codigo_boleto=f'BEXP000{asiento}'))
+
+    def exportar(self, recurso, **parametros):
+        respuesta = self.client.get(reverse('exportar_datos', args=[recurso]) + '?' + urlencode(parametros))
+        contenido = b''.join(respuesta.streaming_content) if respuesta.streaming else respuesta.content
+        return respuesta, contenido
+
+    def test_csv(self):
+        respuesta, contenido = self.exportar('boletos', estado='pagado')
+        self.assertEqual(respuesta['Content-Type'], 'text/csv; charset=utf-8')
+        filas = list(csv.DictReader(io.StringIO(contenido.decode())))
+        self.assertEqual([(fila['codigo'], fila['asiento'], fila['destino']) for fila in filas],
+                         [('BEXP0001', '1', 'Mexicali'), ('BEXP0003', '3', 'Mexicali')])
+
+    def test_jsonl(self):
+        respuesta, contenido = self.exportar('viajes', formato='jsonl', desde='2030-01-10', hasta='2030-01-10')
+        self.assertEqual(respuesta['Content-Disposition'], 'attachment; filename="viajes.jsonl"')
+        filas = [json.loads(linea) for linea in contenido.decode().splitlines()]
+        self.assertEqual([(fila['id'], fila['asientos_disponibles'], fila['autobus_placa']) for fila in filas],
+                         [(self.viaje.pk, 37, 'BUS-841')])
+        self.assertEqual(datetime.fromisoformat(filas[0]['fecha_salida']), self.viaje.fecha_salida)
+        self.assertEqual(self.exportar('viajes', formato='jsonl', desde='2030-01-11')[1], b'')
+
+    def test_gzip(self):
+        with mock.patch.object(exportacion, 'TAMANO_TROZO', 100):
+            respuesta, comprimido = self.exportar('pasajeros', gzip='1')
+            self.assertGreater(len(list(exportacion.generar('boletos', comprimir=True))), 1)
+        self.assertEqual(respuesta['Content-Type'], 'application/gzip')
+        self.assertEqual(respuesta['Content-Disposition'], 'attachment; filename="pasajeros.csv.gz"')
+        self.assertEqual(gzip.decompress(comprimido), self.exportar('pasajeros')[1])
+        self.assertIn(b'ana@example.com', gzip.decompress(comprimido))
+
+    def test_filtros_invalidos(self):
+        respuesta, contenido = self.exportar('boletos', estado='regalado')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('Estado no válido para boletos: regalado', contenido.decode())
+        self.assertEqual(self.exportar('pasajeros', estado='pagado')[0].status_code, 400)
+        self.assertEqual(self.exportar('boletos', formato='xml')[0].status_code, 400)
+        self.assertEqual(self.exportar('empleados')[0].status_code, 404)
+        with self.assertRaisesMessage(CommandError, 'Estado no válido para viajes: pagado'):
+            call_command('exportar_datos', 'viajes', estado='pagado')
+
+
+class PlantillasTests(DatosMixin, TestCase):
+    """Dos semanas de salidas entre semana a las 06:00 y a las 14:00."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autobus = cls.crear_autobus('BUS-401', 45)
+        cls.conductor = cls.crear_empleado()
+        cls.ruta = cls.crear_ruta()
+        form = PlantillaHorarioForm({
+            'nombre': 'Temporada', 'ruta': cls.ruta.pk, 'autobus': cls.autobus.pk, 'conductor': cls.conductor.pk,
+            'horas_salida': '14:00, 6:00', 'dias_semana': ['0', '1', '2', '3', '4'],
+            'fecha_inicio': '2030-01-07', 'fecha_fin': '2030-01-20', 'activa': True,
+        })
+        assert form.is_valid(), form.errors
+        cls.plantilla = form.save()
+        # Viaje a mano del mismo autobús que se encima con la salida del martes a las 14:00
+        salida = timezone.make_aware(timezone.datetime(2030, 1, 8, 13, 0))
+        cls.manual = cls.crear_viaje(salida, conductor=cls.crear_empleado('Mario'))
+
+    def test_formulario_normaliza(self):
+        self.assertEqual(self.plantilla.horas_salida, '06:00, 14:00')
+        self.assertEqual(self.plantilla.dias_semana, '01234')
+        self.assertEqual(PlantillaHorarioForm(instance=self.plantilla).initial['dias_semana'], list('01234'))
+        form = PlantillaHorarioForm({**PlantillaHorarioForm(instance=self.plantilla).initial,
+                                     'horas_salida': '25:00', 'fecha_fin': '2030-01-01'})
+        self.assertEqual(sorted(form.errors), ['fecha_fin', 'horas_salida'])
+
+    def test_generar_es_idempotente_y_reporta_choques(self):
+        resultado = plantillas.generar(self.plantilla, lote=7)
+        self.assertEqual((resultado['creados'], resultado['existentes']), (19, 0))
+        self.assertEqual(resultado['choques'], [
+            {'salida': self.manual.fecha_salida + timedelta(hours=1), 'autobus': self.manual.pk}])
+        viajes = self.plantilla.viajes.all()
+        self.assertEqual(viajes.count(), 19)
+        self.assertEqual(set(viajes.values_list('asientos_disponibles', flat=True)), {45})
+        self.assertEqual(list(horarios.solapamientos()), [])
+
+        salida = io.StringIO()
+        call_command('generar_viajes', self.plantilla.pk, stdout=salida)
+        self.assertIn('Temporada: 0 viajes nuevos, 19 ya existían, 1 choques', salida.getvalue())
+        self.assertEqual(Viaje.objects.count(), 20)
+
+    def test_generar_desde_la_vista(self):
+        respuesta = self.client.post(reverse('plantilla_generar', args=[self.plantilla.pk]), follow=True)
+        mensajes = [str(mensaje) for mensaje in respuesta.context['messages']]
+        self.assertIn('Temporada: 19 viajes creados, 0 ya existían.', mensajes)
+        self.assertTrue(any(mensaje.startswith('Salidas sin crear por choques de horario (1)') for mensaje in mensajes))
+
+
+class EstadisticasTests(DatosMixin, TestCase):
+    """``rebuild_ticket_stats`` deja la tabla acumulada igual a contar los boletos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos('BUS-921')
+        viaje = cls.crear_viaje(timezone.make_aware(timezone.datetime(2030, 1, 10, 8, 0)))
+        for asiento, estado in enumerate(('pagado', 'pagado', 'reservado', 'usado', 'cancelado'), start=1):
+            guardar_boleto(Boleto(viaje=viaje, pasajero=cls.pasajero, asiento_numero=asiento, precio=100 * asiento,
+                                  estado=estado, codigo_boleto=f'BEST{asiento:04d}'))
+
+    def guardadas(self):
+        return {fila.estado: (fila.cantidad, fila.total) for fila in EstadisticaBoleto.objects.exclude(cantidad=0)}
+
+    def reales(self):
+        return {fila['estado']: (fila['cantidad'], fila['total']) for fila in
+                Boleto.objects.order_by().values('estado').annotate(cantidad=Count('id'), total=Sum('precio'))}
+
+    def test_rebuild_ticket_stats(self):
+        self.assertEqual(self.guardadas(), self.reales())
+        EstadisticaBoleto.objects.filter(estado='pagado').update(cantidad=7)
+        EstadisticaBoleto.objects.filter(estado='usado').update(total=1)
+        EstadisticaBoleto.objects.filter(estado='reservado').delete()
+        corruptas = self.guardadas()
+
+        salida = io.StringIO()
+        call_command('rebuild_ticket_stats', dry_run=True, stdout=salida)
+        self.assertIn('3 estados con diferencias (sin cambios)', salida.getvalue())
+        self.assertIn('pagado: 7 boletos', salida.getvalue())
+        self.assertEqual(self.guardadas(), corruptas)
+
+        call_command('rebuild_ticket_stats', stdout=salida)
+        self.assertIn('3 estados corregidos', salida.getvalue())
+        self.assertEqual(self.guardadas(), self.reales())
+        salida = io.StringIO()
+        call_command('rebuild_ticket_stats', stdout=salida)
+        self.assertIn('ya estaban al día', salida.getvalue())
+
+
+class ResumenesTests(DatosMixin, TestCase):
+    """Los resúmenes incrementales coinciden siempre con el recálculo desde cero."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autobuses = [cls.crear_autobus(f'BUS-50{i}', capacidad) for i, capacidad in enumerate((40, 30))]
+        cls.rutas = [cls.crear_ruta(destino=destino) for destino in ('Mexicali', 'Tecate')]
+        cls.conductor = cls.crear_empleado()
+        cls.pasajero = cls.crear_pasajero()
+        cls.salida = timezone.make_aware(timezone.datetime(2030, 1, 10, 8, 0))
+
+    def assertResumenesAlDia(self):
+        guardados = {(fila.ruta_id, fila.fecha): {campo: getattr(fila, campo) for campo in resumenes.CAMPOS}
+                     for fila in ResumenRutaDia.objects.all()}
+        reales = dict(resumenes.calcular())
+        vacio = dict.fromkeys(resumenes.CAMPOS, 0)
+        self.assertEqual({clave: valores for clave, valores in guardados.items() if valores != vacio}, reales)
+
+    def test_cambios_de_boletos_y_viajes(self):
+        viaje = self.crear_viaje(self.salida, self.autobuses[0], self.rutas[0])
+        boletos = [guardar_boleto(Boleto(viaje=viaje, pasajero=self.pasajero, asiento_numero=asiento, precio=300,
+                                         estado=estado, codigo_boleto=f'BRES000{asiento}'))
+                   for asiento, estado in ((1, 'pagado'), (2, 'reservado'), (3, 'usado'))]
+        asientos.vender_boletos(viaje.pk, [{'pasajero': self.pasajero.pk, 'precio': 280}] * 2)
+        self.assertResumenesAlDia()
+        fila = ResumenRutaDia.objects.get()
+        self.assertEqual((fila.asientos, fila.ocupados, fila.vendidos, fila.ingresos), (40, 5, 4, 1160))
+
+        boletos[1].estado = 'pagado'
+        boletos[1].precio = 250
+        boletos[1].save()
+        boletos[0].estado = 'cancelado'
+        boletos[0].save()
+        self.assertResumenesAlDia()
+
+        # Otro día, otra ruta y otro autobús: los boletos se mueven con el viaje
+        viaje.refresh_from_db()
+        viaje.fecha_salida += timedelta(days=1)
+        viaje.ruta, viaje.autobus = self.rutas[1], self.autobuses[1]
+        viaje.save()
+        self.assertResumenesAlDia()
+        viaje.estado = 'cancelado'
+        viaje.save()
+        self.assertResumenesAlDia()
+        boletos[2].delete()
+        viaje.delete()
+        self.assertResumenesAlDia()
+        self.assertFalse(ResumenRutaDia.objects.exclude(asientos=0, ocupados=0, vendidos=0, ingresos=0).exists())
+
+    def test_cambio_de_capacidad(self):
+        autobus = self.autobuses[0]
+        for dias, estado in ((0, 'programado'), (0, 'programado'), (1, 'programado'), (1, 'cancelado')):
+            self.crear_viaje(self.salida + timedelta(days=dias), autobus, self.rutas[0], estado=estado)
+        self.crear_viaje(self.salida, self.autobuses[1], self.rutas[0])
+        autobus.capacidad = 45
+        autobus.save()
+        self.assertResumenesAlDia()
+        self.assertEqual(dict(ResumenRutaDia.objects.values_list('fecha', 'asientos')),
+                         {date(2030, 1, 10): 45 * 2 + 30, date(2030, 1, 11): 45})
+        # Si update_fields no incluye la capacidad no se vuelve a leer
+        with self.assertNumQueries(1):
+            autobus.save(update_fields=['estado'])
+
+    def test_reporte_y_reconstruccion(self):
+        for dias in (0, 1, 8):
+            salida = self.salida + timedelta(days=dias)
+            viaje = self.crear_viaje(salida, self.autobuses[0], self.rutas[0])
+            guardar_boleto(Boleto(viaje=viaje, pasajero=self.pasajero, asiento_numero=1, precio=300,
+                                  estado='pagado', codigo_boleto=f'BREP00{dias:02d}'))
+        respuesta = self.client.get(reverse('reporte_rutas') + '?' + urlencode(
+            {'desde': '2030-01-01', 'hasta': '2030-01-31', 'agrupar': 'semana'}))
+        self.assertEqual([(fila['periodo'], fila['vendidos'], fila['asientos']) for fila in respuesta.context['filas']],
+                         [(date(2030, 1, 7), 2, 80), (date(2030, 1, 14), 1, 40)])
+        self.assertEqual(respuesta.context['totales']['ingresos'], 900)
+
+        ResumenRutaDia.objects.filter(fecha=date(2030, 1, 18)).delete()
+        ResumenRutaDia.objects.filter(fecha=date(2030, 1, 10)).update(vendidos=99)
+        salida = io.StringIO()
+        call_command('rebuild_rollups', since=date(2030, 1, 11), stdout=salida)
+        self.assertIn('1 filas actualizadas: 1 nuevas', salida.getvalue())
+        call_command('rebuild_rollups', stdout=salida)
+        self.assertResumenesAlDia()
+
+
+class InstrumentacionTests(DatosMixin, TestCase):
+    """Consultas por petición, histogramas por vista y el endpoint interno."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos('BUS-861')
+
+    def setUp(self):
+        cache.clear()
+        instrumentacion._histogramas.clear()
+        self.addCleanup(instrumentacion._histogramas.clear)
+
+    def test_consultas_por_vista(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse('boleto_listar'))
+        total = len(consultas.captured_queries)
+        self.assertGreater(total, 1)
+        self.assertIn(f'desc="{total} consultas"', respuesta['Server-Timing'])
+        self.client.get(reverse('boleto_listar'))
+        resumen = instrumentacion.metricas()['vistas']['boleto_listar']
+        self.assertEqual(resumen['peticiones'], 2)
+        self.assertLessEqual(resumen['consultas_promedio'], total)
+
+        with override_settings(INSTRUMENTACION_LENTA_MS=0), \
+                self.assertLogs('app_autobuses.instrumentacion', 'WARNING') as registro:
+            self.client.get(reverse('ruta_listar'))
+        evento = json.loads(registro.records[0].getMessage())
+        self.assertEqual((evento['evento'], evento['vista']), ('peticion_lenta', 'ruta_listar'))
+
+    def test_repetidas_y_duplicadas(self):
+        medicion = instrumentacion.Medicion()
+        sql = 'SELECT * FROM app_autobuses_viaje WHERE id = %s'
+        for params in ((1,), (2,), (3,), (3,)):
+            medicion.envoltura(lambda *args: None, sql, params, False, {})
+        self.assertEqual(medicion.consultas, 4)
+        self.assertEqual(medicion.repetidas(), [(sql, 4)])
+        self.assertEqual(medicion.duplicadas(), 1)
+        self.assertEqual(instrumentacion.huella("SELECT 1 FROM t WHERE a IN (%s, %s, %s) AND b = 'x' LIMIT 21"),
+                         'SELECT ? FROM t WHERE a IN (...) AND b = ? LIMIT ?')
+
+    def test_percentiles(self):
+        histograma = instrumentacion.Histograma()
+        for total_ms, veces in ((3, 90), (40, 5), (3000, 4), (9000, 1)):
+            for _ in range(veces):
+                histograma.registrar(total_ms, 2, minuto=100)
+        resumen = histograma.resumen(minuto=100)
+        self.assertEqual((resumen['peticiones'], resumen['consultas_promedio']), (100, 2))
+        self.assertEqual((resumen['p50_ms'], resumen['p95_ms'], resumen['p99_ms']), (5, 50, 5000))
+        self.assertEqual(resumen['cubetas']['+inf'], 1)
+        self.assertEqual(resumen['media_ms'], (3 * 90 + 40 * 5 + 3000 * 4 + 9000) / 100)
+        # Fuera de la ventana de 15 minutos ya no cuenta
+        self.assertIsNotNone(histograma.resumen(minuto=114))
+        self.assertIsNone(histograma.resumen(minuto=115))
+
+    def test_endpoint_interno(self):
+        self.client.get(reverse('index'))
+        url = reverse('metricas_internas')
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.8').status_code, 404)
+        datos = self.client.get(url).json()
+        self.assertEqual(datos['ventana_minutos'], 15)
+        self.assertIn('index', datos['vistas'])
+
+
+@override_settings(REPLICAS=['replica'])
+class EnrutadorTests(DatosMixin, TransactionTestCase):
+    """Lecturas de GET en la réplica y todo lo demás en default.
+
+    Si los settings no declaran la réplica, la clase agrega el alias como
+    espejo de la base de pruebas de default (lo mismo que ``TEST['MIRROR']``):
+    se sabe de dónde se leyó por la conexión que ejecutó la consulta. Es una
+    ``TransactionTestCase`` porque dentro de la transacción de una
+    ``TestCase`` todas las lecturas van a default.
+    """
+    # El runner revisa los alias de ``databases`` antes de armar la clase; la réplica se agrega en setUpClass
+    databases = {'default'}
+
+    @classmethod
+    def setUpClass(cls):
+        if 'replica' not in connections:
+            espejo = {**connections['default'].settings_dict, 'TEST': {'MIRROR': 'default'}}
+            cls.enterClassContext(override_settings(DATABASES={**settings.DATABASES, 'replica': espejo}))
+            connections.settings['replica'] = espejo
+            cls.addClassCleanup(cls._quitar_espejo)
+        # Antes de super(): ahí se valida que existan los alias de ``databases``
+        cls.databases = {'default', 'replica'}
+        super().setUpClass()
+
+    @staticmethod
+    def _quitar_espejo():
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+
+    def setUp(self):
+        cache.clear()
+        caches['fragmentos'].clear()
+        self.crear_autobus('BUS-871')
+
+    def leida_de(self, leer):
+        """Alias de la conexión que leyó la tabla de autobuses dentro de ``leer()``."""
+        # Sin la tabla del listado en caché, cada GET vuelve a consultar
+        caches['fragmentos'].clear()
+        with CaptureQueriesContext(connections['default']) as primaria, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            leer()
+        usadas = [alias for alias, consultas in (('default', primaria), ('replica', replica))
+                  if any('FROM "app_autobuses_autobus"' in consulta['sql'] for consulta in consultas)]
+        self.assertEqual(len(usadas), 1, usadas)
+        return usadas[0]
+
+    def test_get_lee_de_la_replica(self):
+        url = reverse('autobus_listar')
+        self.assertEqual(self.leida_de(lambda: self.client.get(url)), 'replica')
+        self.assertEqual(self.leida_de(lambda: async_to_sync(self.async_client.get)(url)), 'replica')
+        with override_settings(REPLICAS=[]):
+            self.assertEqual(self.leida_de(lambda: self.client.get(url)), 'default')
+
+    def test_transaccion_y_en_primaria(self):
+        enrutador = EnrutadorReplicas()
+        token = _leer_de_replica.set(True)
+        self.addCleanup(_leer_de_replica.reset, token)
+        self.assertEqual(enrutador.db_for_read(Autobus), 'replica')
+        self.assertEqual(self.leida_de(lambda: Autobus.objects.get()), 'replica')
+        with transaction.atomic():
+            self.assertEqual(enrutador.db_for_read(Autobus), 'default')
+            self.assertEqual(self.leida_de(lambda: Autobus.objects.get()), 'default')
+        with en_primaria():
+            self.assertEqual(self.leida_de(lambda: Autobus.objects.get()), 'default')
+        self.assertEqual(enrutador.db_for_read(Autobus), 'replica')
+        # Los modelos que no están en MODELOS siguen el enrutamiento normal
+        self.assertIsNone(enrutador.db_for_read(PlantillaHorario))
+        self.assertEqual(enrutador.db_for_write(Autobus), 'default')
+
+    def test_sesion_fijada_tras_escribir(self):
+        url = reverse('autobus_listar')
+        self.client.post(reverse('autobus_crear'), {})
+        self.assertGreater(self.client.session[CLAVE_SESION], time.time())
+        self.assertEqual(self.leida_de(lambda: self.client.get(url)), 'default')
+        # Vencido el plazo vuelve a la réplica
+        with override_settings(REPLICA_FIJAR_SEGUNDOS=0):
+            self.client.post(reverse('autobus_crear'), {})
+        self.assertEqual(self.leida_de(lambda: self.client.get(url)), 'replica')
+        # Un POST rechazado no fija la sesión
+        self.client.post(reverse('api_venta_multiple'), 'no es json', content_type='application/json')
+        self.assertEqual(self.leida_de(lambda: self.client.get(url)), 'replica')
+
+    def test_sin_validadores_desde_la_replica(self):
+        url = reverse('autobus_listar')
+        for respuesta in (self.client.get(url), async_to_sync(self.async_client.get)(url)):
+            self.assertFalse(respuesta.has_header('ETag'))
+            self.assertFalse(respuesta.has_header('Last-Modified'))
+        # Con la sesión fijada a la principal vuelven el ETag y el 304
+        self.client.post(reverse('autobus_crear'), {})
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_tabla_sin_cache_desde_la_replica(self):
+        render = mock.Mock(return_value='<table></table>')
+        token = _leer_de_replica.set(True)
+        self.addCleanup(_leer_de_replica.reset, token)
+        for _ in range(2):
+            fragmentos.tabla('autobuses', '/autobuses/', (1,), render)
+        self.assertEqual(render.call_count, 2)
+        with en_primaria():
+            for _ in range(2):
+                fragmentos.tabla('autobuses', '/autobuses/', (1,), render)
+        self.assertEqual(render.call_count, 3)
+
+    def test_no_se_migran_las_replicas(self):
+        enrutador = EnrutadorReplicas()
+        self.assertFalse(enrutador.allow_migrate('replica', 'app_autobuses', 'autobus'))
+        self.assertTrue(enrutador.allow_migrate('default', 'app_autobuses', 'autobus'))
+        with override_settings(REPLICAS=[]):
+            self.assertTrue(enrutador.allow_migrate('replica', 'app_autobuses', 'autobus'))
+
+
+class DashboardTests(DatosMixin, TestCase):
+    """Los contadores del tablero en caché coinciden con los de la base después de cada cambio."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos('BUS-901')
+
+    def setUp(self):
+        cache.clear()
+
+    def reales(self):
+        return {nombre: dashboard._calcular(nombre) for nombre in dashboard.CONTADORES}
+
+    def test_ajustes_e_invalidacion(self):
+        self.assertEqual(obtener_contadores(), self.reales())
+        # Altas y bajas de autobuses y pasajeros se ajustan con incr/decr, sin consultas
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crear_autobus('BUS-902')
+            self.crear_pasajero('Eva', 'Ruiz')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.autobus.delete()
+        with self.assertNumQueries(0):
+            contadores = obtener_contadores()
+        self.assertEqual(contadores, self.reales())
+
+        # Los demás se invalidan y se recalculan en la siguiente lectura
+        with self.captureOnCommitCallbacks(execute=True):
+            viaje = self.crear_viaje(timezone.make_aware(timezone.datetime(2030, 1, 10, 8, 0)),
+                                     self.crear_autobus('BUS-903'))
+            guardar_boleto(Boleto(viaje=viaje, pasajero=self.pasajero, asiento_numero=1, precio=300,
+                                  estado='pagado', codigo_boleto='BDAS0001'))
+            self.crear_ruta(destino='Tecate')
+            self.conductor.activo = False
+            self.conductor.save()
+        self.assertEqual(obtener_contadores(), self.reales())
+        self.assertEqual(async_to_sync(aobtener_contadores)(), self.reales())
+
+        # Un ajuste sin el contador en caché no lo crea
+        cache.delete(dashboard._clave('total_pasajeros'))
+        dashboard.ajustar('total_pasajeros', 1)
+        self.assertIsNone(cache.get(dashboard._clave('total_pasajeros')))
+
+    def test_obsoleto_con_candado(self):
+        anterior = obtener_contadores()['total_rutas']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crear_ruta(destino='Tecate')
+        candado = dashboard._clave_candado('total_rutas')
+        # Otro proceso está recalculando: se sirve el valor anterior
+        cache.add(candado, 1, 30)
+        with self.assertNumQueries(0):
+            self.assertEqual(obtener_contadores()['total_rutas'], anterior)
+        self.assertEqual(async_to_sync(aobtener_contadores)()['total_rutas'], anterior)
+
+        # Sin candado recalcula quien llega primero y lo suelta al terminar
+        cache.delete(candado)
+        with self.assertNumQueries(1):
+            self.assertEqual(obtener_contadores()['total_rutas'], anterior + 1)
+        self.assertIsNone(cache.get(candado))
+        self.assertNotIn(dashboard._clave_obsoleto('total_rutas'), cache.get_many(dashboard._claves()))
+        with self.assertNumQueries(0):
+            obtener_contadores()
+
+    def test_sin_stale_while_revalidate(self):
+        obtener_contadores()
+        with override_settings(DASHBOARD_STALE_WHILE_REVALIDATE=False):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.crear_ruta(destino='Tecate')
+            # El contador se borra: aunque haya candado se recalcula
+            cache.add(dashboard._clave_candado('total_rutas'), 1, 30)
+            self.assertIsNone(cache.get(dashboard._clave('total_rutas')))
+            self.assertEqual(obtener_contadores(), self.reales())
+
+
+
+class VistasAsyncTests(TestCase):
+    """Las vistas async (despliegue ASGI) responden lo mismo que las síncronas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_load', autobuses=3, rutas=5, empleados=4, pasajeros=30,
+                     viajes=40, boletos=300, semilla=11, stdout=io.StringIO())
+
+    def setUp(self):
+        cache.clear()
+
+    def sin_csrf(self, contenido):
+        return re.sub(rb'name="csrfmiddlewaretoken" value="[^"]*"', b'', contenido)
+
+    def test_mismas_respuestas(self):
+        fabrica, fabrica_async = RequestFactory(), AsyncRequestFactory()
+        medidas = [(nombre, url) for nombre, url in benchmark_vistas.casos() if nombre in benchmark_asgi.VISTAS]
+        self.assertEqual({nombre for nombre, _ in medidas}, set(benchmark_asgi.VISTAS))
+        medidas.append(('boleto_listar', reverse('boleto_listar') + '?estado=pagado'))
+        medidas.append(('api_validar_boleto', reverse('api_validar_boleto') + '?codigo=XXXX'))
+        for nombre, url in medidas:
+            with self.subTest(url=url):
+                kwargs = resolve(url.split('?')[0]).kwargs
+                sincrona = getattr(views, nombre)(fabrica.get(url), **kwargs)
+                asincrona = async_to_sync(getattr(views, f'{nombre}_async'))(fabrica_async.get(url), **kwargs)
+                self.assertEqual(asincrona.status_code, sincrona.status_code)
+                self.assertEqual(self.sin_csrf(asincrona.content), self.sin_csrf(sincrona.content))
+
+    def test_contadores(self):
+        sincronos = obtener_contadores()
+        cache.clear()
+        self.assertEqual(async_to_sync(aobtener_contadores)(), sincronos)
+        self.assertEqual(async_to_sync(aobtener_contadores)(), sincronos)
+
+    async def test_middleware_async(self):
+        respuesta = await self.async_client.get(reverse('index'))
+        self.assertEqual(respuesta.status_code, 200)
+        # Las consultas corren en el hilo del ORM y aun así se cuentan
+        self.assertRegex(respuesta['Server-Timing'], r'desc="[1-9]\d* consultas"')
+
+
+class VersionesTests(DatosMixin, TestCase):
+    """Los listados responden 304 mientras no cambie ninguno de los modelos que muestran."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos('BUS-601')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_304_sin_consultas(self):
+        url = reverse('autobus_listar')
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('no-cache', respuesta['Cache-Control'])
+        with self.assertNumQueries(0):
+            respuesta = self.client.get(url, headers={'if-none-match': respuesta['ETag']})
+        self.assertEqual(respuesta.status_code, 304)
+        # Otra página u otros filtros tienen su propio ETag
+        otra = self.client.get(url + '?pagina=2', headers={'if-none-match': respuesta['ETag']})
+        self.assertEqual(otra.status_code, 200)
+
+    def test_cambio_invalida(self):
+        url = reverse('viaje_listar')
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ruta.precio_base = 320
+            self.ruta.save()
+        self.assertEqual(self.client.get(url, headers={'if-none-match': etag}).status_code, 200)
+        # Un modelo que el listado no muestra no cambia su ETag
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pasajero.save()
+        self.assertEqual(self.client.get(url, headers={'if-none-match': etag}).status_code, 304)
+
+    def test_if_modified_since(self):
+        url = reverse('ruta_listar')
+        # Un sello de hace más de un segundo ya se puede anunciar en Last-Modified
+        cache.set(versiones._clave(Ruta), time.time_ns() - 5 * 10 ** 9, None)
+        ultima = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, headers={'if-modified-since': ultima}).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ruta.save()
+        respuesta = self.client.get(url, headers={'if-modified-since': ultima})
+        self.assertEqual(respuesta.status_code, 200)
+        # El sello nuevo es de este mismo segundo
+        self.assertFalse(respuesta.has_header('Last-Modified'))
+
+    def test_mensajes_pendientes(self):
+        url = reverse('empleado_listar')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('empleado_eliminar', args=[self.conductor.pk]))
+        # Otro navegador, sin el mensaje, ya tiene la página nueva
+        etag = self.client_class().get(url)['ETag']
+        respuesta = self.client.get(url, headers={'if-none-match': etag})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertContains(respuesta, 'eliminado')
+        self.assertEqual(self.client.get(url, headers={'if-none-match': etag}).status_code, 304)
+
+    def test_venta_por_lotes(self):
+        viaje = self.crear_viaje(timezone.make_aware(timezone.datetime(2030, 1, 10, 8, 0)))
+        # Los números de código reservados se deshacen con la transacción de la prueba
+        self.addCleanup(codigos._bloques.clear)
+        antes = Viaje.objects.get(pk=viaje.pk).fecha_actualizacion
+        sellos = versiones.sellos([Boleto, Viaje])
+        with self.captureOnCommitCallbacks(execute=True):
+            asientos.vender_boletos(viaje.pk, [{'pasajero': self.pasajero.pk, 'precio': 280}])
+        self.assertGreater(Viaje.objects.get(pk=viaje.pk).fecha_actualizacion, antes)
+        nuevos = versiones.sellos([Boleto, Viaje])
+        self.assertNotEqual(nuevos[0], sellos[0])
+        self.assertNotEqual(nuevos[1], sellos[1])
+
+
+class FragmentosTests(DatosMixin, TestCase):
+    """Las tablas de los listados se guardan completas y por fila, y se rehacen solo donde algo cambió."""
+
+    FILA = 'app_autobuses/viaje/fila.html'
+    RELACIONES = ('ruta', 'autobus', 'conductor')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_datos('BUS-701')
+        salida = timezone.make_aware(timezone.datetime(2030, 1, 10, 8, 0))
+        cls.viajes = [cls.crear_viaje(salida + timedelta(hours=horas)) for horas in (0, 4, 8)]
+
+    def setUp(self):
+        cache.clear()
+        caches['fragmentos'].clear()
+
+    def filas_en_cache(self):
+        viajes = list(views._viajes())
+        claves = [fragmentos.clave_fila(self.FILA, viaje, self.RELACIONES) for viaje in viajes]
+        guardadas = caches['fragmentos'].get_many(claves)
+        return [viaje.pk for viaje, clave in zip(viajes, claves) if clave in guardadas]
+
+    def test_tabla_completa(self):
+        url = reverse('viaje_listar')
+        contenido = self.client.get(url).content
+        # Con la tabla en caché la consulta del listado no se ejecuta
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).content, contenido)
+        with override_settings(FRAGMENTOS_ACTIVOS=False):
+            self.assertEqual(self.client.get(url).content, contenido)
+
+    def test_una_fila(self):
+        url = reverse('viaje_listar')
+        self.client.get(url)
+        editado = self.viajes[1]
+        with self.captureOnCommitCallbacks(execute=True):
+            editado.asientos_disponibles = 37
+            editado.save()
+        self.assertCountEqual(self.filas_en_cache(), [self.viajes[0].pk, self.viajes[2].pk])
+        self.assertContains(self.client.get(url), '>37</span>')
+        self.assertCountEqual(self.filas_en_cache(), [viaje.pk for viaje in self.viajes])
+
+    def test_relacion(self):
+        url = reverse('viaje_listar')
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ruta.origen = 'Ensenada'
+            self.ruta.save()
+        # Las filas muestran la ruta: todas tienen versión nueva
+        self.assertEqual(self.filas_en_cache(), [])
+        self.assertContains(self.client.get(url), 'Ensenada → Mexicali', count=3)
+
+
+def imagen_png(color, tamano=(400, 200)):
+    from PIL import Image
+
+    salida = io.BytesIO()
+    Image.new('RGB', tamano, color).save(salida, 'PNG')
+    return salida.getvalue()
+
+
+class ImagenesTests(DatosMixin, TestCase):
+    """Fotos con nombre por contenido y miniaturas generadas al confirmar el guardado."""
+
+    def setUp(self):
+        self.media = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=self.media))
+        # Sin el grupo de hilos: la miniatura se genera al ejecutar el on_commit
+        self.enterContext(mock.patch.object(imagenes, 'encolar', side_effect=imagenes.procesar))
+
+    def autobus(self, placa, datos, nombre='foto.PNG'):
+        with self.captureOnCommitCallbacks(execute=True):
+            autobus = self.crear_autobus(placa)
+            autobus.imagen = SimpleUploadedFile(nombre, datos)
+            autobus.save()
+        autobus.refresh_from_db()
+        return autobus
+
+    def archivos(self, carpeta):
+        raiz = os.path.join(self.media, carpeta)
+        return sorted(os.path.relpath(os.path.join(ruta, nombre), self.media).replace(os.sep, '/')
+                      for ruta, _, nombres in os.walk(raiz) for nombre in nombres)
+
+    def test_nombre_por_contenido(self):
+        datos = imagen_png('red')
+        digest = hashlib.sha256(datos).hexdigest()
+        primero, segundo = self.autobus('BUS-881', datos), self.autobus('BUS-882', datos, 'otra.png')
+        self.assertEqual(primero.imagen.name, f'autobuses/{digest[:2]}/{digest}.png')
+        self.assertEqual(segundo.imagen.name, primero.imagen.name)
+        # La segunda subida idéntica no se vuelve a escribir
+        self.assertEqual(self.archivos('autobuses'), [primero.imagen.name])
+        self.assertEqual(self.autobus('BUS-883', datos, 'sin_extension').imagen.name,
+                         f'autobuses/{digest[:2]}/{digest}.jpg')
+
+    def test_miniaturas(self):
+        from PIL import Image
+
+        autobus = self.autobus('BUS-884', imagen_png('blue'))
+        jpg, webp = imagenes.nombres_miniatura(autobus.imagen.name)
+        self.assertEqual((autobus.miniatura.name, autobus.miniatura_webp.name), (jpg, webp))
+        self.assertEqual((autobus.miniatura_ancho, autobus.miniatura_alto), (160, 160))
+        for nombre, formato in ((jpg, 'JPEG'), (webp, 'WEBP')):
+            with Image.open(os.path.join(self.media, nombre)) as miniatura:
+                self.assertEqual((miniatura.format, miniatura.size), (formato, (160, 160)))
+        self.assertTrue(imagenes.miniatura_al_dia(autobus))
+
+        # Un archivo que no es imagen se registra y deja la miniatura vacía
+        with self.assertLogs('app_autobuses.imagenes', 'WARNING'):
+            roto = self.autobus('BUS-885', b'no es una imagen', 'roto.png')
+        self.assertEqual(roto.miniatura.name, '')
+
+    def test_reemplazar_y_borrar(self):
+        datos = imagen_png('green')
+        autobus, otro = self.autobus('BUS-886', datos), self.autobus('BUS-887', datos)
+        original = autobus.imagen.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            autobus.imagen = SimpleUploadedFile('nueva.png', imagen_png('yellow'))
+            autobus.save()
+        autobus.refresh_from_db()
+        self.assertNotEqual(autobus.imagen.name, original)
+        self.assertEqual(autobus.miniatura.name, imagenes.nombres_miniatura(autobus.imagen.name)[0])
+        # Los archivos anteriores se conservan: otro registro puede tener la misma foto
+        self.assertIn(original, self.archivos('autobuses'))
+        self.assertTrue(imagenes.miniatura_al_dia(Autobus.objects.get(pk=otro.pk)))
+
+        # Sin foto se quitan los campos de la miniatura; los archivos quedan
+        autobus.imagen = None
+        autobus.save()
+        autobus.refresh_from_db()
+        self.assertEqual((autobus.miniatura.name, autobus.miniatura_ancho), ('', None))
+        otro.delete()
+        self.assertEqual(len(self.archivos('autobuses')), 2)
+        self.assertEqual(len(self.archivos(imagenes.CARPETA_MINIATURAS)), 4)
+
+
+class GenerarMiniaturasTests(DatosMixin, TransactionTestCase):
+    """``generar_miniaturas`` renombra las fotos anteriores y genera las miniaturas que faltan."""
+
+    def setUp(self):
+        self.media = self.enterContext(tempfile.TemporaryDirectory())
+        self.anteriores = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=self.media, IMAGENES_RUTAS_ANTERIORES=[self.anteriores]))
+
+    def test_generar_miniaturas(self):
+        datos = imagen_png('purple')
+        os.makedirs(os.path.join(self.anteriores, 'autobuses'))
+        with open(os.path.join(self.anteriores, 'autobuses', 'vieja.png'), 'wb') as archivo:
+            archivo.write(datos)
+        # Nombres de antes de guardar por contenido, puestos con update() para no disparar las señales
+        viejo, perdido = self.crear_autobus('BUS-891'), self.crear_autobus('BUS-892')
+        Autobus.objects.filter(pk=viejo.pk).update(imagen='autobuses/vieja.png')
+        Autobus.objects.filter(pk=perdido.pk).update(imagen='autobuses/perdida.png')
+
+        salida, errores = io.StringIO(), io.StringIO()
+        call_command('generar_miniaturas', hilos=1, stdout=salida, stderr=errores)
+        self.assertIn('1 fotos renombradas por contenido, 1 miniaturas generadas, 0 con error, '
+                      '1 fotos sin archivo.', salida.getvalue())
+        self.assertIn(f'autobuses #{perdido.pk}: no se encontró autobuses/perdida.png', errores.getvalue())
+        viejo.refresh_from_db()
+        digest = hashlib.sha256(datos).hexdigest()
+        self.assertEqual(viejo.imagen.name, f'autobuses/{digest[:2]}/{digest}.png')
+        self.assertTrue(imagenes.miniatura_al_dia(viejo))
+        self.assertEqual((viejo.miniatura_ancho, viejo.miniatura_alto), (160, 160))
+
+        # Lo que ya está al día no se vuelve a procesar
+        salida = io.StringIO()
+        call_command('generar_miniaturas', hilos=1, stdout=salida, stderr=io.StringIO())
+        self.assertIn('0 fotos renombradas por contenido, 0 miniaturas generadas', salida.getvalue())
 
-# Create your tests here.
@@ -1,46 +1,83 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+
+def _lectura(nombre):
+    """La vista ``nombre`` o, con ``VISTAS_ASYNC`` (despliegue ASGI), su versión async."""
+    if getattr(settings, 'VISTAS_ASYNC', False):
+        return getattr(views, f'{nombre}_async')
+    return getattr(views, nombre)
+
+
 urlpatterns = [
     # Vista principal
-    path('', views.index, name='index'),
+    path('', _lectura('index'), name='index'),
     
     # Autobuses
-    path('autobuses/', views.autobus_listar, name='autobus_listar'),
+    path('autobuses/', _lectura('autobus_listar'), name='autobus_listar'),
     path('autobuses/crear/', views.autobus_crear, name='autobus_crear'),
     path('autobuses/editar/<int:id>/', views.autobus_editar, name='autobus_editar'),
     path('autobuses/eliminar/<int:id>/', views.autobus_eliminar, name='autobus_eliminar'),
     
     # Rutas
-    path('rutas/', views.ruta_listar, name='ruta_listar'),
+    path('rutas/', _lectura('ruta_listar'), name='ruta_listar'),
     path('rutas/crear/', views.ruta_crear, name='ruta_crear'),
     path('rutas/editar/<int:id>/', views.ruta_editar, name='ruta_editar'),
     path('rutas/eliminar/<int:id>/', views.ruta_eliminar, name='ruta_eliminar'),
     
     # Empleados
-    path('empleados/', views.empleado_listar, name='empleado_listar'),
+    path('empleados/', _lectura('empleado_listar'), name='empleado_listar'),
     path('empleados/crear/', views.empleado_crear, name='empleado_crear'),
     path('empleados/editar/<int:id>/', views.empleado_editar, name='empleado_editar'),
     path('empleados/eliminar/<int:id>/', views.empleado_eliminar, name='empleado_eliminar'),
     
     # Pasajeros
-    path('pasajeros/', views.pasajero_listar, name='pasajero_listar'),
+    path('pasajeros/', _lectura('pasajero_listar'), name='pasajero_listar'),
     path('pasajeros/crear/', views.pasajero_crear, name='pasajero_crear'),
     path('pasajeros/editar/<int:id>/', views.pasajero_editar, name='pasajero_editar'),
     path('pasajeros/eliminar/<int:id>/', views.pasajero_eliminar, name='pasajero_eliminar'),
     
     # Viajes
-    path('viajes/', views.viaje_listar, name='viaje_listar'),
+    path('viajes/', _lectura('viaje_listar'), name='viaje_listar'),
+    path('viajes/buscar/', views.viaje_buscar, name='viaje_buscar'),
     path('viajes/crear/', views.viaje_crear, name='viaje_crear'),
     path('viajes/editar/<int:id>/', views.viaje_editar, name='viaje_editar'),
     path('viajes/eliminar/<int:id>/', views.viaje_eliminar, name='viaje_eliminar'),
     
+    # Plantillas de horario (viajes recurrentes)
+    path('viajes/plantillas/', views.plantilla_listar, name='plantilla_listar'),
+    path('viajes/plantillas/crear/', views.plantilla_crear, name='plantilla_crear'),
+    path('viajes/plantillas/editar/<int:id>/', views.plantilla_editar, name='plantilla_editar'),
+    path('viajes/plantillas/generar/<int:id>/', views.plantilla_generar, name='plantilla_generar'),
+    
     # Boletos
-    path('boletos/', views.boleto_listar, name='boleto_listar'),
+    path('boletos/', _lectura('boleto_listar'), name='boleto_listar'),
     path('boletos/crear/', views.boleto_crear, name='boleto_crear'),
     path('boletos/editar/<int:id>/', views.boleto_editar, name='boleto_editar'),
     path('boletos/eliminar/<int:id>/', views.boleto_eliminar, name='boleto_eliminar'),
     
+    # Reportes (resumenes.py)
+    path('reportes/rutas/', views.reporte_rutas, name='reporte_rutas'),
+    
+    # Importación masiva
+    path('importar/', views.importar_datos, name='importar_datos'),
+    
+    # Exportación
+    path('exportar/<str:recurso>/', views.exportar_datos, name='exportar_datos'),
+    
+    # API (JSON)
+    path('api/viajes/buscar/', _lectura('api_buscar_viajes'), name='api_buscar_viajes'),
+    path('api/viajes/disponibles/', views.api_viajes_disponibles, name='api_viajes_disponibles'),
+    path('api/itinerarios/', views.api_itinerarios, name='api_itinerarios'),
+    path('api/pasajeros/buscar/', _lectura('api_buscar_pasajeros'), name='api_buscar_pasajeros'),
+    path('api/viajes/<int:id>/asientos/', _lectura('api_mapa_asientos'), name='api_mapa_asientos'),
+    path('api/boletos/venta-multiple/', views.api_venta_multiple, name='api_venta_multiple'),
+    path('api/boletos/validar/', _lectura('api_validar_boleto'), name='api_validar_boleto'),
+    
+    # Métricas internas (instrumentacion.py)
+    path('interno/metricas/', views.metricas_internas, name='metricas_internas'),
+    
     # Función de emergencia
     path('boletos/manual/', views.crear_boleto_manual, name='boleto_manual'),
 ]
\ No newline at end of file
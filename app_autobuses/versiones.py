@@ -0,0 +1,130 @@
+"""Sellos de versión por modelo para los GET condicionales de los listados.
+
+Cada modelo tiene en la caché un sello: el ``time.time_ns()`` de su último
+cambio. Las señales de guardado y borrado lo renuevan al confirmarse la
+transacción; las altas con ``bulk_create`` y las actualizaciones con
+``update()`` lo renuevan a mano. El decorador ``condicional`` arma el ETag y
+el ``Last-Modified`` de una página con los sellos de los modelos que
+muestra. Un listado que no cambió responde 304 con un solo ``get_many`` a la
+caché, sin la consulta principal y sin renderizar la plantilla. Los sellos
+quedan en ``request.sellos`` para la caché de tablas (``fragmentos.py``).
+
+Si la caché pierde un sello se crea uno nuevo con la hora actual. Las
+páginas que ya tienen los clientes dejan de coincidir y se vuelven a
+renderizar; nunca se responde 304 a una página vieja.
+
+Una petición que lee de una réplica no lleva ETag ni ``Last-Modified``: los
+sellos son de la principal y la réplica puede ir atrasada, así que la página
+quedaría validada con una generación que no es la suya.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .enrutador import lee_de_replica
+
+PREFIJO = 'version_modelo'
+METODOS_SEGUROS = ('GET', 'HEAD')
+
+
+def _clave(modelo):
+    return f'{PREFIJO}:{modelo._meta.label_lower}'
+
+
+# ========== SELLOS ==========
+def sellos(modelos):
+    """Sello actual de cada modelo, en el mismo orden."""
+    claves = [_clave(modelo) for modelo in modelos]
+    guardados = cache.get_many(claves)
+    for clave in claves:
+        if clave not in guardados:
+            # Sin timeout: si el sello caducara, un cambio posterior podría reusar el valor
+            cache.add(clave, time.time_ns(), None)
+            guardados[clave] = cache.get(clave)
+    return [guardados[clave] for clave in claves]
+
+
+async def asellos(modelos):
+    claves = [_clave(modelo) for modelo in modelos]
+    guardados = await cache.aget_many(claves)
+    for clave in claves:
+        if clave not in guardados:
+            await cache.aadd(clave, time.time_ns(), None)
+            guardados[clave] = await cache.aget(clave)
+    return [guardados[clave] for clave in claves]
+
+
+def renovar(modelo):
+    cache.set(_clave(modelo), time.time_ns(), None)
+
+
+def modelo_cambiado(modelo):
+    """Renueva el sello del modelo al confirmarse la transacción."""
+    transaction.on_commit(lambda: renovar(modelo))
+
+
+# ========== GET CONDICIONAL ==========
+def _validadores(request, valores):
+    """``(etag, last_modified)`` de la página, o ``None`` si no se puede validar."""
+    if request.method not in METODOS_SEGUROS or len(get_messages(request)):
+        # Los mensajes pendientes se muestran una sola vez: la página no se puede reusar
+        return None
+    if lee_de_replica():
+        return None
+    texto = '|'.join([getattr(settings, 'VERSION_DESPLIEGUE', ''), request.get_full_path(), *map(str, valores)])
+    etag = quote_etag(hashlib.md5(texto.encode()).hexdigest())
+    ultimo = max(valores)
+    # Last-Modified tiene resolución de segundos: un cambio en el mismo segundo
+    # no se notaría con If-Modified-Since, así que solo se manda para sellos viejos
+    last_modified = ultimo // 10 ** 9 if time.time_ns() - ultimo >= 10 ** 9 else None
+    return etag, last_modified
+
+
+def _encabezados(response, validadores):
+    if validadores is not None:
+        etag, last_modified = validadores
+        response.headers.setdefault('ETag', etag)
+        if last_modified is not None and not response.has_header('Last-Modified'):
+            response.headers['Last-Modified'] = http_date(last_modified)
+    # Sin almacenar sin validar: el navegador pregunta siempre y recibe 304 si nada cambió
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def condicional(*modelos):
+    """Decorador para vistas síncronas o async que muestran datos de ``modelos``.
+
+    Responde 304 a ``If-None-Match``/``If-Modified-Since`` sin llamar a la
+    vista si ninguno de los modelos cambió desde entonces. La URL completa
+    forma parte del ETag, así que cada combinación de filtros o página tiene
+    el suyo.
+    """
+    def decorador(vista):
+        if iscoroutinefunction(vista):
+            @wraps(vista)
+            async def envoltura(request, *args, **kwargs):
+                request.sellos = await asellos(modelos)
+                validadores = _validadores(request, request.sellos)
+                response = validadores and get_conditional_response(request, *validadores)
+                if response is None:
+                    response = await vista(request, *args, **kwargs)
+                return _encabezados(response, validadores)
+        else:
+            @wraps(vista)
+            def envoltura(request, *args, **kwargs):
+                request.sellos = sellos(modelos)
+                validadores = _validadores(request, request.sellos)
+                response = validadores and get_conditional_response(request, *validadores)
+                if response is None:
+                    response = vista(request, *args, **kwargs)
+                return _encabezados(response, validadores)
+        return envoltura
+    return decorador
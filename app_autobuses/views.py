@@ -1,27 +1,47 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.conf import settings
 from django.contrib import messages
-from django.http import HttpResponse
-from .models import Autobus, Ruta, Empleado, Pasajero, Viaje, Boleto
-from .forms import AutobusForm, RutaForm, EmpleadoForm, PasajeroForm, ViajeForm, BoletoForm
-import uuid
-from django.db.models import Sum
+from django.core.exceptions import ValidationError
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from .models import Autobus, Ruta, Empleado, Pasajero, Viaje, Boleto, PlantillaHorario, EstadisticaBoleto
+from .forms import AutobusForm, RutaForm, EmpleadoForm, PasajeroForm, ViajeForm, BoletoForm, PlantillaHorarioForm, etiqueta_choque, etiqueta_viaje, etiqueta_pasajero
+from .paginacion import apaginar_keyset, paginar_keyset
+from .estadisticas import aobtener_estadisticas, obtener_estadisticas
+from .dashboard import aobtener_contadores, obtener_contadores
+from .asientos import AsientoNoDisponible, aobtener_mapa, guardar_boleto, obtener_mapa, vender_boletos
+from .busqueda import buscar_viajes
+from .duraciones import a_timedelta
+from . import itinerarios, plantillas, resumenes, versiones
+from .importacion import RECURSOS as RECURSOS_IMPORTACION, formato_de_nombre, importar
+from .instrumentacion import metricas
+from .codigos import PREFIJO_MANUAL, codigo_valido, es_codigo_anterior, generar_codigo, normalizar_codigo
+from .exportacion import (EXPORTACIONES, FORMATOS as FORMATOS_EXPORTACION, generar as generar_exportacion, nombre_archivo,
+                          validar_estado as validar_estado_exportacion)
+import asyncio
+import io
+import json
+from datetime import date, datetime, time, timedelta
+from urllib.parse import urlencode
+from django.db import IntegrityError
+from django.db.models import Q
+from django.db.models.functions import Lower, TruncMonth, TruncWeek
+from django.utils import timezone
+from django.views.decorators.http import require_POST
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
 
 # ========== VISTA PRINCIPAL ==========
 def index(request):
-    context = {
-        'total_autobuses': Autobus.objects.count(),
-        'total_rutas': Ruta.objects.filter(activa=True).count(),
-        'total_empleados': Empleado.objects.filter(activo=True).count(),
-        'total_pasajeros': Pasajero.objects.count(),
-        'viajes_programados': Viaje.objects.filter(estado='programado').count(),
-        'boletos_vendidos': Boleto.objects.filter(estado='pagado').count(),
-    }
+    context = obtener_contadores()
     return render(request, 'app_autobuses/index.html', context)
 
 # ========== AUTOBUSES ==========
+def _autobuses():
+    return Autobus.objects.all().order_by('marca', 'modelo')
+
+@versiones.condicional(Autobus)
 def autobus_listar(request):
-    autobuses = Autobus.objects.all().order_by('marca', 'modelo')
-    return render(request, 'app_autobuses/autobus/listar.html', {'autobuses': autobuses})
+    return render(request, 'app_autobuses/autobus/listar.html', {'autobuses': _autobuses()})
 
 def autobus_crear(request):
     if request.method == 'POST':
@@ -41,11 +61,15 @@ def autobus_editar(request, id):
     if request.method == 'POST':
         form = AutobusForm(request.POST, request.FILES, instance=autobus)
         if form.is_valid():
-            form.save()
-            messages.success(request, 'Autobús actualizado exitosamente.')
-            return redirect('autobus_listar')
-        else:
-            messages.error(request, 'Error al actualizar el autobús.')
+            try:
+                form.save()
+            except AsientoNoDisponible as e:
+                # Se vendió un asiento fuera de la capacidad nueva mientras se editaba
+                form.add_error('capacidad', str(e))
+            else:
+                messages.success(request, 'Autobús actualizado exitosamente.')
+                return redirect('autobus_listar')
+        messages.error(request, 'Error al actualizar el autobús.')
     else:
         form = AutobusForm(instance=autobus)
     return render(request, 'app_autobuses/autobus/editar.html', {'form': form, 'autobus': autobus})
@@ -59,9 +83,27 @@ def autobus_eliminar(request, id):
     return render(request, 'app_autobuses/autobus/eliminar.html', {'autobus': autobus})
 
 # ========== RUTAS ==========
+ORDENES_RUTA = {
+    'ruta': ('origen', 'destino'),
+    'duracion': ('duracion_estimada', 'id'),
+    '-duracion': ('-duracion_estimada', 'id'),
+}
+
+def _filtrar_rutas(request):
+    """Rutas filtrables por duración ("2h", "90", "1:45") y ordenables por ella (índice ruta_duracion_idx)."""
+    filtros = {campo: request.GET.get(campo, '').strip() for campo in ('duracion_min', 'duracion_max', 'orden')}
+    rutas = Ruta.objects.all()
+    minima, maxima = a_timedelta(filtros['duracion_min']), a_timedelta(filtros['duracion_max'])
+    if minima is not None:
+        rutas = rutas.filter(duracion_estimada__gte=minima)
+    if maxima is not None:
+        rutas = rutas.filter(duracion_estimada__lte=maxima)
+    return rutas.order_by(*ORDENES_RUTA.get(filtros['orden'], ORDENES_RUTA['ruta'])), filtros
+
+@versiones.condicional(Ruta)
 def ruta_listar(request):
-    rutas = Ruta.objects.all().order_by('origen', 'destino')
-    return render(request, 'app_autobuses/ruta/listar.html', {'rutas': rutas})
+    rutas, filtros = _filtrar_rutas(request)
+    return render(request, 'app_autobuses/ruta/listar.html', {'rutas': rutas, 'filtros': filtros})
 
 def ruta_crear(request):
     if request.method == 'POST':
@@ -99,9 +141,12 @@ def ruta_eliminar(request, id):
     return render(request, 'app_autobuses/ruta/eliminar.html', {'ruta': ruta})
 
 # ========== EMPLEADOS ==========
+def _empleados():
+    return Empleado.objects.all().order_by('apellido', 'nombre')
+
+@versiones.condicional(Empleado)
 def empleado_listar(request):
-    empleados = Empleado.objects.all().order_by('apellido', 'nombre')
-    return render(request, 'app_autobuses/empleado/listar.html', {'empleados': empleados})
+    return render(request, 'app_autobuses/empleado/listar.html', {'empleados': _empleados()})
 
 def empleado_crear(request):
     if request.method == 'POST':
@@ -139,9 +184,12 @@ def empleado_eliminar(request, id):
     return render(request, 'app_autobuses/empleado/eliminar.html', {'empleado': empleado})
 
 # ========== PASAJEROS ==========
+def _pasajeros():
+    return Pasajero.objects.all().order_by('apellido', 'nombre')
+
+@versiones.condicional(Pasajero)
 def pasajero_listar(request):
-    pasajeros = Pasajero.objects.all().order_by('apellido', 'nombre')
-    return render(request, 'app_autobuses/pasajero/listar.html', {'pasajeros': pasajeros})
+    return render(request, 'app_autobuses/pasajero/listar.html', {'pasajeros': _pasajeros()})
 
 def pasajero_crear(request):
     if request.method == 'POST':
@@ -179,9 +227,12 @@ def pasajero_eliminar(request, id):
     return render(request, 'app_autobuses/pasajero/eliminar.html', {'pasajero': pasajero})
 
 # ========== VIAJES ==========
+def _viajes():
+    return Viaje.objects.select_related('ruta', 'autobus', 'conductor').order_by('-fecha_salida')
+
+@versiones.condicional(Viaje, Ruta, Autobus, Empleado)
 def viaje_listar(request):
-    viajes = Viaje.objects.all().order_by('-fecha_salida')
-    return render(request, 'app_autobuses/viaje/listar.html', {'viajes': viajes})
+    return render(request, 'app_autobuses/viaje/listar.html', {'viajes': _viajes()})
 
 def viaje_crear(request):
     if request.method == 'POST':
@@ -201,11 +252,15 @@ def viaje_editar(request, id):
     if request.method == 'POST':
         form = ViajeForm(request.POST, instance=viaje)
         if form.is_valid():
-            form.save()
-            messages.success(request, 'Viaje actualizado exitosamente.')
-            return redirect('viaje_listar')
-        else:
-            messages.error(request, 'Error al actualizar el viaje.')
+            try:
+                form.save()
+            except AsientoNoDisponible as e:
+                # Se vendió un asiento fuera del autobús nuevo mientras se editaba
+                form.add_error('autobus', str(e))
+            else:
+                messages.success(request, 'Viaje actualizado exitosamente.')
+                return redirect('viaje_listar')
+        messages.error(request, 'Error al actualizar el viaje.')
     else:
         form = ViajeForm(instance=viaje)
     return render(request, 'app_autobuses/viaje/editar.html', {'form': form, 'viaje': viaje})
@@ -218,28 +273,160 @@ def viaje_eliminar(request, id):
         return redirect('viaje_listar')
     return render(request, 'app_autobuses/viaje/eliminar.html', {'viaje': viaje})
 
+# ========== PLANTILLAS DE HORARIO ==========
+@versiones.condicional(PlantillaHorario, Ruta, Autobus, Empleado)
+def plantilla_listar(request):
+    plantillas_horario = PlantillaHorario.objects.select_related('ruta', 'autobus', 'conductor')
+    return render(request, 'app_autobuses/plantilla/listar.html', {'plantillas': plantillas_horario})
+
+def plantilla_crear(request):
+    if request.method == 'POST':
+        form = PlantillaHorarioForm(request.POST)
+        if form.is_valid():
+            form.save()
+            messages.success(request, 'Plantilla creada exitosamente. Usa "Generar" para crear sus viajes.')
+            return redirect('plantilla_listar')
+        else:
+            messages.error(request, 'Error al crear la plantilla.')
+    else:
+        form = PlantillaHorarioForm()
+    return render(request, 'app_autobuses/plantilla/crear.html', {'form': form})
+
+def plantilla_editar(request, id):
+    plantilla = get_object_or_404(PlantillaHorario, id=id)
+    if request.method == 'POST':
+        form = PlantillaHorarioForm(request.POST, instance=plantilla)
+        if form.is_valid():
+            form.save()
+            messages.success(request, 'Plantilla actualizada exitosamente.')
+            return redirect('plantilla_listar')
+        else:
+            messages.error(request, 'Error al actualizar la plantilla.')
+    else:
+        form = PlantillaHorarioForm(instance=plantilla)
+    return render(request, 'app_autobuses/plantilla/crear.html', {'form': form, 'plantilla': plantilla})
+
+@require_POST
+def plantilla_generar(request, id):
+    """Crea los viajes que le faltan a la plantilla (ver plantillas.py)."""
+    plantilla = get_object_or_404(PlantillaHorario.objects.select_related('ruta', 'autobus'), id=id)
+    try:
+        resultado = plantillas.generar(plantilla)
+    except plantillas.PlantillaInvalida as error:
+        messages.error(request, str(error))
+        return redirect('plantilla_listar')
+    messages.success(request, f'{plantilla.nombre}: {resultado["creados"]} viajes creados, '
+                              f'{resultado["existentes"]} ya existían.')
+    if resultado['choques']:
+        ejemplos = '; '.join(etiqueta_choque(choque) for choque in resultado['choques'][:5])
+        messages.warning(request, f'Salidas sin crear por choques de horario ({len(resultado["choques"])}): '
+                                  f'{ejemplos}{"..." if len(resultado["choques"]) > 5 else ""}')
+    return redirect('plantilla_listar')
+
+def _parametros_busqueda(request):
+    """``(origen, destino, dia)`` de la consulta; el día por defecto es hoy."""
+    origen = request.GET.get('origen', '').strip()
+    destino = request.GET.get('destino', '').strip()
+    try:
+        dia = date.fromisoformat(request.GET.get('fecha', ''))
+    except ValueError:
+        dia = timezone.localdate()
+    return origen, destino, dia
+
+def viaje_buscar(request):
+    """Viajes con asientos libres entre dos ciudades en un día (ver busqueda.py)."""
+    origen, destino, dia = _parametros_busqueda(request)
+    pagina = _pagina_api(request)
+    resultado = buscar_viajes(origen, destino, dia, pagina) if origen and destino else None
+    conexion = None
+    if resultado is not None and not resultado['total']:
+        # Sin viajes directos: la mejor combinación con transbordos que sale ese día
+        desde = max(timezone.now(), timezone.make_aware(datetime.combine(dia, time.min)))
+        conexion = itinerarios.grafo().planear_salidas(origen, destino, desde)
+        if conexion and timezone.localtime(conexion['salida']).date() != dia:
+            conexion = None
+    ciudades = sorted({ciudad for par in Ruta.objects.filter(activa=True).values_list('origen', 'destino')
+                       for ciudad in par})
+    return render(request, 'app_autobuses/viaje/buscar.html', {
+        'origen': origen,
+        'destino': destino,
+        'fecha': dia.isoformat(),
+        'ciudades': ciudades,
+        'resultado': resultado,
+        'conexion': conexion,
+        'filtros_url': urlencode({'origen': origen, 'destino': destino, 'fecha': dia.isoformat()}),
+    })
+
 # ========== BOLETOS ==========
+def _filtrar_boletos(request):
+    """Aplica los filtros de la URL (estado, viaje, desde, hasta) al listado."""
+    boletos = Boleto.objects.all()
+    filtros = {}
+
+    estado = request.GET.get('estado', '')
+    if estado in dict(Boleto.ESTADOS):
+        boletos = boletos.filter(estado=estado)
+        filtros['estado'] = estado
+
+    viaje = request.GET.get('viaje', '')
+    if viaje.isdigit():
+        boletos = boletos.filter(viaje_id=int(viaje))
+        filtros['viaje'] = viaje
+
+    # Rangos sobre la columna indexada, sin __date para no anular el índice
+    for parametro, lookup, dias in (('desde', 'fecha_compra__gte', 0), ('hasta', 'fecha_compra__lt', 1)):
+        try:
+            dia = date.fromisoformat(request.GET.get(parametro, ''))
+        except ValueError:
+            continue
+        inicio = timezone.make_aware(datetime.combine(dia + timedelta(days=dias), time.min))
+        boletos = boletos.filter(**{lookup: inicio})
+        filtros[parametro] = dia.isoformat()
+
+    return boletos, filtros
+
+def _boletos_listado(request):
+    boletos, filtros = _filtrar_boletos(request)
+    boletos = boletos.select_related('pasajero', 'viaje__ruta').only(
+        'codigo_boleto', 'asiento_numero', 'precio', 'estado', 'fecha_compra', 'fecha_actualizacion',
+        'pasajero', 'pasajero__nombre', 'pasajero__apellido', 'pasajero__telefono', 'pasajero__fecha_actualizacion',
+        'viaje', 'viaje__fecha_salida', 'viaje__fecha_actualizacion',
+        'viaje__ruta', 'viaje__ruta__origen', 'viaje__ruta__destino', 'viaje__ruta__fecha_actualizacion',
+    )
+    return boletos, filtros
+
+def _contexto_boletos(pagina, filtros, estadisticas):
+    return {
+        'boletos': pagina['objetos'],
+        'cursor_siguiente': pagina['siguiente'],
+        'cursor_anterior': pagina['anterior'],
+        'filtros': filtros,
+        'filtros_url': urlencode(filtros),
+        'estados': Boleto.ESTADOS,
+        'total_ingresos': estadisticas['pagado']['total'],
+        'boletos_pagados': estadisticas['pagado']['cantidad'],
+        'boletos_reservados': estadisticas['reservado']['cantidad'],
+        'boletos_usados': estadisticas['usado']['cantidad'],
+        'boletos_cancelados': estadisticas['cancelado']['cantidad'],
+    }
+
+@versiones.condicional(Boleto, Pasajero, Viaje, Ruta, EstadisticaBoleto)
 def boleto_listar(request):
-    boletos = Boleto.objects.all().order_by('-fecha_compra')
+    boletos, filtros = _boletos_listado(request)
+    pagina = paginar_keyset(
+        boletos, 'fecha_compra',
+        despues=request.GET.get('despues'),
+        antes=request.GET.get('antes'),
+    )
     
-    # Estadísticas
-    total_ingresos = boletos.filter(estado='pagado').aggregate(total=Sum('precio'))['total'] or 0
-    boletos_pagados = boletos.filter(estado='pagado').count()
-    boletos_reservados = boletos.filter(estado='reservado').count()
-    boletos_usados = boletos.filter(estado='usado').count()
-    boletos_cancelados = boletos.filter(estado='cancelado').count()
-    
-    context = {
-        'boletos': boletos,
-        'total_ingresos': total_ingresos,
-        'boletos_pagados': boletos_pagados,
-        'boletos_reservados': boletos_reservados,
-        'boletos_usados': boletos_usados,
-        'boletos_cancelados': boletos_cancelados,
-    }
+    # Estadísticas (tabla acumulada, ver estadisticas.py)
+    estadisticas = obtener_estadisticas()
     
+    context = _contexto_boletos(pagina, filtros, estadisticas)
     return render(request, 'app_autobuses/boleto/listar.html', context)
 
+ASIENTO_OCUPADO = 'Ese asiento ya está ocupado en este viaje.'
+
 def boleto_crear(request):
     # Verificar datos necesarios
     if not Viaje.objects.exists():
@@ -253,24 +440,28 @@ def boleto_crear(request):
     if request.method == 'POST':
         form = BoletoForm(request.POST)
         if form.is_valid():
-            boleto = form.save()
-            messages.success(request, f'✅ Boleto {boleto.codigo_boleto} creado exitosamente!')
-            return redirect('boleto_listar')
-        else:
+            try:
+                boleto = form.save()
+            except AsientoNoDisponible as e:
+                # Otro empleado vendió el asiento entre la validación y el guardado
+                form.add_error('asiento_numero', str(e))
+            except IntegrityError:
+                # La restricción única de la base lo detectó antes que el mapa de asientos
+                form.add_error('asiento_numero', ASIENTO_OCUPADO)
+            else:
+                messages.success(request, f'✅ Boleto {boleto.codigo_boleto} creado exitosamente!')
+                return redirect('boleto_listar')
+        if form.errors:
             # Mostrar errores específicos
             for field, errors in form.errors.items():
                 for error in errors:
                     messages.error(request, f'{field}: {error}')
     else:
-        form = BoletoForm()
+        # Desde la búsqueda de viajes llega el viaje ya elegido
+        viaje = request.GET.get('viaje', '')
+        form = BoletoForm(initial={'viaje': viaje} if viaje.isdigit() else None)
     
-    context = {
-        'form': form,
-        'viajes': Viaje.objects.all(),
-        'pasajeros': Pasajero.objects.all(),
-    }
-    
-    return render(request, 'app_autobuses/boleto/crear.html', context)
+    return render(request, 'app_autobuses/boleto/crear.html', {'form': form})
 
 def boleto_editar(request, id):
     boleto = get_object_or_404(Boleto, id=id)
@@ -278,9 +469,15 @@ def boleto_editar(request, id):
     if request.method == 'POST':
         form = BoletoForm(request.POST, instance=boleto)
         if form.is_valid():
-            form.save()
-            messages.success(request, f'Boleto {boleto.codigo_boleto} actualizado.')
-            return redirect('boleto_listar')
+            try:
+                form.save()
+            except AsientoNoDisponible as e:
+                form.add_error('asiento_numero', str(e))
+            except IntegrityError:
+                form.add_error('asiento_numero', ASIENTO_OCUPADO)
+            else:
+                messages.success(request, f'Boleto {boleto.codigo_boleto} actualizado.')
+                return redirect('boleto_listar')
     else:
         form = BoletoForm(instance=boleto)
     
@@ -297,6 +494,377 @@ def boleto_eliminar(request, id):
     
     return render(request, 'app_autobuses/boleto/eliminar.html', {'boleto': boleto})
 
+# ========== REPORTES ==========
+AGRUPACIONES_REPORTE = {'dia': None, 'semana': TruncWeek, 'mes': TruncMonth}
+
+def reporte_rutas(request):
+    """Ingresos, boletos y ocupación por ruta y día, semana o mes.
+
+    Solo lee ``ResumenRutaDia`` (ver resumenes.py): una fila por ruta y día,
+    sin tocar los boletos.
+    """
+    hoy = timezone.localdate()
+    fechas = {}
+    for parametro, defecto in (('desde', hoy - timedelta(days=29)), ('hasta', hoy)):
+        try:
+            fechas[parametro] = date.fromisoformat(request.GET.get(parametro, ''))
+        except ValueError:
+            fechas[parametro] = defecto
+    agrupar = request.GET.get('agrupar', 'dia')
+    if agrupar not in AGRUPACIONES_REPORTE:
+        agrupar = 'dia'
+    ruta = request.GET.get('ruta', '')
+    ruta_id = int(ruta) if ruta.isdigit() else None
+
+    filas = resumenes.reporte(fechas['desde'], fechas['hasta'], AGRUPACIONES_REPORTE[agrupar], ruta_id)
+    totales = {campo: sum(fila[campo] for fila in filas) for campo in resumenes.CAMPOS}
+    for fila in [*filas, totales]:
+        fila['ocupacion'] = fila['ocupados'] * 100 / fila['asientos'] if fila['asientos'] else None
+
+    context = {
+        'filas': filas,
+        'totales': totales,
+        'desde': fechas['desde'].isoformat(),
+        'hasta': fechas['hasta'].isoformat(),
+        'agrupar': agrupar,
+        'ruta': ruta_id,
+        'rutas': Ruta.objects.order_by('origen', 'destino').values_list('pk', 'origen', 'destino'),
+    }
+    return render(request, 'app_autobuses/reporte/rutas.html', context)
+
+# ========== IMPORTACIÓN ==========
+ERRORES_MOSTRADOS = 50
+
+def importar_datos(request):
+    resumen = None
+    errores = []
+    if request.method == 'POST':
+        recurso = request.POST.get('recurso')
+        archivo = request.FILES.get('archivo')
+        if recurso not in RECURSOS_IMPORTACION or archivo is None:
+            messages.error(request, 'Selecciona qué importar y un archivo CSV o JSONL.')
+        else:
+            def al_error(numero, mensajes):
+                if len(errores) < ERRORES_MOSTRADOS:
+                    errores.append((numero, mensajes))
+            
+            # El archivo subido se lee en streaming desde el archivo temporal
+            texto = io.TextIOWrapper(archivo.file, encoding='utf-8-sig', newline='')
+            resumen = importar(recurso, texto, formato_de_nombre(archivo.name), al_error=al_error)
+            messages.success(request, f'{resumen["creados"]} registros importados.')
+            if resumen['errores']:
+                messages.warning(request, f'{resumen["errores"]} filas con errores no se importaron.')
+    
+    return render(request, 'app_autobuses/importar.html', {
+        'recursos': sorted(RECURSOS_IMPORTACION),
+        'resumen': resumen,
+        'errores': errores,
+    })
+
+# ========== EXPORTACIÓN ==========
+def exportar_datos(request, recurso):
+    """Descarga en streaming de boletos, viajes o pasajeros (CSV o JSONL)."""
+    if recurso not in EXPORTACIONES:
+        raise Http404('No se puede exportar ese recurso')
+    formato = request.GET.get('formato', 'csv')
+    if formato not in FORMATOS_EXPORTACION:
+        return HttpResponse('Formato no soportado.', status=400)
+    
+    filtros = {}
+    for parametro in ('desde', 'hasta'):
+        try:
+            filtros[parametro] = date.fromisoformat(request.GET.get(parametro, ''))
+        except ValueError:
+            pass
+    estado = request.GET.get('estado', '')
+    if estado:
+        # Se valida antes de empezar la respuesta: ya en streaming no se puede responder 400
+        try:
+            validar_estado_exportacion(recurso, estado)
+        except ValueError as e:
+            return HttpResponse(str(e), status=400)
+        filtros['estado'] = estado
+    comprimir = request.GET.get('gzip') == '1'
+    
+    response = StreamingHttpResponse(
+        generar_exportacion(recurso, formato, comprimir, **filtros),
+        content_type='application/gzip' if comprimir else (
+            'text/csv; charset=utf-8' if formato == 'csv' else 'application/x-ndjson; charset=utf-8'),
+    )
+    response['Content-Disposition'] = f'attachment; filename="{nombre_archivo(recurso, formato, comprimir)}"'
+    return response
+
+# ========== API (JSON) ==========
+RESULTADOS_POR_PAGINA = 20
+
+def _pagina_api(request):
+    pagina = request.GET.get('pagina', '1')
+    return max(int(pagina), 1) if pagina.isdigit() else 1
+
+def _pagina_busqueda(objetos, pagina):
+    inicio = (pagina - 1) * RESULTADOS_POR_PAGINA
+    return objetos[inicio:inicio + RESULTADOS_POR_PAGINA + 1]
+
+def _respuesta_busqueda(filas, etiqueta):
+    return JsonResponse({
+        'resultados': [{'id': obj.pk, 'texto': etiqueta(obj)} for obj in filas[:RESULTADOS_POR_PAGINA]],
+        'mas': len(filas) > RESULTADOS_POR_PAGINA,
+    })
+
+def _buscar_viajes(request):
+    viajes = (Viaje.objects.select_related('ruta')
+              .filter(fecha_salida__gte=timezone.now())
+              .exclude(estado='cancelado')
+              .order_by('fecha_salida', 'id'))
+    q = request.GET.get('q', '').strip()
+    if q:
+        viajes = viajes.filter(Q(ruta__origen__istartswith=q) | Q(ruta__destino__istartswith=q))
+    return _pagina_busqueda(viajes, _pagina_api(request))
+
+def api_buscar_viajes(request):
+    """Viajes próximos y no cancelados, filtrados por origen o destino."""
+    return _respuesta_busqueda(list(_buscar_viajes(request)), etiqueta_viaje)
+
+def api_viajes_disponibles(request):
+    """Búsqueda por origen, destino y fecha (AAAA-MM-DD); solo viajes con asientos libres."""
+    origen, destino, dia = _parametros_busqueda(request)
+    if not origen or not destino:
+        return JsonResponse({'error': 'Indica origen y destino'}, status=400)
+    resultado = buscar_viajes(origen, destino, dia, _pagina_api(request))
+    return JsonResponse({
+        'fecha': dia.isoformat(),
+        'resultados': [{
+            'id': viaje['id'],
+            'origen': viaje['ruta__origen'],
+            'destino': viaje['ruta__destino'],
+            'salida': viaje['fecha_salida'].isoformat(),
+            'llegada': viaje['fecha_llegada_estimada'].isoformat(),
+            'asientos_disponibles': viaje['asientos_disponibles'],
+            'precio': str(viaje['ruta__precio_base']),
+        } for viaje in resultado['viajes']],
+        'pagina': resultado['pagina'],
+        'mas': resultado['mas'],
+        'total': resultado['total'],
+    })
+
+def api_itinerarios(request):
+    """Mejor conexión entre dos ciudades, con transbordos.
+
+    Sin ``salida`` (ni ``criterio=llegada``) se busca sobre la red de rutas
+    por ``precio``, ``distancia`` o ``duracion``. Con ``salida`` (fecha u
+    hora ISO) se usan viajes reales que salen desde ese momento y el
+    criterio puede ser ``llegada``, ``precio`` o ``distancia``.
+    """
+    origen = request.GET.get('origen', '').strip()
+    destino = request.GET.get('destino', '').strip()
+    criterio = request.GET.get('criterio', 'precio')
+    if not origen or not destino:
+        return JsonResponse({'error': 'Indica origen y destino'}, status=400)
+    tramos = request.GET.get('tramos', '')
+    max_tramos = min(int(tramos), 8) if tramos.isdigit() and int(tramos) > 0 else None
+
+    salida = request.GET.get('salida', '')
+    grafo = itinerarios.grafo()
+    if salida or criterio == 'llegada':
+        if criterio not in itinerarios.CRITERIOS_SALIDAS:
+            return JsonResponse({'error': f'Criterio no válido: {criterio}'}, status=400)
+        try:
+            desde = datetime.fromisoformat(salida) if salida else timezone.now()
+        except ValueError:
+            return JsonResponse({'error': 'Fecha de salida no válida'}, status=400)
+        if timezone.is_naive(desde):
+            desde = timezone.make_aware(desde)
+        itinerario = grafo.planear_salidas(origen, destino, max(desde, timezone.now()), criterio, max_tramos)
+    else:
+        if criterio not in itinerarios.CRITERIOS:
+            return JsonResponse({'error': f'Criterio no válido: {criterio}'}, status=400)
+        itinerario = grafo.mejor_ruta(origen, destino, criterio, max_tramos)
+    # DjangoJSONEncoder convierte los Decimal y las fechas
+    return JsonResponse({'itinerario': itinerario})
+
+def _buscar_pasajeros(request):
+    """Búsqueda por prefijo de apellido, nombre o email.
+
+    Se compara ``LOWER(campo)`` contra un rango ``[q, q + máximo)`` para que
+    la base de datos use los índices funcionales de ``Pasajero``.
+    """
+    pasajeros = Pasajero.objects.only('nombre', 'apellido').order_by('apellido', 'nombre', 'id')
+    q = request.GET.get('q', '').strip().lower()
+    if q:
+        limite = q + chr(0x10FFFF)
+        pasajeros = pasajeros.annotate(
+            apellido_min=Lower('apellido'), nombre_min=Lower('nombre'), email_min=Lower('email'),
+        ).filter(
+            Q(apellido_min__gte=q, apellido_min__lt=limite)
+            | Q(nombre_min__gte=q, nombre_min__lt=limite)
+            | Q(email_min__gte=q, email_min__lt=limite)
+        )
+    return _pagina_busqueda(pasajeros, _pagina_api(request))
+
+def api_buscar_pasajeros(request):
+    return _respuesta_busqueda(list(_buscar_pasajeros(request)), etiqueta_pasajero)
+
+def api_mapa_asientos(request, id):
+    """Capacidad, asientos ocupados y conteo por estado de un viaje.
+
+    Responde 304 si el ``If-None-Match`` coincide, así que las pantallas de
+    venta pueden consultar el mapa a menudo sin costo.
+    """
+    try:
+        datos, etag = obtener_mapa(id)
+    except Viaje.DoesNotExist:
+        raise Http404('El viaje no existe')
+    return _respuesta_mapa(request, datos, etag)
+
+def _respuesta_mapa(request, datos, etag):
+    etag = quote_etag(etag)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = JsonResponse(datos)
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+@require_POST
+def api_venta_multiple(request):
+    """Venta de varios asientos de un viaje en una sola transacción.
+
+    Espera un JSON como ``{"viaje": 1, "estado": "pagado", "boletos":
+    [{"pasajero": 5, "asiento": 12, "precio": "250.00"}, ...]}``. Si algún
+    asiento no está disponible no se vende ninguno y se responde 409 con la
+    lista de asientos en conflicto.
+    """
+    try:
+        datos = json.loads(request.body)
+        viaje_id = int(datos['viaje'])
+        entradas = datos['boletos']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Se esperaba un JSON con "viaje" y "boletos".'}, status=400)
+    
+    try:
+        boletos = vender_boletos(viaje_id, entradas, datos.get('estado', 'pagado'))
+    except Viaje.DoesNotExist:
+        return JsonResponse({'error': 'El viaje no existe.'}, status=404)
+    except AsientoNoDisponible as e:
+        return JsonResponse({'error': str(e), 'asientos': e.asientos}, status=409)
+    except ValidationError as e:
+        return JsonResponse({'error': ' '.join(e.messages)}, status=400)
+    
+    return JsonResponse({
+        'boletos': [
+            {'id': b.pk, 'codigo': b.codigo_boleto, 'pasajero': b.pasajero_id, 'asiento': b.asiento_numero}
+            for b in boletos
+        ],
+    }, status=201)
+
+def _codigo_a_validar(request):
+    """``(codigo, consulta)``; sin consulta si el código está mal escrito."""
+    codigo = normalizar_codigo(request.GET.get('codigo'))
+    if not codigo_valido(codigo) and not es_codigo_anterior(codigo):
+        return codigo, None
+    return codigo, Boleto.objects.select_related('viaje__ruta', 'pasajero').filter(codigo_boleto=codigo)
+
+def api_validar_boleto(request):
+    """Consulta de un código en el abordaje.
+
+    Un código mal escrito se rechaza por su carácter de control, sin
+    consultar la base de datos.
+    """
+    codigo, boletos = _codigo_a_validar(request)
+    if boletos is None:
+        return _codigo_mal_escrito(codigo)
+    return _respuesta_validacion(codigo, boletos.first())
+
+def _codigo_mal_escrito(codigo):
+    return JsonResponse({'codigo': codigo, 'error': 'El código no es válido, revisa que esté bien escrito.'}, status=400)
+
+def _respuesta_validacion(codigo, boleto):
+    if boleto is None:
+        return JsonResponse({'codigo': codigo, 'error': 'No existe un boleto con ese código.'}, status=404)
+    return JsonResponse({
+        'codigo': codigo,
+        'estado': boleto.estado,
+        'asiento': boleto.asiento_numero,
+        'pasajero': str(boleto.pasajero),
+        'viaje': etiqueta_viaje(boleto.viaje),
+    })
+
+# ========== VISTAS ASYNC (ASGI) ==========
+# Versiones async de las páginas de solo lectura y de la API de consulta;
+# urls.py las usa con VISTAS_ASYNC (ver asgi.py). Usan las mismas consultas
+# que las vistas de arriba, pero las ejecutan con el ORM async y
+# materializan los resultados antes de renderizar: una plantilla no puede
+# consultar la base desde el bucle de eventos. Las vistas que escriben
+# (formularios, venta múltiple) siguen siendo síncronas, porque el ORM async
+# no tiene transacciones; Django las ejecuta en un hilo.
+
+async def _lista(consulta):
+    return [obj async for obj in consulta]
+
+async def index_async(request):
+    context = await aobtener_contadores()
+    return render(request, 'app_autobuses/index.html', context)
+
+@versiones.condicional(Autobus)
+async def autobus_listar_async(request):
+    return render(request, 'app_autobuses/autobus/listar.html', {'autobuses': await _lista(_autobuses())})
+
+@versiones.condicional(Ruta)
+async def ruta_listar_async(request):
+    rutas, filtros = _filtrar_rutas(request)
+    return render(request, 'app_autobuses/ruta/listar.html', {'rutas': await _lista(rutas), 'filtros': filtros})
+
+@versiones.condicional(Empleado)
+async def empleado_listar_async(request):
+    return render(request, 'app_autobuses/empleado/listar.html', {'empleados': await _lista(_empleados())})
+
+@versiones.condicional(Pasajero)
+async def pasajero_listar_async(request):
+    return render(request, 'app_autobuses/pasajero/listar.html', {'pasajeros': await _lista(_pasajeros())})
+
+@versiones.condicional(Viaje, Ruta, Autobus, Empleado)
+async def viaje_listar_async(request):
+    return render(request, 'app_autobuses/viaje/listar.html', {'viajes': await _lista(_viajes())})
+
+@versiones.condicional(Boleto, Pasajero, Viaje, Ruta, EstadisticaBoleto)
+async def boleto_listar_async(request):
+    boletos, filtros = _boletos_listado(request)
+    # La página y las estadísticas no dependen una de otra
+    pagina, estadisticas = await asyncio.gather(
+        apaginar_keyset(boletos, 'fecha_compra',
+                        despues=request.GET.get('despues'), antes=request.GET.get('antes')),
+        aobtener_estadisticas(),
+    )
+    context = _contexto_boletos(pagina, filtros, estadisticas)
+    return render(request, 'app_autobuses/boleto/listar.html', context)
+
+async def api_buscar_viajes_async(request):
+    return _respuesta_busqueda(await _lista(_buscar_viajes(request)), etiqueta_viaje)
+
+async def api_buscar_pasajeros_async(request):
+    return _respuesta_busqueda(await _lista(_buscar_pasajeros(request)), etiqueta_pasajero)
+
+async def api_mapa_asientos_async(request, id):
+    try:
+        datos, etag = await aobtener_mapa(id)
+    except Viaje.DoesNotExist:
+        raise Http404('El viaje no existe')
+    return _respuesta_mapa(request, datos, etag)
+
+async def api_validar_boleto_async(request):
+    codigo, boletos = _codigo_a_validar(request)
+    if boletos is None:
+        return _codigo_mal_escrito(codigo)
+    return _respuesta_validacion(codigo, await boletos.afirst())
+
+# ========== MÉTRICAS INTERNAS ==========
+def metricas_internas(request):
+    """Histograma de latencias por vista de este proceso (solo desde INTERNAL_IPS)."""
+    if request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS:
+        raise Http404
+    return JsonResponse(metricas())
+
 # ========== FUNCIÓN DE EMERGENCIA ==========
 def crear_boleto_manual(request):
     """Función de emergencia para crear un boleto si nada funciona"""
@@ -311,14 +879,14 @@ def crear_boleto_manual(request):
             viaje = Viaje.objects.get(id=viaje_id)
             pasajero = Pasajero.objects.get(id=pasajero_id)
             
-            boleto = Boleto.objects.create(
+            boleto = guardar_boleto(Boleto(
                 viaje=viaje,
                 pasajero=pasajero,
-                asiento_numero=asiento,
+                asiento_numero=int(asiento),
                 precio=precio,
                 estado=estado,
-                codigo_boleto=f"MAN-{str(uuid.uuid4())[:8].upper()}"
-            )
+                codigo_boleto=generar_codigo(PREFIJO_MANUAL)
+            ))
             
             messages.success(request, f'✅ Boleto {boleto.codigo_boleto} creado manualmente!')
             return redirect('boleto_listar')
@@ -327,14 +895,10 @@ def crear_boleto_manual(request):
             messages.error(request, 'El viaje seleccionado no existe.')
         except Pasajero.DoesNotExist:
             messages.error(request, 'El pasajero seleccionado no existe.')
+        except AsientoNoDisponible as e:
+            messages.error(request, str(e))
         except Exception as e:
             messages.error(request, f'Error: {str(e)}')
     
-    # Mostrar formulario simple
-    viajes = Viaje.objects.all()
-    pasajeros = Pasajero.objects.all()
-    
-    return render(request, 'app_autobuses/boleto/manual.html', {
-        'viajes': viajes,
-        'pasajeros': pasajeros
-    })
\ No newline at end of file
+    # Mostrar formulario simple (las opciones se buscan por AJAX)
+    return render(request, 'app_autobuses/boleto/manual.html')
\ No newline at end of file
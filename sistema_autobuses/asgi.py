@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
+
+Perfil de despliegue (ver README): con SISTEMA_ASGI=1 las páginas de
+lectura usan vistas async y las conexiones no se reutilizan. Por ejemplo:
+
+    SISTEMA_DB=produccion uvicorn sistema_autobuses.asgi:application --workers 2
 """
 
 import os
@@ -12,5 +17,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sistema_autobuses.settings')
+os.environ.setdefault('SISTEMA_ASGI', '1')
 
 application = get_asgi_application()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,8 +42,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primero, para que la latencia incluya al resto de los middleware
+    'app_autobuses.instrumentacion.InstrumentacionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'app_autobuses.enrutador.ReplicaMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -54,7 +58,8 @@ ROOT_URLCONF = 'sistema_autobuses.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates que además mide el tiempo de render (instrumentacion.py)
+        'BACKEND': 'app_autobuses.instrumentacion.PlantillasDjango',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -73,13 +78,159 @@ WSGI_APPLICATION = 'sistema_autobuses.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# SISTEMA_DB elige el perfil: desarrollo (por defecto) o produccion.
+# En produccion SQLite usa WAL (los lectores no esperan al escritor),
+# synchronous=NORMAL (seguro con WAL), mmap y una caché de páginas mayor,
+# espera hasta busy_timeout en lugar de fallar con "database is locked",
+# abre las transacciones con BEGIN IMMEDIATE (el bloqueo de escritura se
+# pide al inicio y no a mitad de la transacción) y reutiliza conexiones.
+
+SQLITE_PRAGMAS_PRODUCCION = ';'.join([
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA mmap_size=268435456',   # 256 MB
+    'PRAGMA cache_size=-65536',     # 64 MB (negativo = KiB)
+    'PRAGMA busy_timeout=10000',    # ms
+    'PRAGMA temp_store=MEMORY',
+])
+
+DATABASE_PERFILES = {
+    'desarrollo': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('SISTEMA_DB_NOMBRE', BASE_DIR / 'db.sqlite3'),
+    },
+    'produccion': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('SISTEMA_DB_NOMBRE', BASE_DIR / 'db.sqlite3'),
+        'CONN_MAX_AGE': int(os.environ.get('SISTEMA_DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': SQLITE_PRAGMAS_PRODUCCION,
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+}
+
+DATABASES = {
+    'default': DATABASE_PERFILES[os.environ.get('SISTEMA_DB', 'desarrollo')],
+}
+
+# Despliegue con ASGI (sistema_autobuses/asgi.py pone SISTEMA_ASGI=1). Las
+# páginas de lectura y la API de consulta usan sus versiones async
+# (VISTAS_ASYNC; SISTEMA_VISTAS_ASYNC=0 las desactiva). Bajo ASGI cada
+# petición ejecuta el ORM en su propio hilo, así que una conexión persistente
+# se quedaría abierta con un hilo que ya terminó: se cierran al final de cada
+# petición (CONN_MAX_AGE=0).
+
+ASGI = os.environ.get('SISTEMA_ASGI') == '1'
+VISTAS_ASYNC = os.environ.get('SISTEMA_VISTAS_ASYNC', '1' if ASGI else '0') == '1'
+
+if ASGI:
+    DATABASES['default'] = {**DATABASES['default'], 'CONN_MAX_AGE': 0}
+
+# Réplica de lectura (app_autobuses/enrutador.py). SISTEMA_DB_REPLICA es la
+# ruta de un segundo archivo SQLite; para mantenerlo al día localmente:
+#   python manage.py sincronizar_replica --cada 5
+# Sin esa variable todo se lee y escribe en default.
+
+DATABASE_ROUTERS = ['app_autobuses.enrutador.EnrutadorReplicas']
+REPLICAS = []
+
+if os.environ.get('SISTEMA_DB_REPLICA'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['SISTEMA_DB_REPLICA'],
+        # En las pruebas la réplica es la misma base que default
+        'TEST': {'MIRROR': 'default'},
     }
+    REPLICAS = ['replica']
+
+# Segundos que una sesión lee de default después de escribir
+REPLICA_FIJAR_SEGUNDOS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# SISTEMA_CACHE elige el backend: locmem (por defecto), file o db.
+# Para "db" hay que ejecutar antes: python manage.py createcachetable
+
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sistema-autobuses',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('SISTEMA_CACHE_DIR', BASE_DIR / 'cache'),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'cache_sistema',
+    },
+}
+
+CACHES = {
+    'default': CACHE_BACKENDS[os.environ.get('SISTEMA_CACHE', 'locmem')],
+    # Filas y tablas de los listados (app_autobuses/fragmentos.py). Las claves
+    # llevan la versión de lo que muestran, así que cada proceso puede tener la
+    # suya; una entrada por fila necesita más que las 300 por defecto.
+    'fragmentos': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sistema-autobuses-fragmentos',
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+}
+
+# Contadores del tablero (app_autobuses/dashboard.py)
+DASHBOARD_CACHE_ALIAS = 'default'
+DASHBOARD_CACHE_TIMEOUT = 300
+DASHBOARD_STALE_WHILE_REVALIDATE = True
+
+# Instrumentación por petición (app_autobuses/instrumentacion.py)
+INSTRUMENTACION_LENTA_MS = 500
+INSTRUMENTACION_REPETIDAS = 3
+INSTRUMENTACION_VENTANA_MINUTOS = 15
+# Direcciones que pueden consultar /interno/metricas/
+INTERNAL_IPS = ['127.0.0.1']
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'app_autobuses': {'handlers': ['console'], 'level': 'INFO'},
+    },
 }
 
+# Búsqueda de viajes (app_autobuses/busqueda.py)
+BUSQUEDA_CACHE_TIMEOUT = 600
+
+# Planeador de itinerarios (app_autobuses/itinerarios.py)
+ITINERARIOS_TRANSBORDO_MINUTOS = 30
+ITINERARIOS_MAX_TRAMOS = 4
+ITINERARIOS_HORIZONTE_HORAS = 48
+
+# Choques de horario (app_autobuses/horarios.py). Acota la búsqueda por
+# índice: ningún viaje puede durar más que esto.
+HORARIOS_DURACION_MAXIMA_HORAS = 72
+
+# Códigos de boleto (app_autobuses/codigos.py). CODIGOS_CLAVE fija la
+# permutación; si no se define se deriva de SECRET_KEY.
+CODIGOS_TAMANO_BLOQUE = 100
+
+# GET condicionales de los listados (app_autobuses/versiones.py). Los sellos
+# de versión viven en la caché default: con varios procesos tiene que ser
+# compartida (file o db). VERSION_DESPLIEGUE entra en el ETag para que un
+# despliegue con plantillas nuevas no reciba 304 de páginas viejas.
+VERSION_DESPLIEGUE = os.environ.get('SISTEMA_VERSION', '')
+
+# Caché de fragmentos de los listados (app_autobuses/fragmentos.py)
+FRAGMENTOS_ACTIVOS = True
+FRAGMENTOS_CACHE_ALIAS = 'fragmentos'
+FRAGMENTOS_TIMEOUT = 3600
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -116,3 +267,13 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = 'static/'
+
+# Archivos subidos (fotos de autobuses y empleados)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Miniaturas de las fotos (app_autobuses/imagenes.py)
+IMAGENES_TAMANO_MINIATURA = 160
+IMAGENES_HILOS = 2
+# Dónde buscar fotos subidas antes de usar MEDIA_ROOT (generar_miniaturas)
+IMAGENES_RUTAS_ANTERIORES = [BASE_DIR]